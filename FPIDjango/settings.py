@@ -51,6 +51,82 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 SCANS_DIR = join(dirname(BASE_DIR), 'scans')
 
+# Backend used by fpiweb.code_reader to decode a scanned QR code:
+#   'pyzbar'  - decode the image in memory (requires pyzbar and libzbar0)
+#   'zbarimg' - write the image to SCANS_DIR and run zbarimg (zbar-tools)
+CODE_READER_BACKEND = 'pyzbar'
+
+# Decode scans in a pool of long-lived worker processes (0 = decode in the
+# request thread).  When every worker is busy and QUEUE_DEPTH scans are
+# waiting, the scanner views answer 503 at once and the scanner retries.
+# The workers are forked from the web process, so only turn this on where
+# the web processes don't run threads (e.g. uWSGI without --threads).
+CODE_READER_POOL_WORKERS = 0
+CODE_READER_POOL_QUEUE_DEPTH = 4
+CODE_READER_POOL_TIMEOUT = 5  # seconds to decode one scan
+
+# Scans are first decoded from a grayscale copy scaled down to fit within
+# CODE_READER_MAX_DIMENSION pixels and, if CODE_READER_CROP_FRACTION is set
+# (e.g. 0.6), cropped to that portion of the center of the frame.  The full
+# size image is only decoded if that fails.
+CODE_READER_PREPROCESS = True
+CODE_READER_MAX_DIMENSION = 800
+CODE_READER_CROP_FRACTION = None
+
+# Remember this many decoded scans (0 = no cache) for CODE_READER_CACHE_TTL
+# seconds so a resubmitted frame is not decoded again.
+CODE_READER_CACHE_SIZE = 256
+CODE_READER_CACHE_TTL = 300
+
+# Largest scan image accepted by the raw (binary) scan upload endpoints.
+SCAN_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+
+# Generate the QR codes for label print runs of at least
+# LABEL_PRINT_PARALLEL_MIN labels in this many worker processes (0 = one
+# at a time in the request).  The pages are laid out in order either way.
+LABEL_PRINT_WORKERS = 4
+LABEL_PRINT_PARALLEL_MIN = 100
+
+# Draw label QR codes as vector shapes rather than placing a PNG for each;
+# much smaller PDFs that are quicker to build and print.
+LABEL_PRINT_VECTOR = True
+
+# Label print runs of at least PRINT_JOB_BACKGROUND_MIN labels are built by
+# PRINT_JOB_WORKERS background thread(s) into PRINT_JOBS_DIR and downloaded
+# from the print job page.  Jobs and their PDFs are deleted after
+# PRINT_JOB_RETENTION_HOURS.  A job is lost if the web process restarts
+# while it waits or runs, so one not finished within
+# PRINT_JOB_TIMEOUT_MINUTES is shown as failed.
+PRINT_JOB_BACKGROUND_MIN = 500
+PRINT_JOB_WORKERS = 1
+PRINT_JOBS_DIR = join(dirname(BASE_DIR), 'print_jobs')
+PRINT_JOB_RETENTION_HOURS = 24
+PRINT_JOB_TIMEOUT_MINUTES = 60
+
+# Label runs smaller than PRINT_JOB_BACKGROUND_MIN are built in the request
+# into a temporary file held in memory up to LABEL_PDF_SPOOL_BYTES bytes and
+# written to disk beyond that, then streamed to the browser.
+LABEL_PDF_SPOOL_BYTES = 1024 * 1024
+
+# Keep the QR artwork of this many labels / template QR codes in memory
+# (0 = no cache) so reprints don't rebuild them.  If QR_ARTWORK_CACHE_DIR
+# is set they are also kept there, shared by all processes, up to
+# QR_ARTWORK_CACHE_DIR_MAX_BYTES.
+QR_ARTWORK_CACHE_SIZE = 2000
+QR_ARTWORK_CACHE_DIR = None
+QR_ARTWORK_CACHE_DIR_MAX_BYTES = 50 * 1024 * 1024
+
+# Keep the parsed Constraints values in memory for this many seconds
+# (0 = read them from the database every time).  Saving or deleting a
+# constraint clears them at once in this process, and in every process if
+# CONSTRAINTS_CACHE_ALIAS names a cache in CACHES that they all share.
+CONSTRAINTS_CACHE_TIMEOUT = 60
+CONSTRAINTS_CACHE_ALIAS = None
+
+# Incremental activity exports hold back activities changed in the last
+# ACTIVITY_EXPORT_SETTLE_SECONDS so none still being saved are skipped.
+ACTIVITY_EXPORT_SETTLE_SECONDS = 60
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.1/howto/deployment/checklist/
@@ -1,7 +1,7 @@
 """Standalone tool to print QR codes.
 
 Usage:
-    QRCodePrinter.py -p=<URL_prefix> -s <nnn> -c <nnn> -o <file>
+    QRCodePrinter.py -p=<URL_prefix> -s <nnn> -c <nnn> -o <file> [--vector]
     QRCodePrinter.py -h | --help
     QRCodePrinter.py --version
 
@@ -11,6 +11,8 @@ Options:
     -s <nnn>, --start=<nnn>                  Starting box number to use
     -c <nnn>, --count=<nnn>                  Number of QR codes to print
     -o <file>, --output=<file>               Output file name
+    --vector                                 Draw the QR codes as vector
+                                             shapes instead of images
     -h, --help                                Show this help and quit.
     -v, --version                             Show the version of this program and quit.
 
@@ -19,6 +21,7 @@ Options:
 import logging
 import logging.config
 from dataclasses import dataclass, astuple, InitVar
+from io import BytesIO
 from logging import getLogger, debug, error
 from pathlib import Path
 from typing import Any, Union, Optional, NamedTuple, List
@@ -36,6 +39,7 @@ from sqlalchemy.sql import select
 import yaml  # from PyYAML library
 
 from FPIDjango.private import settings_private
+from fpiweb.qr_drawing import draw_qr_code
 
 __author__ = 'Travis Risner'
 __project__ = "Food-Pantry-Inventory"
@@ -146,6 +150,7 @@ class QRCodePrinterClass:
         self.box_start: int = 0
         self.label_count: int = 0
         self.output_file: str = ''
+        self.vector: bool = False
         self.full_path: Path = None
         self.pdf: Canvas = None
 
@@ -184,6 +189,7 @@ class QRCodePrinterClass:
         self.box_start: int = int(parm_dict['--start'])
         self.label_count: int = int(parm_dict['--count'])
         self.output_file: str = parm_dict['--output']
+        self.vector: bool = bool(parm_dict.get('--vector'))
         if (not isinstance(self.box_start, int)) or \
                 self.box_start <= 0:
             raise ValueError('Box start must be a positive integer')
@@ -300,8 +306,13 @@ class QRCodePrinterClass:
         # self.draw_boxes_on_page()
         # # self.pdf.setFillColorRGB(1, 0, 1)
         # # self.pdf.rect(2*inch, 2*inch, 2*inch, 2*inch, fill=1)
-        for label_file, label_name in self.get_next_qr_img():
-            debug(f'Got {label_file}')
+        # vector labels are drawn straight from the URL
+        if self.vector:
+            label_art = self.get_next_box_url()
+        else:
+            label_art = self.get_next_qr_img()
+        for label_file, label_name in label_art:
+            debug(f'Got {label_name}')
             if self.next_pos >= len(self.label_locations) - 1:
                 self. finish_page()
                 self.next_pos = 0
@@ -312,20 +323,35 @@ class QRCodePrinterClass:
         self.finish_page()
         return
 
-    def place_label(self, file_name: str, label_name: str, pos: int):
+    def place_label(
+            self,
+            file_name: Union[BytesIO, str],
+            label_name: str,
+            pos: int):
         """
         Place the label in the appropriate location on the page.
 
-        :param file_name:
+        :param file_name: PNG of the QR code (in memory), or the URL to
+            encode when drawing vector QR codes
         :param label_name:
         :param pos:
         :return:
         """
         box_info = self.label_locations[pos]
 
-        # place image on page
-        im = Image(file_name, LABEL_SIZE.x, LABEL_SIZE.y)
-        im.drawOn(self.pdf, box_info.image_start.x, box_info.image_start.y)
+        # place QR code on page
+        if self.vector:
+            draw_qr_code(
+                self.pdf,
+                file_name,
+                box_info.image_start.x,
+                box_info.image_start.y,
+                LABEL_SIZE.x,
+            )
+        else:
+            im = Image(file_name, LABEL_SIZE.x, LABEL_SIZE.y)
+            im.drawOn(
+                self.pdf, box_info.image_start.x, box_info.image_start.y)
 
         # place title above image
         self.pdf.setFont('Helvetica-Bold', 12)
@@ -378,10 +404,13 @@ class QRCodePrinterClass:
         :return: a QR code image ready to print
         """
         for url, label in self.get_next_box_url():
-            label_file_name = f'{label}.png'
+            # build the PNG in memory rather than leaving a BOXnnnnn.png
+            # file in the current directory for every label
+            label_image = BytesIO()
             qr = pyqrcode.create(url)
-            qr.png(label_file_name, scale=5)
-            yield label_file_name, label
+            qr.png(label_image, scale=5)
+            label_image.seek(0)
+            yield label_image, label
         return
 
     def get_next_box_url(self) -> (str, str):
@@ -399,27 +428,43 @@ class QRCodePrinterClass:
         """
         Search for the next box number to go on a label.
 
+        The box numbers already in use from box_start up are read in order
+        by one query and the holes between them are used for the labels.
+
         :return:
         """
         next_box_number = self.box_start
         available_count = 0
+        sel_box_stm = select([self.box.c.box_number]).where(
+            self.box.c.box_number >= f'BOX{self.box_start:05}'
+        ).order_by(self.box.c.box_number)
+        result = self.con.execution_options(stream_results=True).execute(
+            sel_box_stm)
+        try:
+            for row in result:
+                try:
+                    used_box_number = int(row[0][3:])
+                except ValueError:
+                    continue
+                while next_box_number < used_box_number and \
+                        available_count < self.label_count:
+                    # found a hole in the numbers
+                    box_label = f'BOX{next_box_number:05}'
+                    available_count += 1
+                    debug(f'{box_label} not found - using for label')
+                    yield (box_label, next_box_number)
+                    next_box_number += 1
+                if available_count >= self.label_count:
+                    return
+                next_box_number = max(next_box_number, used_box_number + 1)
+        finally:
+            result.close()
+
         while available_count < self.label_count:
             box_label = f'BOX{next_box_number:05}'
-            debug(f'Attempting to get {box_label}')
-            sel_box_stm = select([self.box]).where(
-                self.box.c.box_number == box_label)
-            # box_found = exists(sel_box_stm)
-            # exist_stm = exists().where(self.box.c.box_number == box_label)
-            result = self.con.execute(sel_box_stm)
-            debug(f'Search result: {result.rowcount}')
-            box = result.fetchone()
-            if not box:
-                # found a hole in the numbers
-                available_count += 1
-                debug(f'{box_label} not found - using for label')
-                yield (box_label, next_box_number)
-            else:
-                result.close()
+            available_count += 1
+            debug(f'{box_label} not found - using for label')
+            yield (box_label, next_box_number)
             next_box_number += 1
         return
 
@@ -0,0 +1,233 @@
+"""
+activity_export.py - Export only the activities changed since last time.
+
+Every Activity records when it was added or last changed (date_changed).
+An incremental export returns the activities changed after a watermark,
+ordered by (date_changed, id), along with a continuation token to pass as
+the watermark next time.  The first export can start from a timestamp, or
+from nothing to get every activity.
+
+Activities changed in the last ACTIVITY_EXPORT_SETTLE_SECONDS are held
+back for the next export.  Otherwise a change made in a transaction that
+had not yet committed could be given an earlier date_changed than the
+watermark and never be exported.
+
+The export can also be gzip compressed on the fly (gzip_chunks) or written
+as Parquet (write_parquet) when the optional pyarrow package is installed.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+from zlib import DEFLATED, MAX_WBITS, compressobj
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from fpiweb.models import Activity
+
+__author__ = '(Multiple)'
+__project__ = "Food-Pantry-Inventory"
+__creation_date__ = "10/18/2026"
+
+
+class ActivityExportError(RuntimeError):
+    pass
+
+
+class Watermark(NamedTuple):
+    """
+    Where an incremental export starts: after the activity with this
+    date_changed and id.
+    """
+    date_changed: datetime
+    activity_id: int
+
+    def to_token(self) -> str:
+        """
+        :return: the watermark as an opaque continuation token
+        """
+        text = f'{self.date_changed.isoformat()}|{self.activity_id}'
+        return urlsafe_b64encode(text.encode()).decode()
+
+    @staticmethod
+    def from_token(token: str) -> 'Watermark':
+        """
+        Read a continuation token, or a timestamp to start from.
+
+        :param token: token from to_token or an ISO 8601 timestamp
+        :return: the watermark
+        """
+        try:
+            date_changed = parse_datetime(token)
+        except ValueError:
+            date_changed = None
+        if date_changed is not None:
+            if timezone.is_naive(date_changed):
+                date_changed = timezone.make_aware(date_changed)
+            return Watermark(date_changed, 0)
+
+        try:
+            text = urlsafe_b64decode(token.encode()).decode()
+            date_text, id_text = text.split('|')
+            date_changed = parse_datetime(date_text)
+            activity_id = int(id_text)
+        except (Base64Error, UnicodeDecodeError, ValueError):
+            date_changed = None
+        if date_changed is None:
+            raise ActivityExportError(
+                f'"{token}" is not a continuation token or timestamp')
+        return Watermark(date_changed, activity_id)
+
+
+def get_settle_cutoff() -> datetime:
+    """
+    :return: activities changed at or after this are held back
+    """
+    settle_seconds = getattr(settings, 'ACTIVITY_EXPORT_SETTLE_SECONDS', 60)
+    return timezone.now() - timedelta(seconds=settle_seconds)
+
+
+def get_changed_activities(since: Optional[Watermark],
+                           until: datetime) -> QuerySet:
+    """
+    Get the activities changed after a watermark.
+
+    :param since: the watermark or None for every activity
+    :param until: cutoff from get_settle_cutoff
+    :return: activities in (date_changed, id) order
+    """
+    activities = Activity.objects.filter(date_changed__lt=until)
+    if since is not None:
+        activities = activities.filter(
+            Q(date_changed__gt=since.date_changed) |
+            Q(
+                date_changed=since.date_changed,
+                id__gt=since.activity_id,
+            )
+        )
+    return activities.order_by('date_changed', 'id')
+
+
+def gzip_chunks(chunks: Iterable[str], level: int = 6) -> Iterator[bytes]:
+    """
+    Gzip compress text as it is produced.
+
+    :param chunks: pieces of text
+    :param level: compression level, 1 (fastest) to 9 (smallest)
+    :return: pieces of a gzip file
+    """
+    # adding 16 to the window bits gives a gzip header and trailer
+    compressor = compressobj(level, DEFLATED, MAX_WBITS + 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def parquet_available() -> bool:
+    """
+    :return: True if the (optional) pyarrow package is installed
+    """
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return False
+    return True
+
+
+class _ChunkSink:
+    """
+    Write-only file that hands back what was written since it was last
+    asked, so a Parquet file can be sent while it is being written.
+    """
+
+    def __init__(self):
+        self.chunks = list()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = list()
+        return data
+
+
+def write_parquet(fields: List[str], rows: Iterable[tuple],
+                  row_group_size: int = 65536) -> Iterator[bytes]:
+    """
+    Write activity values as a Parquet file, one row group at a time.
+
+    Needs the optional pyarrow package (see parquet_available).
+
+    :param fields: names of the Activity fields in each row
+    :param rows: tuples of field values, e.g. from values_list().iterator()
+    :param row_group_size: rows per Parquet row group
+    :return: pieces of the Parquet file
+    """
+    # imported here so that a missing package only matters if Parquet has
+    # been asked for
+    import pyarrow
+    import pyarrow.parquet
+
+    arrow_types = {
+        'AutoField': pyarrow.int64(),
+        'CharField': pyarrow.string(),
+        'DateField': pyarrow.date32(),
+        'DateTimeField': pyarrow.timestamp('us', tz='UTC'),
+        'IntegerField': pyarrow.int32(),
+    }
+    schema = pyarrow.schema([
+        (field, arrow_types[
+            Activity._meta.get_field(field).get_internal_type()])
+        for field in fields
+    ])
+
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(
+        pyarrow.PythonFile(sink, mode='w'),
+        schema,
+        compression='snappy',
+    )
+
+    def write_row_group(row_group):
+        columns = list(zip(*row_group))
+        writer.write_table(pyarrow.Table.from_arrays(
+            [
+                pyarrow.array(column, type=schema.field(position).type)
+                for position, column in enumerate(columns)
+            ],
+            schema=schema,
+        ))
+
+    row_group = list()
+    for row in rows:
+        row_group.append(row)
+        if len(row_group) >= row_group_size:
+            write_row_group(row_group)
+            row_group = list()
+            yield sink.take()
+    if row_group:
+        write_row_group(row_group)
+    writer.close()
+    yield sink.take()
+
+# EOF
@@ -21,6 +21,7 @@ from .models import \
     Pallet, \
     PalletBox, \
     Profile
+from .support.OnHandSummary import OnHandSummaryClass
 
 __author__ = '(Multiple)'
 __project__ = "Food-Pantry-Inventory"
@@ -58,6 +59,19 @@ class BoxAdmin(admin.ModelAdmin):
     )
     list_filter = ('box_type', )
 
+    # boxes are saved and deleted through the on hand summary so it stays
+    # in step with them
+
+    def save_model(self, request, obj, form, change):
+        OnHandSummaryClass().save_box(obj)
+
+    def delete_model(self, request, obj):
+        OnHandSummaryClass().delete_boxes([obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        OnHandSummaryClass().delete_boxes(
+            queryset.values_list('pk', flat=True))
+
 
 @admin.register(BoxType)
 class BoxTypeAdmin(admin.ModelAdmin):
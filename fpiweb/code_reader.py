@@ -1,15 +1,55 @@
+"""
+code_reader.py - Decode the QR code in a scanned image.
 
+The decoding itself is done by a backend selected with the
+CODE_READER_BACKEND setting:
+
+    pyzbar  - decode the image bytes in memory with the zbar library (default)
+
+    zbarimg - write the image to SCANS_DIR and run the zbarimg program on it
+
+If the pyzbar package is not installed, the zbarimg backend is used
+instead.
+
+Before decoding, a scan is reduced to a grayscale copy no larger than
+CODE_READER_MAX_DIMENSION pixels (optionally cropped to the center
+CODE_READER_CROP_FRACTION of the frame).  Only if that copy cannot be
+decoded is the full size image tried.  The log records which attempt
+succeeded and how long it took.
+
+When CODE_READER_POOL_WORKERS is greater than zero, scans are decoded by a
+bounded pool of long-lived worker processes instead of in the request
+thread.  If every worker is busy and CODE_READER_POOL_QUEUE_DEPTH scans are
+already waiting, CodeReaderBusyError is raised at once so the view can ask
+the scanner to retry.
+
+Successfully decoded scans are remembered (by a SHA-256 digest of the image
+bytes) in a small LRU cache for CODE_READER_CACHE_TTL seconds, so a frame
+that is submitted again is answered without decoding it a second time.
+"""
+from abc import ABC, abstractmethod
 from base64 import b64decode
 from binascii import Error as BinasciiError
+from collections import OrderedDict
+from concurrent.futures import \
+    ProcessPoolExecutor, \
+    TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from hashlib import sha256
+from io import BytesIO
 from logging import getLogger
+from multiprocessing import get_context
 from os import remove
 from pathlib import Path
 from random import seed, randint
-from subprocess import run
-from time import time
+from subprocess import run, TimeoutExpired
+from threading import BoundedSemaphore, Lock
+from time import monotonic, perf_counter, time
+from typing import Callable, Optional
 
 from django.conf import settings
+from PIL import Image
 
 from fpiweb.models import BoxNumber
 
@@ -20,11 +60,21 @@ seed(time())
 
 scan_data_prefix = 'data:image/png;base64,'
 
+DEFAULT_BACKEND = 'pyzbar'
+FALLBACK_BACKEND = 'zbarimg'
+
 
 class CodeReaderError(RuntimeError):
     pass
 
 
+class CodeReaderBusyError(CodeReaderError):
+    """
+    Every decoder worker is busy and the queue is full - try again shortly.
+    """
+    pass
+
+
 def get_scan_file_path():
     scans_dir_path = Path(settings.SCANS_DIR)
     if not scans_dir_path.exists():
@@ -49,69 +99,593 @@ def delete_file(image_file_path):
     remove(str(image_file_path))
 
 
-def read(scan_data):
+class DecoderBackend(ABC):
+    """
+    Base class for the objects that turn image bytes into QR code text.
+    """
+
+    name: str = ''
+
+    def decode(self, image_bytes: bytes) -> str:
+        """
+        Decode the QR code(s) found in an image.
+
+        :param image_bytes: contents of an image file (e.g. a PNG)
+        :return: the text of the QR code(s) found, one per line
+        """
+        return self.decode_image(open_image(image_bytes))
+
+    @abstractmethod
+    def decode_image(self, image: Image.Image) -> str:
+        """
+        Decode the QR code(s) found in an image already loaded by Pillow.
+
+        :param image: a Pillow image
+        :return: the text of the QR code(s) found, one per line
+        """
+
+
+def open_image(image_bytes: bytes) -> Image.Image:
+    """
+    Load image bytes with Pillow.
+
+    :param image_bytes: contents of an image file
+    :return: the loaded image
+    """
+    try:
+        image = Image.open(BytesIO(image_bytes))
+        image.load()
+    except (OSError, ValueError) as error:
+        error_message = f"Unable to read scanned image: {error}"
+        logger.error(error_message)
+        raise CodeReaderError(error_message)
+    return image
+
+
+class ZbarimgBackend(DecoderBackend):
+    """
+    Decode by running the zbarimg program (from zbar-tools) on a temporary
+    copy of the image in SCANS_DIR.
+    """
+
+    name = 'zbarimg'
+    program_name = 'zbarimg'
+    timeout = 5  # seconds
+
+    def decode(self, image_bytes: bytes) -> str:
+        try:
+            image_file_path = get_scan_file_path()
+        except OSError as e:
+            raise CodeReaderError(str(e))
+
+        logger.info(f"writing file to {image_file_path}")
+        with image_file_path.open('wb') as image_file:
+            image_file.write(image_bytes)
+
+        try:
+            completed_process = run(
+                [self.program_name, str(image_file_path)],
+                capture_output=True,
+                timeout=self.timeout,
+            )
+        except FileNotFoundError as error:
+            error_message = str(error)
+            logger.error(error_message)
+            if self.program_name in error_message:
+                logger.error(
+                    error_message +
+                    ".  Is the zbar-tools package installed.  "
+                    "Use sudo apt-get install zbar-tools to install it.")
+            delete_file(image_file_path)
+            raise CodeReaderError(error_message)
+        except (RuntimeError, TimeoutExpired) as error:
+            error_message = "{}.  error is a {}".format(
+                str(error),
+                type(error),
+            )
+            logger.error(error_message)
+            delete_file(image_file_path)
+            raise CodeReaderError(error_message)
+
+        delete_file(image_file_path)
+
+        if completed_process.returncode != 0:
+            error_message = completed_process.stderr.decode()
+            logger.error(error_message)
+            raise CodeReaderError(error_message)
+
+        return completed_process.stdout.decode()
+
+    def decode_image(self, image: Image.Image) -> str:
+        with BytesIO() as png_out:
+            image.save(png_out, format='PNG')
+            return self.decode(png_out.getvalue())
+
+
+class PyzbarBackend(DecoderBackend):
+    """
+    Decode the image in memory with the zbar library - no temporary file
+    and no subprocess.
+    """
+
+    name = 'pyzbar'
+
+    def __init__(self):
+        # imported here so that a missing package only matters if this
+        # backend has been selected
+        from pyzbar.pyzbar import decode as zbar_decode
+
+        self.zbar_decode = zbar_decode
+
+    def decode_image(self, image: Image.Image) -> str:
+        try:
+            symbols = self.zbar_decode(image)
+        except (OSError, ValueError) as error:
+            error_message = f"Unable to decode image: {error}"
+            logger.error(error_message)
+            raise CodeReaderError(error_message)
+
+        if not symbols:
+            error_message = "No QR code found in scanned image"
+            logger.error(error_message)
+            raise CodeReaderError(error_message)
+
+        lines = [
+            f"{symbol.type}:{symbol.data.decode('utf-8', 'replace')}"
+            for symbol in symbols
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+DECODER_BACKENDS = {
+    PyzbarBackend.name: PyzbarBackend,
+    ZbarimgBackend.name: ZbarimgBackend,
+}
+
+_decoder: Optional[DecoderBackend] = None
+
+
+def get_decoder(backend_name: str = None) -> DecoderBackend:
+    """
+    Get the decoder backend named in settings (or by the caller).
+
+    The backend selected in settings is created once and reused for every
+    scan.
+
+    :param backend_name: name of a backend in DECODER_BACKENDS, defaults
+        to settings.CODE_READER_BACKEND
+    :return: a DecoderBackend instance
+    """
+    global _decoder
+
+    use_setting = backend_name is None
+    if use_setting and _decoder is not None:
+        return _decoder
+
+    if use_setting:
+        backend_name = getattr(
+            settings,
+            'CODE_READER_BACKEND',
+            DEFAULT_BACKEND,
+        )
+
+    backend_class = DECODER_BACKENDS.get(backend_name)
+    if backend_class is None:
+        raise CodeReaderError(f"Unknown code reader backend {backend_name}")
+
+    try:
+        decoder = backend_class()
+    except ImportError as error:
+        logger.warning(
+            f"Code reader backend {backend_name} unavailable ({error}), "
+            f"using {FALLBACK_BACKEND}"
+        )
+        decoder = DECODER_BACKENDS[FALLBACK_BACKEND]()
+
+    if use_setting:
+        _decoder = decoder
+    return decoder
+
+
+class ScanPreprocessor:
+    """
+    Shrink a scanned image before it is decoded.
+
+    Phone cameras send full resolution frames and decoding time grows with
+    the number of pixels, so the first decode attempt uses a grayscale copy
+    that has optionally been cropped to the center of the frame and then
+    scaled down to fit within max_dimension pixels.
+    """
+
+    def __init__(
+            self,
+            enabled: bool = True,
+            max_dimension: Optional[int] = 800,
+            crop_fraction: Optional[float] = None):
+        """
+        :param enabled: False to decode only the full size image
+        :param max_dimension: longest side (in pixels) of the reduced image,
+            None or 0 to keep the original size
+        :param crop_fraction: portion (0 - 1) of the width and height to keep
+            around the center of the frame, None or 1 to keep everything
+        """
+        self.enabled = enabled
+        self.max_dimension = max_dimension
+        self.crop_fraction = crop_fraction
+
+    @staticmethod
+    def from_settings() -> 'ScanPreprocessor':
+        return ScanPreprocessor(
+            enabled=getattr(settings, 'CODE_READER_PREPROCESS', True),
+            max_dimension=getattr(settings, 'CODE_READER_MAX_DIMENSION', 800),
+            crop_fraction=getattr(settings, 'CODE_READER_CROP_FRACTION', None),
+        )
+
+    def prepare(self, image: Image.Image) -> Image.Image:
+        """
+        Crop, convert to grayscale and downscale an image.
+
+        :param image: the full size scan
+        :return: a new, reduced image (the original is left unchanged)
+        """
+        if self.crop_fraction and 0 < self.crop_fraction < 1:
+            width, height = image.size
+            crop_width = int(width * self.crop_fraction)
+            crop_height = int(height * self.crop_fraction)
+            left = (width - crop_width) // 2
+            top = (height - crop_height) // 2
+            image = image.crop(
+                (left, top, left + crop_width, top + crop_height))
+
+        # convert always returns a copy, so thumbnail can work in place
+        image = image.convert('L')
+
+        if self.max_dimension and max(image.size) > self.max_dimension:
+            image.thumbnail((self.max_dimension, self.max_dimension))
+        return image
+
+
+def decode_image_bytes(
+        decoder: DecoderBackend,
+        image_bytes: bytes,
+        preprocessor: ScanPreprocessor = None,
+        full_size: bool = False) -> str:
+    """
+    Decode a scan, trying the reduced image first and the full size image
+    only if that fails.
+
+    :param decoder: backend to do the decoding
+    :param image_bytes: contents of an image file
+    :param preprocessor: defaults to one described by settings
+    :param full_size: True to decode only the full size image, e.g. for a
+        photo of many labels, where the reduced image can lose some of the
+        small codes without failing outright
+    :return: text of the QR code(s) found
+    """
+    if preprocessor is None:
+        preprocessor = ScanPreprocessor.from_settings()
+
+    if preprocessor.enabled and not full_size:
+        start = perf_counter()
+        try:
+            image = open_image(image_bytes)
+            prepared_image = preprocessor.prepare(image)
+            qr_data = decoder.decode_image(prepared_image)
+        except CodeReaderError as error:
+            logger.info(
+                f"Preprocessed decode failed after "
+                f"{(perf_counter() - start) * 1000:.1f} ms ({error}), "
+                f"retrying at full size"
+            )
+        else:
+            logger.info(
+                f"Decoded by {decoder.name} on preprocessed attempt "
+                f"({image.size[0]}x{image.size[1]} -> "
+                f"{prepared_image.size[0]}x{prepared_image.size[1]}) in "
+                f"{(perf_counter() - start) * 1000:.1f} ms"
+            )
+            return qr_data
+
+    start = perf_counter()
+    qr_data = decoder.decode(image_bytes)
+    logger.info(
+        f"Decoded by {decoder.name} on full size attempt in "
+        f"{(perf_counter() - start) * 1000:.1f} ms"
+    )
+    return qr_data
 
-    if not scan_data.startswith(scan_data_prefix):
+
+def _decode_in_worker(image_bytes: bytes, full_size: bool = False) -> str:
+    """
+    Run in a DecodePool worker process to decode one scan.
+    """
+    return decode_image_bytes(get_decoder(), image_bytes, full_size=full_size)
+
+
+class DecodePool:
+    """
+    Bounded pool of long-lived worker processes that decode scans.
+
+    At most workers + queue_depth scans may be in the pool at once.  Any
+    more are turned away with CodeReaderBusyError rather than being left to
+    hold a web worker while they wait.
+    """
+
+    def __init__(self, workers: int, queue_depth: int, timeout: float):
+        """
+        :param workers: number of decoder processes
+        :param queue_depth: number of scans allowed to wait for a process
+        :param timeout: seconds to wait for one scan to be decoded
+        """
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.slots = BoundedSemaphore(workers + queue_depth)
+        self.lock = Lock()
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        Start the worker processes the first time they are needed.
+
+        The workers are forked from the web process (after any forking done
+        by uWSGI) so they inherit its Django settings.
+
+        :return: the running executor
+        """
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=get_context('fork'),
+                )
+            return self.executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor,
+                          terminate: bool = False):
+        """
+        Throw away an executor so the next scan starts a new one.
+
+        :param executor: the executor that failed
+        :param terminate: also kill its worker processes - a scan that is
+            already running can't be cancelled any other way
+        """
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        # the executor forgets its processes once it is shut down
+        processes = list((executor._processes or {}).values()) \
+            if terminate else []
+        for process in processes:
+            process.terminate()
+        executor.shutdown(wait=False)
+
+    def decode(self, image_bytes: bytes, full_size: bool = False) -> str:
+        """
+        Decode a scan in one of the worker processes.
+
+        :param image_bytes: contents of an image file
+        :param full_size: see decode_image_bytes
+        :return: text of the QR code(s) found
+        """
+        if not self.slots.acquire(blocking=False):
+            error_message = 'Scanner is busy, please try again'
+            logger.warning(error_message)
+            raise CodeReaderBusyError(error_message)
+
+        # the slot is given back when this scan has its answer, or when the
+        # worker still decoding it has been killed
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(
+                    _decode_in_worker, image_bytes, full_size)
+            except (BrokenProcessPool, RuntimeError) as error:
+                self._discard_executor(executor)
+                logger.error(
+                    f"Unable to submit scan to decoder pool: {error}")
+                raise CodeReaderError(str(error))
+
+            try:
+                return future.result(timeout=self.timeout)
+            except FuturesTimeoutError:
+                # cancel() can't stop a scan a worker has started, so stop
+                # the workers (any other scans in the pool fail with it)
+                if not future.cancel():
+                    self._discard_executor(executor, terminate=True)
+                error_message = (
+                    f"Decoding took longer than {self.timeout} seconds"
+                )
+                logger.error(error_message)
+                raise CodeReaderError(error_message)
+            except BrokenProcessPool as error:
+                self._discard_executor(executor)
+                logger.error(f"Decoder pool failed: {error}")
+                raise CodeReaderError(str(error))
+        finally:
+            self.slots.release()
+
+
+_decode_pool: Optional[DecodePool] = None
+_decode_pool_lock = Lock()
+
+
+def get_decode_pool() -> Optional[DecodePool]:
+    """
+    Get the decoder pool described in settings.
+
+    :return: the DecodePool, or None if CODE_READER_POOL_WORKERS is zero
+    """
+    global _decode_pool
+
+    workers = getattr(settings, 'CODE_READER_POOL_WORKERS', 0)
+    if not workers:
+        return None
+
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            _decode_pool = DecodePool(
+                workers=workers,
+                queue_depth=getattr(
+                    settings, 'CODE_READER_POOL_QUEUE_DEPTH', workers),
+                timeout=getattr(settings, 'CODE_READER_POOL_TIMEOUT', 5),
+            )
+        return _decode_pool
+
+
+class DecodeCache:
+    """
+    Bounded LRU cache, with a time to live, of decoded scans keyed by the
+    digest of the image bytes.
+
+    Each web process has its own cache.  hits and misses count lookups
+    since the cache was created.
+    """
+
+    def __init__(
+            self,
+            max_entries: int,
+            ttl: float,
+            clock: Callable[[], float] = monotonic):
+        """
+        :param max_entries: number of decoded scans to remember
+        :param ttl: seconds a decoded scan is remembered
+        :param clock: source of the current time in seconds
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_digest(image_bytes: bytes) -> str:
+        return sha256(image_bytes).hexdigest()
+
+    def get(self, digest: str) -> Optional[str]:
+        """
+        Look up a previously decoded scan.
+
+        :param digest: digest of the image bytes
+        :return: the decoded text or None if not (or no longer) cached
+        """
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is not None:
+                expires, qr_data = entry
+                if expires > self.clock():
+                    self.entries.move_to_end(digest)
+                    self.hits += 1
+                    return qr_data
+                del self.entries[digest]
+            self.misses += 1
+            return None
+
+    def put(self, digest: str, qr_data: str):
+        """
+        Remember a decoded scan, forgetting the least recently used one if
+        the cache is full.
+
+        :param digest: digest of the image bytes
+        :param qr_data: text decoded from the image
+        """
+        with self.lock:
+            self.entries[digest] = (self.clock() + self.ttl, qr_data)
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+_decode_cache: Optional[DecodeCache] = None
+
+
+def get_decode_cache() -> Optional[DecodeCache]:
+    """
+    Get the decode cache described in settings.
+
+    :return: the DecodeCache, or None if CODE_READER_CACHE_SIZE is zero
+    """
+    global _decode_cache
+
+    max_entries = getattr(settings, 'CODE_READER_CACHE_SIZE', 0)
+    if not max_entries:
+        return None
+
+    if _decode_cache is None:
+        _decode_cache = DecodeCache(
+            max_entries=max_entries,
+            ttl=getattr(settings, 'CODE_READER_CACHE_TTL', 300),
+        )
+    return _decode_cache
+
+
+def decode_scan_data(scan_data) -> bytes:
+    """
+    Convert a data:image/png;base64 URI from the browser to image bytes.
+
+    :param scan_data: the data URI posted by scanner.js
+    :return: contents of the PNG
+    """
+    if not scan_data or not scan_data.startswith(scan_data_prefix):
         raise CodeReaderError('Invalid scan data')
 
     logger.info("scan_data is {:,} characters in length".format(
         len(scan_data)))
 
     try:
-        scan_data_bytes = b64decode(
-            scan_data[len(scan_data_prefix):]
-        )
+        return b64decode(scan_data[len(scan_data_prefix):])
     except BinasciiError as e:
         raise CodeReaderError(str(e))
 
-    try:
-        image_file_path = get_scan_file_path()
-    except OSError as e:
-        raise CodeReaderError(str(e))
 
-    logger.info(f"writing file to {image_file_path}")
-    with image_file_path.open('wb') as image_file:
-        image_file.write(scan_data_bytes)
+def read_image(image_bytes: bytes, full_size: bool = False) -> str:
+    """
+    Decode the QR code(s) in an image with the configured backend.
 
-    program_name = 'zbarimg'
-    try:
-        completed_process = run(
-            [program_name, str(image_file_path)],
-            capture_output=True,
-            timeout=5,  # 5 seconds to run
-        )
-    except FileNotFoundError as error:
-        error_message = str(error)
-        logger.error(error_message)
-        if program_name in error_message:
-            logger.error(
-                error_message +
-                ".  Is the zbar-tools package installed.  "
-                "Use sudo apt-get install zbar-tools to install it.")
-        raise CodeReaderError(error_message)
-    except RuntimeError as error:
-        error_message = "{}.  error is a {}".format(
-            str(error),
-            type(error),
-        )
-        logger.error(error_message)
-        raise CodeReaderError(error_message)
+    :param image_bytes: contents of an image file
+    :param full_size: see decode_image_bytes
+    :return: text of the QR code(s) found
+    """
+    cache = get_decode_cache()
+    if cache is not None:
+        digest = cache.get_digest(image_bytes)
+        if full_size:
+            # a decode of the reduced image may have found fewer codes, so
+            # the two are cached apart
+            digest = f'{digest}:full'
+        qr_data = cache.get(digest)
+        if qr_data is not None:
+            logger.info(
+                f"Scan {digest[:12]} found in decode cache "
+                f"(hits: {cache.hits}, misses: {cache.misses})"
+            )
+            return qr_data
 
-    if completed_process.returncode != 0:
-        error_message = completed_process.stderr.decode()
-        logger.error(error_message)
-        delete_file(image_file_path)
-        raise CodeReaderError(error_message)
+    pool = get_decode_pool()
+    if pool is not None:
+        qr_data = pool.decode(image_bytes, full_size)
+    else:
+        qr_data = decode_image_bytes(
+            get_decoder(), image_bytes, full_size=full_size)
 
-    delete_file(image_file_path)
-    qr_data = completed_process.stdout.decode()
+    if cache is not None:
+        cache.put(digest, qr_data)
     return qr_data
 
 
-def read_box_number(scan_data):
+def read(scan_data):
+    return read_image(decode_scan_data(scan_data))
+
 
-    qr_data = read(scan_data)
+def get_box_number(qr_data: str) -> str:
+    """
+    Find the box number in the text of a QR code.
 
+    :param qr_data: text decoded from a QR code
+    :return: box number of the form BOXnnnnn
+    """
     match = BoxNumber.box_number_search_regex.search(qr_data)
     if not match:
         error_message = f"box number not found in {qr_data}"
@@ -121,3 +695,57 @@ def read_box_number(scan_data):
     box_number = match.group().upper()
     logger.info(f"scanned box_number is {box_number}")
     return box_number
+
+
+def get_box_numbers(qr_data: str) -> list:
+    """
+    Find every box number in the text of the QR codes of one image.
+
+    :param qr_data: text decoded from one or more QR codes
+    :return: box numbers of the form BOXnnnnn in the order found, without
+        duplicates
+    """
+    box_numbers = []
+    for match in BoxNumber.box_number_search_regex.finditer(qr_data):
+        box_number = match.group().upper()
+        if box_number not in box_numbers:
+            box_numbers.append(box_number)
+
+    if not box_numbers:
+        error_message = f"no box numbers found in {qr_data}"
+        logger.error(error_message)
+        raise CodeReaderError(error_message)
+
+    logger.info(f"scanned {len(box_numbers)} box numbers")
+    return box_numbers
+
+
+def read_box_number(scan_data):
+    return get_box_number(read(scan_data))
+
+
+def read_box_number_from_image(image_bytes: bytes) -> str:
+    """
+    Find the box number in the QR code of an uploaded image.
+
+    :param image_bytes: contents of an image file
+    :return: box number of the form BOXnnnnn
+    """
+    logger.info("scan image is {:,} bytes in length".format(
+        len(image_bytes)))
+    return get_box_number(read_image(image_bytes))
+
+
+def read_box_numbers_from_image(image_bytes: bytes) -> list:
+    """
+    Find the box numbers in all the QR codes of an uploaded image, e.g. a
+    photo of every label on a pallet.
+
+    :param image_bytes: contents of an image file
+    :return: box numbers of the form BOXnnnnn
+    """
+    logger.info("scan image is {:,} bytes in length".format(
+        len(image_bytes)))
+    # decoded at full size, as the reduced image can lose some of the small
+    # labels in a photo of a whole pallet
+    return get_box_numbers(read_image(image_bytes, full_size=True))
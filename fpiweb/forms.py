@@ -764,10 +764,15 @@ class BoxItemForm(forms.Form):
 
 class PrintLabelsForm(forms.Form):
 
-    starting_number = forms.IntegerField()
+    starting_number = forms.IntegerField(
+        required=False,
+        min_value=1,
+        help_text='Leave blank to print the next unused box numbers.',
+    )
 
     number_to_print = forms.IntegerField(
         initial=10,
+        min_value=1,
     )
 
 
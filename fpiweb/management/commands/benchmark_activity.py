@@ -0,0 +1,180 @@
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from fpiweb.models import \
+    Activity, \
+    Box, \
+    BoxNumber, \
+    Location, \
+    Product
+from fpiweb.support.BoxManagement import BoxManagementClass
+
+# Custom django-admin / manage.py command as per
+# https://docs.djangoproject.com/en/2.2/howto/custom-management-commands/
+
+
+class Command(BaseCommand):
+
+    help = """Time box fill, move and empty against a large activity
+    history, with the Activity indexes and (where the database can roll
+    back schema changes) without them.  The history, boxes and any index
+    changes are rolled back afterwards."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-a', '--activities',
+            type=int,
+            default=200000,
+            help="Number of (consumed) activity records of history to seed",
+        )
+        parser.add_argument(
+            '-b', '--boxes',
+            type=int,
+            default=100,
+            help="Number of boxes to fill, move and empty",
+        )
+        parser.add_argument(
+            '-s', '--start',
+            type=int,
+            default=90000,
+            help="First box number used for the test",
+        )
+        parser.add_argument(
+            '--history-boxes',
+            type=int,
+            default=5000,
+            help="Number of box numbers the history is spread over",
+        )
+
+    @staticmethod
+    def seed_history(start, history_boxes, activities, location, product,
+                     box_type):
+        today = now().date()
+        Activity.objects.bulk_create(
+            (
+                Activity(
+                    box_number=BoxNumber.format_box_number(
+                        start + (ndx % history_boxes)),
+                    box_type=box_type.box_type_code,
+                    loc_row=location.loc_row.loc_row,
+                    loc_bin=location.loc_bin.loc_bin,
+                    loc_tier=location.loc_tier.loc_tier,
+                    prod_name=product.prod_name,
+                    prod_cat_name=product.prod_cat.prod_cat_name,
+                    date_filled=today - timedelta(days=ndx % 3650 + 30),
+                    date_consumed=today - timedelta(days=ndx % 3650),
+                    duration=30,
+                    exp_year=today.year,
+                    exp_month_start=0,
+                    exp_month_end=0,
+                    quantity=box_type.box_type_qty,
+                )
+                for ndx in range(activities)
+            ),
+            batch_size=5000,
+        )
+
+    @staticmethod
+    def time_boxes(boxes, fill_location, move_location, product):
+        """ fill, move and empty every box, one box at a time """
+        box_mgmt = BoxManagementClass()
+        timings = dict()
+
+        begin = perf_counter()
+        for box in boxes:
+            box_mgmt.box_fill(
+                box=box,
+                location=fill_location,
+                product=product,
+                exp_year=now().year,
+            )
+        timings['fill'] = perf_counter() - begin
+
+        begin = perf_counter()
+        for box in boxes:
+            box_mgmt.box_move(box=box, location=move_location)
+        timings['move'] = perf_counter() - begin
+
+        begin = perf_counter()
+        for box in boxes:
+            box_mgmt.box_consume(box=box.pk)
+        timings['empty'] = perf_counter() - begin
+        return timings
+
+    def report(self, title, timings, box_count):
+        self.stdout.write(
+            f"{title}: " + ', '.join(
+                f"{action} {seconds * 1000 / box_count:.2f} ms/box"
+                for action, seconds in timings.items()
+            )
+        )
+
+    def handle(self, *args, **options):
+        start = options['start']
+        box_count = options['boxes']
+        history_boxes = max(options['history_boxes'], box_count)
+
+        locations = list(Location.objects.select_related(
+            'loc_row',
+            'loc_bin',
+            'loc_tier',
+        )[:2])
+        product = Product.objects.select_related('prod_cat').first()
+        if len(locations) < 2 or product is None:
+            raise CommandError("Need at least two locations and a product")
+        fill_location, move_location = locations
+
+        with transaction.atomic():
+            box_type = Box.box_type_default()
+            self.seed_history(
+                start,
+                history_boxes,
+                options['activities'],
+                fill_location,
+                product,
+                box_type,
+            )
+            Box.objects.bulk_create([
+                Box(
+                    box_number=BoxNumber.format_box_number(box_number),
+                    box_type=box_type,
+                )
+                for box_number in range(start, start + box_count)
+            ])
+            boxes = list(Box.objects.select_related('box_type').filter(
+                box_number__in=[
+                    BoxNumber.format_box_number(box_number)
+                    for box_number in range(start, start + box_count)
+                ]
+            ))
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'ANALYZE {Activity._meta.db_table}')
+            self.stdout.write(
+                f"{Activity.objects.count():,} activity records, "
+                f"{box_count} boxes"
+            )
+
+            with transaction.atomic():
+                timings = self.time_boxes(
+                    boxes, fill_location, move_location, product)
+                transaction.set_rollback(True)
+            self.report("with indexes", timings, box_count)
+
+            if connection.features.can_rollback_ddl:
+                with connection.schema_editor() as schema_editor:
+                    for index in Activity._meta.indexes:
+                        schema_editor.remove_index(Activity, index)
+                boxes = list(Box.objects.select_related('box_type').filter(
+                    pk__in=[box.pk for box in boxes]
+                ))
+                timings = self.time_boxes(
+                    boxes, fill_location, move_location, product)
+                self.report("without indexes", timings, box_count)
+
+            transaction.set_rollback(True)
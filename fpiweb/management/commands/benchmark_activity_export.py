@@ -0,0 +1,101 @@
+from datetime import date, timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from fpiweb.activity_export import parquet_available
+from fpiweb.models import Activity, BoxNumber
+from fpiweb.views import ActivityDownloadView
+
+# Custom django-admin / manage.py command as per
+# https://docs.djangoproject.com/en/2.2/howto/custom-management-commands/
+
+
+class Command(BaseCommand):
+
+    help = """Compare the size and time of each activity export format on a
+    generated activity history.  The history is rolled back afterwards."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-r', '--rows',
+            type=int,
+            default=1000000,
+            help="Number of activity records to generate",
+        )
+        parser.add_argument(
+            'formats',
+            metavar='FORMAT',
+            nargs='*',
+            default=list(ActivityDownloadView.formats),
+            help="Formats to time (default: all of them)",
+        )
+
+    @staticmethod
+    def seed_history(rows):
+        first_day = date(2015, 1, 1)
+        products = (
+            ('Corn', 'Canned Vegetables'),
+            ('Green Beans', 'Canned Vegetables'),
+            ('Peaches', 'Canned Fruit'),
+            ('Rice', 'Grains'),
+        )
+        Activity.objects.bulk_create(
+            (
+                Activity(
+                    box_number=BoxNumber.format_box_number(ndx % 20000 + 1),
+                    box_type='Evans',
+                    loc_row=f'{ndx % 4 + 1:02}',
+                    loc_bin=f'{ndx % 9 + 1:02}',
+                    loc_tier=('A1', 'A2', 'B1', 'B2', 'C1', 'C2')[ndx % 6],
+                    prod_name=products[ndx % len(products)][0],
+                    prod_cat_name=products[ndx % len(products)][1],
+                    date_filled=first_day + timedelta(days=ndx % 2000),
+                    date_consumed=(
+                        first_day + timedelta(days=ndx % 2000 + 30)
+                        if ndx % 10 else None
+                    ),
+                    duration=30 if ndx % 10 else 0,
+                    exp_year=2016 + ndx % 8,
+                    exp_month_start=0,
+                    exp_month_end=0,
+                    quantity=12,
+                )
+                for ndx in range(rows)
+            ),
+            batch_size=10000,
+        )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        view = ActivityDownloadView()
+
+        with transaction.atomic():
+            self.stdout.write(f"generating {rows:,} activities...")
+            self.seed_history(rows)
+            activity_count = Activity.objects.count()
+
+            for export_format in options['formats']:
+                if export_format == 'parquet' and not parquet_available():
+                    self.stdout.write(f"{export_format}: pyarrow not installed")
+                    continue
+
+                begin = perf_counter()
+                size = 0
+                for chunk in view.get_content(
+                        export_format,
+                        view.columns,
+                        view.get_queryset(),
+                ):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    size += len(chunk)
+                seconds = perf_counter() - begin
+                self.stdout.write(
+                    f"{export_format}: {size / 1024 / 1024:,.1f} MiB, "
+                    f"{seconds:.1f} s, "
+                    f"{activity_count / seconds:,.0f} activities/s"
+                )
+
+            transaction.set_rollback(True)
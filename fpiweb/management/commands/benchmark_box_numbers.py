@@ -0,0 +1,84 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from fpiweb.models import Box, BoxNumber
+
+# Custom django-admin / manage.py command as per
+# https://docs.djangoproject.com/en/2.2/howto/custom-management-commands/
+
+
+class Command(BaseCommand):
+
+    help = """Time finding free box numbers for labels with one query per
+    candidate (the old way) against one range query.  The boxes used for
+    the test are rolled back afterwards."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-c', '--count',
+            type=int,
+            default=1000,
+            help="Number of free box numbers to find",
+        )
+        parser.add_argument(
+            '-s', '--start',
+            type=int,
+            default=90000,
+            help="First box number of the (sparse) test range",
+        )
+        parser.add_argument(
+            '-e', '--every',
+            type=int,
+            default=2,
+            help="Mark every n-th box number in the range as in use",
+        )
+
+    @staticmethod
+    def get_box_numbers_per_candidate(start, count):
+        """ the loop QRCodePrinter.get_box_numbers used to run """
+        box_numbers = []
+        next_box_number = start
+        while len(box_numbers) < count:
+            box_label = BoxNumber.format_box_number(next_box_number)
+            if not Box.objects.filter(box_number=box_label).exists():
+                box_numbers.append((box_label, next_box_number))
+            next_box_number += 1
+        return box_numbers
+
+    def handle(self, *args, **options):
+        start = options['start']
+        count = options['count']
+        every = options['every']
+
+        with transaction.atomic():
+            default_box_type = Box.box_type_default()
+            Box.objects.bulk_create(
+                [
+                    Box(
+                        box_number=BoxNumber.format_box_number(box_number),
+                        box_type=default_box_type,
+                    )
+                    for box_number in range(start, start + count * 2, every)
+                ],
+                ignore_conflicts=True,
+            )
+
+            begin = perf_counter()
+            per_candidate = self.get_box_numbers_per_candidate(start, count)
+            per_candidate_ms = (perf_counter() - begin) * 1000
+
+            begin = perf_counter()
+            range_query = BoxNumber.get_free_box_numbers(start, count)
+            range_query_ms = (perf_counter() - begin) * 1000
+
+            transaction.set_rollback(True)
+
+        if per_candidate != range_query:
+            self.stderr.write("the two methods found different box numbers")
+        self.stdout.write(
+            f"{count:,} free box numbers from {start}: "
+            f"one query per candidate {per_candidate_ms:.1f} ms, "
+            f"one range query {range_query_ms:.1f} ms"
+        )
@@ -0,0 +1,97 @@
+from base64 import b64encode
+from io import BytesIO
+from statistics import mean, median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from pyqrcode import create as create_qrcode
+
+from fpiweb import code_reader
+from fpiweb.code_reader import \
+    CodeReaderError, \
+    ScanPreprocessor, \
+    decode_image_bytes, \
+    get_decoder
+
+# Custom django-admin / manage.py command as per
+# https://docs.djangoproject.com/en/2.2/howto/custom-management-commands/
+
+
+class Command(BaseCommand):
+
+    help = """Time how long code_reader takes to decode one scan with each
+    decoder backend."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n', '--scans',
+            type=int,
+            default=200,
+            help="Number of scans to decode per backend",
+        )
+        parser.add_argument(
+            '-s', '--scale',
+            type=int,
+            default=8,
+            help="Pixels per QR module in the generated scan image",
+        )
+        parser.add_argument(
+            '--no-preprocess',
+            action='store_true',
+            help="Decode only the full size image (no grayscale/downscale)",
+        )
+        parser.add_argument(
+            'backends',
+            metavar='BACKEND',
+            nargs='*',
+            default=list(code_reader.DECODER_BACKENDS),
+            help="Backends to time (default: all of them)",
+        )
+
+    @staticmethod
+    def make_scan_data(scale):
+        qr = create_qrcode('http://localhost:8765/fpiweb/box/box12345/')
+        with BytesIO() as png_out:
+            qr.png(png_out, scale=scale)
+            png_bytes = png_out.getvalue()
+        return code_reader.scan_data_prefix + b64encode(png_bytes).decode()
+
+    def handle(self, *args, **options):
+        scans = options['scans']
+        scan_data = self.make_scan_data(options['scale'])
+        preprocessor = ScanPreprocessor.from_settings()
+        if options['no_preprocess']:
+            preprocessor.enabled = False
+        self.stdout.write(
+            f"scan data is {len(scan_data):,} characters, "
+            f"{scans} scans per backend"
+        )
+
+        for backend_name in options['backends']:
+            try:
+                decoder = get_decoder(backend_name)
+            except CodeReaderError as error:
+                raise CommandError(str(error))
+            if decoder.name != backend_name:
+                self.stdout.write(f"{backend_name}: not available, skipped")
+                continue
+
+            timings = []
+            for _ in range(scans):
+                start = perf_counter()
+                box_number = code_reader.get_box_number(
+                    decode_image_bytes(
+                        decoder,
+                        code_reader.decode_scan_data(scan_data),
+                        preprocessor,
+                    )
+                )
+                timings.append((perf_counter() - start) * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            self.stdout.write(
+                f"{backend_name}: {box_number} "
+                f"mean {mean(timings):.2f} ms, "
+                f"median {median(timings):.2f} ms, "
+                f"p95 {p95:.2f} ms"
+            )
@@ -0,0 +1,79 @@
+from io import BytesIO
+from multiprocessing import get_context
+from resource import RUSAGE_SELF, getrusage
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fpiweb.management.commands.benchmark_label_printing import \
+    BenchmarkPrinter
+from fpiweb.qr_code_utilities import LabelPdfSpool
+
+# Custom django-admin / manage.py command as per
+# https://docs.djangoproject.com/en/2.2/howto/custom-management-commands/
+
+# block size FileResponse uses to stream a file
+BLOCK_SIZE = 4096
+
+
+def build_and_send(mode, count, results):
+    """
+    Build a label PDF the way PrintLabelsView does and read it out the way
+    FileResponse does.  Runs in its own process so ru_maxrss is the peak
+    memory of just this run.
+    """
+    if mode == 'bytesio':
+        buffer = BytesIO()
+    else:
+        buffer = LabelPdfSpool()
+
+    BenchmarkPrinter(url_prefix='', workers=0).print(
+        starting_number=1,
+        count=count,
+        buffer=buffer,
+    )
+
+    buffer.seek(0)
+    pdf_size = 0
+    while True:
+        block = buffer.read(BLOCK_SIZE)
+        if not block:
+            break
+        pdf_size += len(block)
+    buffer.close()
+
+    # ru_maxrss is in kilobytes on Linux
+    results.put((getrusage(RUSAGE_SELF).ru_maxrss, pdf_size))
+
+
+class Command(BaseCommand):
+
+    help = """Measure the peak memory (RSS) of building and sending a label
+    PDF in memory (BytesIO) against a spooled temporary file."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-c', '--count',
+            type=int,
+            default=5000,
+            help="Number of labels to print",
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        context = get_context('fork')
+        for mode in ('bytesio', 'spooled'):
+            results = context.Queue()
+            process = context.Process(
+                target=build_and_send,
+                args=(mode, count, results),
+            )
+            process.start()
+            # the result is small enough to be waiting in the queue
+            process.join()
+            if process.exitcode:
+                raise CommandError(f"The {mode} run failed")
+            peak_kb, pdf_size = results.get()
+            self.stdout.write(
+                f"{mode}: {count:,} labels, {pdf_size:,} byte PDF, "
+                f"peak RSS {peak_kb / 1024:.1f} MB"
+            )
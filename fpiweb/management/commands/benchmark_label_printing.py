@@ -0,0 +1,77 @@
+from io import BytesIO
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from fpiweb.models import BoxNumber
+from fpiweb.qr_code_utilities import QRCodePrinter
+
+# Custom django-admin / manage.py command as per
+# https://docs.djangoproject.com/en/2.2/howto/custom-management-commands/
+
+
+class BenchmarkPrinter(QRCodePrinter):
+    """
+    Print consecutive box numbers without looking in the database.
+    """
+
+    @staticmethod
+    def get_box_numbers(start, count) -> (str, int):
+        for box_number in range(start, start + count):
+            yield BoxNumber.format_box_number(box_number), box_number
+
+
+class Command(BaseCommand):
+
+    help = """Time building label PDFs with QR codes generated one at a
+    time against QR codes generated in a pool of worker processes."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-w', '--workers',
+            type=int,
+            default=4,
+            help="Worker processes for the parallel run",
+        )
+        parser.add_argument(
+            'counts',
+            metavar='COUNT',
+            type=int,
+            nargs='*',
+            default=[100, 1000, 10000],
+            help="Numbers of labels to print (default: 100 1000 10000)",
+        )
+
+    @staticmethod
+    def print_labels(count, workers):
+        printer = BenchmarkPrinter(
+            url_prefix='http://localhost:8765/fpiweb/box/box',
+            workers=workers,
+        )
+        printer.parallel_min = 1
+        buffer = BytesIO()
+        start = perf_counter()
+        printer.print(starting_number=1, count=count, buffer=buffer)
+        seconds = perf_counter() - start
+        return seconds, printer.page_number, len(buffer.getvalue())
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        for count in options['counts']:
+            serial_seconds, serial_pages, serial_size = \
+                self.print_labels(count, 0)
+            parallel_seconds, parallel_pages, parallel_size = \
+                self.print_labels(count, workers)
+
+            if (serial_pages, serial_size) != (parallel_pages, parallel_size):
+                self.stderr.write(
+                    f"{count:,} labels: serial and parallel PDFs differ "
+                    f"({serial_pages} / {parallel_pages} pages, "
+                    f"{serial_size:,} / {parallel_size:,} bytes)"
+                )
+            self.stdout.write(
+                f"{count:,} labels, {serial_pages:,} pages: "
+                f"serial {serial_seconds:.2f} s, "
+                f"{workers} workers {parallel_seconds:.2f} s "
+                f"({serial_seconds / parallel_seconds:.1f}x)"
+            )
@@ -0,0 +1,48 @@
+from io import BytesIO
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from fpiweb.management.commands.benchmark_label_printing import \
+    BenchmarkPrinter
+
+# Custom django-admin / manage.py command as per
+# https://docs.djangoproject.com/en/2.2/howto/custom-management-commands/
+
+
+class Command(BaseCommand):
+
+    help = """Compare the size and build time of label PDFs with raster (PNG)
+    QR codes against vector QR codes."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'counts',
+            metavar='COUNT',
+            type=int,
+            nargs='*',
+            default=[100, 2000],
+            help="Numbers of labels to print (default: 100 2000)",
+        )
+
+    @staticmethod
+    def print_labels(count, vector):
+        printer = BenchmarkPrinter(
+            url_prefix='http://localhost:8765/fpiweb/box/box',
+            workers=0,
+            vector=vector,
+        )
+        buffer = BytesIO()
+        start = perf_counter()
+        printer.print(starting_number=1, count=count, buffer=buffer)
+        return perf_counter() - start, len(buffer.getvalue())
+
+    def handle(self, *args, **options):
+        for count in options['counts']:
+            raster_seconds, raster_size = self.print_labels(count, False)
+            vector_seconds, vector_size = self.print_labels(count, True)
+            self.stdout.write(
+                f"{count:,} labels: "
+                f"raster {raster_size:,} bytes in {raster_seconds:.2f} s, "
+                f"vector {vector_size:,} bytes in {vector_seconds:.2f} s"
+            )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from fpiweb.print_jobs import \
+    delete_expired_print_jobs, \
+    fail_stale_print_jobs
+
+# Custom django-admin / manage.py command as per
+# https://docs.djangoproject.com/en/2.2/howto/custom-management-commands/
+
+
+class Command(BaseCommand):
+
+    help = """Delete label print jobs, and their PDFs, older than
+    PRINT_JOB_RETENTION_HOURS and mark jobs unfinished after
+    PRINT_JOB_TIMEOUT_MINUTES as failed (e.g. run daily from cron, and
+    when the web server starts)."""
+
+    def handle(self, *args, **options):
+        deleted = delete_expired_print_jobs()
+        self.stdout.write(f"Deleted {deleted} expired print jobs")
+        failed = fail_stale_print_jobs()
+        self.stdout.write(f"Marked {failed} unfinished print jobs as failed")
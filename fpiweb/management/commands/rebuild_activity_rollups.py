@@ -0,0 +1,22 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from fpiweb.support.ActivityRollup import ActivityRollupClass
+
+# Custom django-admin / manage.py command as per
+# https://docs.djangoproject.com/en/2.2/howto/custom-management-commands/
+
+
+class Command(BaseCommand):
+
+    help = """Rebuild the daily activity rollups from the activity records
+    (e.g. after activity records were changed by hand)."""
+
+    def handle(self, *args, **options):
+        begin = perf_counter()
+        rollup_count = ActivityRollupClass.rebuild()
+        self.stdout.write(
+            f"Rebuilt {rollup_count} activity rollups in "
+            f"{perf_counter() - begin:.1f} seconds"
+        )
@@ -0,0 +1,22 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from fpiweb.support.OnHandSummary import OnHandSummaryClass
+
+# Custom django-admin / manage.py command as per
+# https://docs.djangoproject.com/en/2.2/howto/custom-management-commands/
+
+
+class Command(BaseCommand):
+
+    help = """Rebuild the on hand summary from the boxes (e.g. after
+    boxes were changed in the database directly)."""
+
+    def handle(self, *args, **options):
+        begin = perf_counter()
+        summary_count = OnHandSummaryClass.rebuild()
+        self.stdout.write(
+            f"Rebuilt {summary_count} on hand summaries in "
+            f"{perf_counter() - begin:.1f} seconds"
+        )
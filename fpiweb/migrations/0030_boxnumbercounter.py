@@ -0,0 +1,23 @@
+# Generated by Django 3.1.6 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fpiweb', '0029_add_model_permissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoxNumberCounter',
+            fields=[
+                ('id', models.AutoField(help_text='Internal record identifier for the box number counter.', primary_key=True, serialize=False, verbose_name='Internal Box Number Counter ID')),
+                ('next_box_number', models.IntegerField(help_text='Next box number (as an integer) to allocate.', verbose_name='Next Box Number')),
+            ],
+            options={
+                'verbose_name_plural': 'Box Number Counter',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.1.6 on 2026-10-18 11:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('fpiweb', '0030_boxnumbercounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrintJob',
+            fields=[
+                ('id', models.AutoField(help_text='Internal record identifier for a print job.', primary_key=True, serialize=False, verbose_name='Internal Print Job ID')),
+                ('starting_number', models.IntegerField(help_text='First box number (as an integer) to print.', verbose_name='Starting Box Number')),
+                ('label_count', models.IntegerField(help_text='Number of labels to print.', verbose_name='Labels to Print')),
+                ('labels_done', models.IntegerField(default=0, help_text='Number of labels built so far.', verbose_name='Labels Built')),
+                ('status', models.CharField(choices=[('Queued', 'Waiting to start'), ('Running', 'Building labels'), ('Done', 'Labels ready to download'), ('Failed', 'Labels could not be built')], default='Queued', help_text='Progress of this print job.', max_length=10, verbose_name='Status')),
+                ('error_message', models.CharField(blank=True, help_text='Why the labels could not be built.', max_length=255, verbose_name='Error Message')),
+                ('file_name', models.CharField(blank=True, help_text='Name of the finished PDF in PRINT_JOBS_DIR.', max_length=255, verbose_name='File Name')),
+                ('date_requested', models.DateTimeField(default=django.utils.timezone.now, help_text='Date and time the labels were asked for.', verbose_name='Date Requested')),
+                ('date_finished', models.DateTimeField(blank=True, help_text='Date and time the job finished or failed.', null=True, verbose_name='Date Finished')),
+                ('requested_by', models.ForeignKey(blank=True, help_text='User who asked for the labels.', null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Print Jobs',
+                'ordering': ['-date_requested'],
+            },
+        ),
+    ]
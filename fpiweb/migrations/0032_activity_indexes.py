@@ -0,0 +1,21 @@
+# Generated by Django 3.1.6 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fpiweb', '0031_printjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['box_number', 'date_filled'], name='activity_box_filled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(condition=models.Q(date_consumed=None), fields=['box_number', '-date_filled'], name='activity_open_box_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.6 on 2026-10-18 16:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fpiweb', '0032_activity_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='date_changed',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When this entry was added or last changed.', verbose_name='Date Changed'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['date_changed', 'id'], name='activity_changed_idx'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 3.1.6 on 2026-10-18 17:10
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def rollup_activities(apps, schema_editor):
+    """ total the activity already recorded """
+    Activity = apps.get_model('fpiweb', 'Activity')
+    ActivityRollup = apps.get_model('fpiweb', 'ActivityRollup')
+    key_fields = ('prod_name', 'prod_cat_name', 'loc_row', 'loc_bin',
+                  'loc_tier')
+    rollups = dict()
+
+    def get_rollup(rollup_date, values):
+        key = (rollup_date, *[values[field] for field in key_fields])
+        if key not in rollups:
+            rollups[key] = ActivityRollup(
+                rollup_date=rollup_date,
+                **{field: values[field] for field in key_fields},
+            )
+        return rollups[key]
+
+    fills = Activity.objects.order_by().values(
+        'date_filled', *key_fields
+    ).annotate(
+        count=Count('id'),
+        quantity=Sum('quantity'),
+    )
+    for fill in fills:
+        rollup = get_rollup(fill['date_filled'], fill)
+        rollup.filled_count = fill['count']
+        rollup.filled_quantity = fill['quantity']
+
+    consumptions = Activity.objects.exclude(
+        date_consumed=None,
+    ).order_by().values(
+        'date_consumed', *key_fields
+    ).annotate(
+        count=Count('id'),
+        quantity=Sum('quantity'),
+        duration_total=Sum('duration'),
+        duration_min=Min('duration'),
+        duration_max=Max('duration'),
+    )
+    for consumption in consumptions:
+        rollup = get_rollup(consumption['date_consumed'], consumption)
+        rollup.consumed_count = consumption['count']
+        rollup.consumed_quantity = consumption['quantity']
+        rollup.duration_total = consumption['duration_total']
+        rollup.duration_min = consumption['duration_min']
+        rollup.duration_max = consumption['duration_max']
+
+    ActivityRollup.objects.bulk_create(rollups.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fpiweb', '0033_activity_date_changed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.AutoField(help_text='Internal record identifier for an activity rollup.', primary_key=True, serialize=False, verbose_name='Internal Activity Rollup ID')),
+                ('rollup_date', models.DateField(help_text='Day these activity totals are for.', verbose_name='Rollup Date')),
+                ('prod_name', models.CharField(help_text='Product these activity totals are for.', max_length=30, verbose_name='Product Name')),
+                ('prod_cat_name', models.CharField(help_text='Category of the product.', max_length=30, verbose_name='Product Category Name')),
+                ('loc_row', models.CharField(help_text='Row these activity totals are for.', max_length=2, verbose_name='Row Location')),
+                ('loc_bin', models.CharField(help_text='Bin these activity totals are for.', max_length=2, verbose_name='Bin Location')),
+                ('loc_tier', models.CharField(help_text='Tier these activity totals are for.', max_length=2, verbose_name='Tier Location')),
+                ('filled_count', models.IntegerField(default=0, help_text='Number of boxes filled.', verbose_name='Boxes Filled')),
+                ('filled_quantity', models.IntegerField(default=0, help_text='Number of items in the boxes filled.', verbose_name='Quantity Filled')),
+                ('consumed_count', models.IntegerField(default=0, help_text='Number of boxes consumed.', verbose_name='Boxes Consumed')),
+                ('consumed_quantity', models.IntegerField(default=0, help_text='Number of items in the boxes consumed.', verbose_name='Quantity Consumed')),
+                ('duration_total', models.IntegerField(default=0, help_text='Total days the boxes consumed were in inventory.', verbose_name='Total Duration')),
+                ('duration_min', models.IntegerField(blank=True, help_text='Fewest days a box consumed was in inventory.', null=True, verbose_name='Minimum Duration')),
+                ('duration_max', models.IntegerField(blank=True, help_text='Most days a box consumed was in inventory.', null=True, verbose_name='Maximum Duration')),
+            ],
+            options={
+                'verbose_name_plural': 'Activity Rollups',
+                'ordering': ['rollup_date', 'prod_cat_name', 'prod_name'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='activityrollup',
+            constraint=models.UniqueConstraint(fields=('rollup_date', 'prod_name', 'prod_cat_name', 'loc_row', 'loc_bin', 'loc_tier'), name='activity_rollup_key'),
+        ),
+        migrations.RunPython(rollup_activities, migrations.RunPython.noop),
+    ]
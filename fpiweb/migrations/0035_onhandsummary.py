@@ -0,0 +1,67 @@
+# Generated by Django 3.1.6 on 2026-10-18 17:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+def summarize_boxes(apps, schema_editor):
+    """ count the boxes already on hand """
+    Box = apps.get_model('fpiweb', 'Box')
+    OnHandSummary = apps.get_model('fpiweb', 'OnHandSummary')
+    totals = Box.objects.exclude(
+        product=None,
+    ).exclude(
+        location=None,
+    ).order_by().values(
+        'product_id',
+        'location_id',
+        exp=Coalesce('exp_year', 0),
+    ).annotate(
+        box_count=Count('id'),
+        quantity=Coalesce(Sum('quantity'), 0),
+    )
+    OnHandSummary.objects.bulk_create(
+        (
+            OnHandSummary(
+                product_id=total['product_id'],
+                location_id=total['location_id'],
+                exp_year=total['exp'],
+                box_count=total['box_count'],
+                quantity=total['quantity'],
+            )
+            for total in totals
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fpiweb', '0034_activityrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OnHandSummary',
+            fields=[
+                ('id', models.AutoField(help_text='Internal record identifier for an on hand summary.', primary_key=True, serialize=False, verbose_name='Internal On Hand Summary ID')),
+                ('exp_year', models.IntegerField(help_text='Year the product expires (0 if not known).', verbose_name='Year Expired')),
+                ('box_count', models.IntegerField(default=0, help_text='Number of boxes on hand.', verbose_name='Boxes On Hand')),
+                ('quantity', models.IntegerField(default=0, help_text='Approximate number of items in the boxes on hand.', verbose_name='Quantity On Hand')),
+                ('location', models.ForeignKey(help_text='Location of the boxes.', on_delete=django.db.models.deletion.CASCADE, to='fpiweb.location', verbose_name='Location')),
+                ('product', models.ForeignKey(help_text='Product in the boxes.', on_delete=django.db.models.deletion.CASCADE, to='fpiweb.product', verbose_name='Product')),
+            ],
+            options={
+                'verbose_name_plural': 'On Hand Summaries',
+                'ordering': ['product', 'location', 'exp_year'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='onhandsummary',
+            constraint=models.UniqueConstraint(fields=('product', 'location', 'exp_year'), name='on_hand_summary_key'),
+        ),
+        migrations.RunPython(summarize_boxes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.1.6 on 2026-10-18 19:20
+
+from calendar import monthrange
+from datetime import date
+
+from django.db import migrations, models
+
+
+def set_exp_dates(apps, schema_editor):
+    """ derive exp_date for the boxes already filled """
+    Box = apps.get_model('fpiweb', 'Box')
+    boxes = list()
+    for box in Box.objects.exclude(exp_year=None).exclude(exp_year=0) \
+            .only('id', 'exp_year', 'exp_month_end').iterator():
+        month = box.exp_month_end if box.exp_month_end in range(1, 13) \
+            else 12
+        box.exp_date = date(
+            box.exp_year, month, monthrange(box.exp_year, month)[1])
+        boxes.append(box)
+    Box.objects.bulk_update(boxes, fields=['exp_date'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fpiweb', '0035_onhandsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='box',
+            name='exp_date',
+            field=models.DateField(blank=True, editable=False, help_text='Last day of the month or year the product expires, if filled.', null=True, verbose_name='Date Product Expires'),
+        ),
+        migrations.RunPython(set_exp_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='box',
+            index=models.Index(condition=models.Q(exp_date__isnull=False), fields=['exp_date', 'id'], name='box_exp_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='box',
+            index=models.Index(condition=models.Q(exp_date__isnull=False), fields=['product', 'exp_date', 'id'], name='box_product_exp_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='box',
+            index=models.Index(condition=models.Q(exp_date__isnull=False), fields=['location', 'exp_date', 'id'], name='box_location_exp_date_idx'),
+        ),
+    ]
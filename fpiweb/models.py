@@ -1,17 +1,26 @@
 """
 models.py - Define the database tables using ORM models.
 """
+from calendar import monthrange
+from datetime import date
 from enum import Enum, unique
-from typing import Union
+from threading import Lock
+from time import monotonic
+from typing import Dict, Optional, Union
+from uuid import uuid4
 
 # import as to avoid conflict with built-in function compile
 from re import compile as re_compile
 from re import IGNORECASE
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from django.db.models import Max
+from django.db import models, transaction
+from django.db.models import Max, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.urls import reverse
 
@@ -448,17 +457,146 @@ class BoxNumber:
 
     @staticmethod
     def get_next_box_number() -> str:
-        """ get the next unused box number """
-        max_box_number = Box.objects.aggregate(
-            max_box_number=Max('box_number'))
-        max_box_number = max_box_number.get('max_box_number')
-        if max_box_number is None:
-            max_formatted_box_number = BoxNumber.format_box_number(1)
+        """
+        Peek at the box number allocate_box_numbers would hand out next,
+        e.g. to display it.  Nothing is locked or allocated, so use
+        allocate_box_numbers to get a number for a box being created.
+        """
+        counter = BoxNumberCounter.objects.filter(pk=1).first()
+        if counter is not None:
+            start = counter.next_box_number
         else:
-            max_box_number = int(max_box_number[3:])
-            max_formatted_box_number = \
-                BoxNumber.format_box_number(max_box_number + 1)
-        return max_formatted_box_number
+            max_box_number = Box.objects.aggregate(
+                max_box_number=Max('box_number'))
+            max_box_number = max_box_number.get('max_box_number')
+            start = 1
+            if max_box_number is not None:
+                start = int(max_box_number[3:]) + 1
+        return BoxNumber.get_free_box_numbers(start, 1)[0][0]
+
+    @staticmethod
+    def get_free_box_numbers(start: int, count: int) -> list:
+        """
+        Find count box numbers, from start up, that no box is using.
+
+        The box numbers in use from start up are read in order by a single
+        (streamed) query, and the gaps between them are handed out until
+        enough have been found - rather than one query per candidate.
+
+        :param start: lowest box number (as an int) to consider
+        :param count: how many free box numbers are wanted
+        :return: list of (box number of the form BOXnnnnn, int)
+        """
+        free_box_numbers = []
+        candidate = start
+        used_box_numbers = Box.objects \
+            .filter(box_number__gte=BoxNumber.format_box_number(start)) \
+            .order_by('box_number') \
+            .values_list('box_number', flat=True) \
+            .iterator()
+        for used_box_number in used_box_numbers:
+            try:
+                used_box_number = int(used_box_number[3:])
+            except ValueError:
+                continue
+            while candidate < used_box_number and \
+                    len(free_box_numbers) < count:
+                free_box_numbers.append(
+                    (BoxNumber.format_box_number(candidate), candidate))
+                candidate += 1
+            if len(free_box_numbers) >= count:
+                break
+            candidate = max(candidate, used_box_number + 1)
+
+        while len(free_box_numbers) < count:
+            free_box_numbers.append(
+                (BoxNumber.format_box_number(candidate), candidate))
+            candidate += 1
+        return free_box_numbers
+
+    @staticmethod
+    def _get_locked_counter() -> 'BoxNumberCounter':
+        """
+        Get the box number counter row, locked until the end of the current
+        transaction.  The first time, the counter is started after the
+        highest box number in use.
+        """
+        if not BoxNumberCounter.objects.filter(pk=1).exists():
+            max_box_number = Box.objects.aggregate(
+                max_box_number=Max('box_number'))
+            max_box_number = max_box_number.get('max_box_number')
+            next_box_number = 1
+            if max_box_number is not None:
+                next_box_number = int(max_box_number[3:]) + 1
+            BoxNumberCounter.objects.get_or_create(
+                pk=1,
+                defaults={'next_box_number': next_box_number},
+            )
+        return BoxNumberCounter.objects.select_for_update().get(pk=1)
+
+    @staticmethod
+    def allocate_box_numbers(count: int) -> list:
+        """
+        Allocate a block of count consecutive unused box numbers.
+
+        Callers are serialized by a lock on the counter row so no two
+        callers get the same numbers.  Boxes created with numbers that
+        did not come from here (e.g. from labels printed earlier) are
+        skipped over by looking at just the range about to be handed out.
+
+        :param count: how many box numbers are needed
+        :return: box numbers of the form BOXnnnnn
+        """
+        if count < 1:
+            return []
+
+        with transaction.atomic():
+            counter = BoxNumber._get_locked_counter()
+            first = counter.next_box_number
+            while True:
+                last = first + count - 1
+                max_box_number = Box.objects.filter(
+                    box_number__gte=BoxNumber.format_box_number(first),
+                    box_number__lte=BoxNumber.format_box_number(last),
+                ).aggregate(max_box_number=Max('box_number'))
+                max_box_number = max_box_number.get('max_box_number')
+                if max_box_number is None:
+                    break
+                first = int(max_box_number[3:]) + 1
+
+            counter.next_box_number = last + 1
+            counter.save(update_fields=['next_box_number'])
+
+        return [
+            BoxNumber.format_box_number(box_number)
+            for box_number in range(first, last + 1)
+        ]
+
+    @staticmethod
+    def reserve_free_box_numbers(start: int, count: int) -> list:
+        """
+        Find count box numbers, from start up, that no box is using (as
+        get_free_box_numbers does) and reserve them, e.g. for labels about
+        to be printed.
+
+        The free numbers can skip past start + count - 1, so everything up
+        to the highest of them is reserved, under the same lock.
+
+        :param start: lowest box number (as an int) to consider
+        :param count: how many free box numbers are wanted
+        :return: list of (box number of the form BOXnnnnn, int)
+        """
+        if count < 1:
+            return []
+
+        with transaction.atomic():
+            counter = BoxNumber._get_locked_counter()
+            free_box_numbers = BoxNumber.get_free_box_numbers(start, count)
+            last = free_box_numbers[-1][1]
+            if counter.next_box_number <= last:
+                counter.next_box_number = last + 1
+                counter.save(update_fields=['next_box_number'])
+        return free_box_numbers
 
     @staticmethod
     def validate(box_number: str) -> bool:
@@ -487,6 +625,24 @@ class Box(models.Model):
             ('move_box', 'Move Box'),
             ('print_labels_box', 'Print Labels'),
         ]
+        indexes = [
+            # boxes expiring soonest (see fpiweb.support.ExpiringBoxes)
+            models.Index(
+                fields=['exp_date', 'id'],
+                name='box_exp_date_idx',
+                condition=Q(exp_date__isnull=False),
+            ),
+            models.Index(
+                fields=['product', 'exp_date', 'id'],
+                name='box_product_exp_date_idx',
+                condition=Q(exp_date__isnull=False),
+            ),
+            models.Index(
+                fields=['location', 'exp_date', 'id'],
+                name='box_location_exp_date_idx',
+                condition=Q(exp_date__isnull=False),
+            ),
+        ]
 
     id_help_text = 'Internal record identifier for box.'
     id = models.AutoField(
@@ -583,6 +739,21 @@ class Box(models.Model):
     )
     """ Optional emding month range of when the product expires, if filled. """
 
+    exp_date_help_text = (
+        'Last day of the month or year the product expires, if filled.'
+    )
+    exp_date = models.DateField(
+        'Date Product Expires',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=exp_date_help_text,
+    )
+    """
+    Last day of the month or year the product expires, if filled.  Derived
+    from exp_year and exp_month_end whenever the box is saved.
+    """
+
     date_filled_help_text = 'Approximate date box was filled, if filled.'
     date_filled = models.DateTimeField(
         'Date Box Filled',
@@ -608,6 +779,34 @@ class Box(models.Model):
             return True
         return False
 
+    @staticmethod
+    def get_exp_date(exp_year: Optional[int],
+                     exp_month_end: Optional[int]) -> Optional[date]:
+        """
+        Get the effective end of an expiration window.
+
+        :param exp_year: year the product expires
+        :param exp_month_end: last month of the window (0 or None for the
+            whole year)
+        :return: last day of the window, or None if no year is given
+        """
+        if not exp_year:
+            return None
+        month = exp_month_end if exp_month_end in range(1, 13) else 12
+        return date(exp_year, month, monthrange(exp_year, month)[1])
+
+    def set_exp_date(self):
+        """ Derive exp_date from the expiration year and months. """
+        self.exp_date = self.get_exp_date(self.exp_year, self.exp_month_end)
+
+    def save(self, *args, **kwargs):
+        """ Keep exp_date in step with the expiration year and months. """
+        self.set_exp_date()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'exp_date'}
+        super().save(*args, **kwargs)
+
     # define a default display of Box
     def __str__(self):
         """ Default way to display this box record. """
@@ -652,6 +851,36 @@ class Box(models.Model):
         )
 
 
+class BoxNumberCounter(models.Model):
+    """
+    Single row holding the next box number to hand out (see
+    BoxNumber.allocate_box_numbers).
+    """
+
+    class Meta:
+        app_label = 'fpiweb'
+        verbose_name_plural = 'Box Number Counter'
+
+    id_help_text = 'Internal record identifier for the box number counter.'
+    id = models.AutoField(
+        'Internal Box Number Counter ID',
+        primary_key=True,
+        help_text=id_help_text,
+    )
+    """ Internal record identifier for the box number counter. """
+
+    next_box_number_help_text = 'Next box number (as an integer) to allocate.'
+    next_box_number = models.IntegerField(
+        'Next Box Number',
+        help_text=next_box_number_help_text,
+    )
+    """ Next box number (as an integer) to allocate. """
+
+    def __str__(self):
+        """ Default way to display the box number counter. """
+        return f'next: {BoxNumber.format_box_number(self.next_box_number)}'
+
+
 class Pallet(models.Model):
     """
     Temporary file to build up a list of boxes on a pallet.
@@ -848,6 +1077,24 @@ class Activity(models.Model):
         ordering = ['-date_consumed', 'box_number']
         app_label = 'fpiweb'
         verbose_name_plural = 'Activities'
+        indexes = [
+            # history of a box, latest first
+            models.Index(
+                fields=['box_number', 'date_filled'],
+                name='activity_box_filled_idx',
+            ),
+            # boxes still in inventory (see BoxActivityClass)
+            models.Index(
+                fields=['box_number', '-date_filled'],
+                name='activity_open_box_idx',
+                condition=Q(date_consumed=None),
+            ),
+            # incremental export (see fpiweb.activity_export)
+            models.Index(
+                fields=['date_changed', 'id'],
+                name='activity_changed_idx',
+            ),
+        ]
 
     # Adjustment Reasons
     FILL_EMPTIED: str = 'Fill Emptied'
@@ -1005,6 +1252,24 @@ class Activity(models.Model):
     )
     """ Coded reason if this entry was adjusted """
 
+    date_changed_help_text = 'When this entry was added or last changed.'
+    date_changed = models.DateTimeField(
+        'Date Changed',
+        default=timezone.now,
+        help_text=date_changed_help_text,
+    )
+    """ When this entry was added or last changed. """
+
+    def save(self, *args, **kwargs):
+        """ Note when this activity record was changed. """
+        # not auto_now, so that activity records loaded from fixtures
+        # (saved raw) still get a date_changed from the default
+        self.date_changed = timezone.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'date_changed'}
+        super().save(*args, **kwargs)
+
     # define a default display of Activity
     def __str__(self):
         """ Default way to display this activity record. """
@@ -1039,6 +1304,244 @@ class Activity(models.Model):
         return display
 
 
+class ActivityRollup(models.Model):
+    """
+    Activity totals for a day, product and location.
+
+    Kept up to date as activity records are added, moved and consumed
+    (see fpiweb.support.ActivityRollup) so statistics don't need a pass
+    over every activity record.  Fills are counted on the day a box was
+    filled and consumptions on the day it was consumed, both at the
+    location last recorded for the box.
+    """
+
+    class Meta:
+        ordering = ['rollup_date', 'prod_cat_name', 'prod_name']
+        app_label = 'fpiweb'
+        verbose_name_plural = 'Activity Rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'rollup_date',
+                    'prod_name',
+                    'prod_cat_name',
+                    'loc_row',
+                    'loc_bin',
+                    'loc_tier',
+                ],
+                name='activity_rollup_key',
+            ),
+        ]
+
+    id_help_text = 'Internal record identifier for an activity rollup.'
+    id = models.AutoField(
+        'Internal Activity Rollup ID',
+        primary_key=True,
+        help_text=id_help_text,
+    )
+    """ Internal record identifier for an activity rollup. """
+
+    rollup_date_help_text = 'Day these activity totals are for.'
+    rollup_date = models.DateField(
+        'Rollup Date',
+        help_text=rollup_date_help_text,
+    )
+    """ Day these activity totals are for. """
+
+    prod_name_help_text = 'Product these activity totals are for.'
+    prod_name = models.CharField(
+        'Product Name',
+        max_length=30,
+        help_text=prod_name_help_text,
+    )
+    """ Product these activity totals are for. """
+
+    prod_cat_name_help_text = 'Category of the product.'
+    prod_cat_name = models.CharField(
+        'Product Category Name',
+        max_length=30,
+        help_text=prod_cat_name_help_text,
+    )
+    """ Category of the product. """
+
+    loc_row_help_text = 'Row these activity totals are for.'
+    loc_row = models.CharField(
+        'Row Location',
+        max_length=2,
+        help_text=loc_row_help_text,
+    )
+    """ Row these activity totals are for. """
+
+    loc_bin_help_text = 'Bin these activity totals are for.'
+    loc_bin = models.CharField(
+        'Bin Location',
+        max_length=2,
+        help_text=loc_bin_help_text,
+    )
+    """ Bin these activity totals are for. """
+
+    loc_tier_help_text = 'Tier these activity totals are for.'
+    loc_tier = models.CharField(
+        'Tier Location',
+        max_length=2,
+        help_text=loc_tier_help_text,
+    )
+    """ Tier these activity totals are for. """
+
+    filled_count_help_text = 'Number of boxes filled.'
+    filled_count = models.IntegerField(
+        'Boxes Filled',
+        default=0,
+        help_text=filled_count_help_text,
+    )
+    """ Number of boxes filled. """
+
+    filled_quantity_help_text = 'Number of items in the boxes filled.'
+    filled_quantity = models.IntegerField(
+        'Quantity Filled',
+        default=0,
+        help_text=filled_quantity_help_text,
+    )
+    """ Number of items in the boxes filled. """
+
+    consumed_count_help_text = 'Number of boxes consumed.'
+    consumed_count = models.IntegerField(
+        'Boxes Consumed',
+        default=0,
+        help_text=consumed_count_help_text,
+    )
+    """ Number of boxes consumed. """
+
+    consumed_quantity_help_text = 'Number of items in the boxes consumed.'
+    consumed_quantity = models.IntegerField(
+        'Quantity Consumed',
+        default=0,
+        help_text=consumed_quantity_help_text,
+    )
+    """ Number of items in the boxes consumed. """
+
+    duration_total_help_text = (
+        'Total days the boxes consumed were in inventory.'
+    )
+    duration_total = models.IntegerField(
+        'Total Duration',
+        default=0,
+        help_text=duration_total_help_text,
+    )
+    """ Total days the boxes consumed were in inventory. """
+
+    duration_min_help_text = (
+        'Fewest days a box consumed was in inventory.'
+    )
+    duration_min = models.IntegerField(
+        'Minimum Duration',
+        null=True,
+        blank=True,
+        help_text=duration_min_help_text,
+    )
+    """ Fewest days a box consumed was in inventory. """
+
+    duration_max_help_text = (
+        'Most days a box consumed was in inventory.'
+    )
+    duration_max = models.IntegerField(
+        'Maximum Duration',
+        null=True,
+        blank=True,
+        help_text=duration_max_help_text,
+    )
+    """ Most days a box consumed was in inventory. """
+
+    # define a default display of ActivityRollup
+    def __str__(self):
+        """ Default way to display this activity rollup. """
+        display = (
+            f'{self.rollup_date} {self.prod_name} ({self.prod_cat_name}) '
+            f'at {self.loc_row}{self.loc_bin}{self.loc_tier}: '
+            f'{self.filled_count} filled, {self.consumed_count} consumed'
+        )
+        return display
+
+
+class OnHandSummary(models.Model):
+    """
+    Boxes on hand for a product, location and expiration year.
+
+    Kept up to date as boxes are filled, moved and consumed (see
+    fpiweb.support.OnHandSummary) so the warehouse board doesn't need to
+    total every filled box.
+    """
+
+    class Meta:
+        ordering = ['product', 'location', 'exp_year']
+        app_label = 'fpiweb'
+        verbose_name_plural = 'On Hand Summaries'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'location', 'exp_year'],
+                name='on_hand_summary_key',
+            ),
+        ]
+
+    id_help_text = 'Internal record identifier for an on hand summary.'
+    id = models.AutoField(
+        'Internal On Hand Summary ID',
+        primary_key=True,
+        help_text=id_help_text,
+    )
+    """ Internal record identifier for an on hand summary. """
+
+    product_help_text = 'Product in the boxes.'
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        verbose_name='Product',
+        help_text=product_help_text,
+    )
+    """ Product in the boxes. """
+
+    location_help_text = 'Location of the boxes.'
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.CASCADE,
+        verbose_name='Location',
+        help_text=location_help_text,
+    )
+    """ Location of the boxes. """
+
+    exp_year_help_text = 'Year the product expires (0 if not known).'
+    exp_year = models.IntegerField(
+        'Year Expired',
+        help_text=exp_year_help_text,
+    )
+    """ Year the product expires (0 if not known). """
+
+    box_count_help_text = 'Number of boxes on hand.'
+    box_count = models.IntegerField(
+        'Boxes On Hand',
+        default=0,
+        help_text=box_count_help_text,
+    )
+    """ Number of boxes on hand. """
+
+    quantity_help_text = 'Approximate number of items in the boxes on hand.'
+    quantity = models.IntegerField(
+        'Quantity On Hand',
+        default=0,
+        help_text=quantity_help_text,
+    )
+    """ Approximate number of items in the boxes on hand. """
+
+    # define a default display of OnHandSummary
+    def __str__(self):
+        """ Default way to display this on hand summary. """
+        display = (
+            f'{self.product} at {self.location} expiring {self.exp_year}: '
+            f'{self.box_count} boxes ({self.quantity})'
+        )
+        return display
+
+
 class Constraints(models.Model):
     """
     Constraints of valid values.
@@ -1166,12 +1669,57 @@ class Constraints(models.Model):
 
     @staticmethod
     def get_values(constraint_name):
-        try:
-            constraint = Constraints.objects.get(
-                constraint_name=constraint_name)
-        except Constraints.DoesNotExist:
+        """
+        Get the valid values of a constraint.
+
+        The values of every constraint are kept in memory (see
+        get_all_values), so this does not normally query the database.
+
+        :param constraint_name: one of the constraint names above
+        :return: [min, max] for a range, the valid values for a list, or
+            None if there is no such constraint
+        """
+        values = Constraints.get_all_values().get(constraint_name)
+        if values is None:
             return None
+        # a copy, so callers can't change the cached values
+        return list(values)
+
+    @staticmethod
+    def get_all_values() -> Dict[str, list]:
+        """
+        Get the parsed values of every constraint.
 
+        The values are loaded in one query and kept for
+        CONSTRAINTS_CACHE_TIMEOUT seconds.  If CONSTRAINTS_CACHE_ALIAS
+        names a cache in CACHES, the values are also shared there with the
+        other processes.  Saving or deleting a constraint clears both.
+
+        :return: values (as from get_values) by constraint name
+        """
+        return _constraint_values.get(
+            lambda: {
+                constraint.constraint_name: Constraints.parse_values(
+                    constraint)
+                for constraint in Constraints.objects.all()
+            }
+        )
+
+    @staticmethod
+    def clear_cache():
+        """
+        Forget the constraint values kept by get_all_values.
+        """
+        _constraint_values.clear()
+
+    @staticmethod
+    def parse_values(constraint) -> list:
+        """
+        Parse the valid values of a constraint record.
+
+        :param constraint: Constraints record
+        :return: [min, max] for a range or the valid values for a list
+        """
         if constraint.constraint_type == Constraints.INT_RANGE:
             return [
                 int(constraint.constraint_min),
@@ -1208,6 +1756,104 @@ class Constraints(models.Model):
             f"Unrecognized constraint_type {constraint.constraint_type}")
 
 
+class ConstraintValuesCache:
+    """
+    The parsed values of every constraint, kept in this process and
+    optionally shared with the other processes through the cache named by
+    CONSTRAINTS_CACHE_ALIAS.
+
+    Values read while the cache is being cleared (e.g. by a constraint
+    being saved) may already be out of date, so they must not be kept.
+    Each clear starts a new generation in this process, and a new version
+    in the shared cache, and values are only kept under the generation and
+    version they were read in.
+    """
+
+    key = 'fpiweb:constraint_values'
+    version_key = 'fpiweb:constraint_values_version'
+
+    def __init__(self):
+        self.lock = Lock()
+        self.values: Optional[Dict[str, list]] = None
+        self.expire = 0.0
+        self.generation = 0
+
+    def get(self, load) -> Dict[str, list]:
+        """
+        :param load: callable reading the values from the database
+        :return: values (as from Constraints.get_values) by constraint name
+        """
+        timeout = getattr(settings, 'CONSTRAINTS_CACHE_TIMEOUT', 60)
+        with self.lock:
+            if self.values is not None and monotonic() < self.expire:
+                return self.values
+            generation = self.generation
+
+        shared_cache = self.get_shared_cache()
+        values = None
+        if shared_cache is not None:
+            shared_key = f'{self.key}:{self.get_shared_version(shared_cache)}'
+            values = shared_cache.get(shared_key)
+        if values is None:
+            values = load()
+            if shared_cache is not None:
+                shared_cache.set(shared_key, values, timeout)
+
+        with self.lock:
+            if timeout > 0 and generation == self.generation:
+                self.values = values
+                self.expire = monotonic() + timeout
+        return values
+
+    def clear(self):
+        """
+        Forget the values, here and in the shared cache.
+        """
+        with self.lock:
+            self.values = None
+            self.generation += 1
+        shared_cache = self.get_shared_cache()
+        if shared_cache is not None:
+            shared_cache.set(self.version_key, uuid4().hex, None)
+
+    @staticmethod
+    def get_shared_cache():
+        """
+        :return: the cache named by CONSTRAINTS_CACHE_ALIAS or None
+        """
+        alias = getattr(settings, 'CONSTRAINTS_CACHE_ALIAS', None)
+        if not alias:
+            return None
+        return caches[alias]
+
+    def get_shared_version(self, shared_cache) -> str:
+        """
+        :param shared_cache:
+        :return: version the shared values are kept under
+        """
+        version = shared_cache.get(self.version_key)
+        if version is None:
+            shared_cache.add(self.version_key, uuid4().hex, None)
+            version = shared_cache.get(self.version_key)
+        return version
+
+
+# constraint values kept by Constraints.get_all_values
+_constraint_values = ConstraintValuesCache()
+
+
+@receiver(post_save, sender=Constraints)
+@receiver(post_delete, sender=Constraints)
+def constraints_changed(**kwargs):
+    """
+    Clear the cached constraint values whenever a constraint changes.
+    """
+    Constraints.clear_cache()
+    # and again once the change can be seen by others, in case they cached
+    # the old values in the meantime
+    transaction.on_commit(Constraints.clear_cache)
+
+
 class ProductExample(models.Model):
     """
     Examples of items that go into a labeled product.
@@ -1295,4 +1941,122 @@ class Profile(models.Model):
             display += f' pallet ID {self.active_pallet}'
         return display
 
+
+class PrintJob(models.Model):
+    """
+    Label print run built in the background (see fpiweb.print_jobs).
+    """
+
+    class Meta:
+        ordering = ['-date_requested']
+        app_label = 'fpiweb'
+        verbose_name_plural = 'Print Jobs'
+
+    # Print Job Status Names
+    QUEUED: str = 'Queued'
+    RUNNING: str = 'Running'
+    DONE: str = 'Done'
+    FAILED: str = 'Failed'
+
+    STATUS_CHOICES = (
+        (QUEUED, 'Waiting to start'),
+        (RUNNING, 'Building labels'),
+        (DONE, 'Labels ready to download'),
+        (FAILED, 'Labels could not be built'),
+    )
+
+    id_help_text = 'Internal record identifier for a print job.'
+    id = models.AutoField(
+        'Internal Print Job ID',
+        primary_key=True,
+        help_text=id_help_text,
+    )
+    """ Internal record identifier for a print job. """
+
+    starting_number_help_text = 'First box number (as an integer) to print.'
+    starting_number = models.IntegerField(
+        'Starting Box Number',
+        help_text=starting_number_help_text,
+    )
+    """ First box number (as an integer) to print. """
+
+    label_count_help_text = 'Number of labels to print.'
+    label_count = models.IntegerField(
+        'Labels to Print',
+        help_text=label_count_help_text,
+    )
+    """ Number of labels to print. """
+
+    labels_done_help_text = 'Number of labels built so far.'
+    labels_done = models.IntegerField(
+        'Labels Built',
+        default=0,
+        help_text=labels_done_help_text,
+    )
+    """ Number of labels built so far. """
+
+    status_help_text = 'Progress of this print job.'
+    status = models.CharField(
+        'Status',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+        help_text=status_help_text,
+    )
+    """ Progress of this print job. """
+
+    error_message_help_text = 'Why the labels could not be built.'
+    error_message = models.CharField(
+        'Error Message',
+        max_length=255,
+        blank=True,
+        help_text=error_message_help_text,
+    )
+    """ Why the labels could not be built. """
+
+    file_name_help_text = 'Name of the finished PDF in PRINT_JOBS_DIR.'
+    file_name = models.CharField(
+        'File Name',
+        max_length=255,
+        blank=True,
+        help_text=file_name_help_text,
+    )
+    """ Name of the finished PDF in PRINT_JOBS_DIR. """
+
+    requested_by_help_text = 'User who asked for the labels.'
+    requested_by = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        help_text=requested_by_help_text,
+    )
+    """ User who asked for the labels. """
+
+    date_requested_help_text = 'Date and time the labels were asked for.'
+    date_requested = models.DateTimeField(
+        'Date Requested',
+        default=timezone.now,
+        help_text=date_requested_help_text,
+    )
+    """ Date and time the labels were asked for. """
+
+    date_finished_help_text = 'Date and time the job finished or failed.'
+    date_finished = models.DateTimeField(
+        'Date Finished',
+        null=True,
+        blank=True,
+        help_text=date_finished_help_text,
+    )
+    """ Date and time the job finished or failed. """
+
+    def __str__(self) -> str:
+        """ Default way to display a print job. """
+        display = (
+            f'{self.label_count} labels from '
+            f'{BoxNumber.format_box_number(self.starting_number)} '
+            f'({self.status})'
+        )
+        return display
+
 # EOF
@@ -0,0 +1,216 @@
+"""
+print_jobs.py - Build large label PDFs in the background.
+
+PrintLabelsView records a PrintJob and hands it to submit_print_job().  A
+worker thread in the web process builds the PDF into PRINT_JOBS_DIR,
+recording how many labels are done as pages are finished, while the
+browser polls PrintJobStatusView.  The finished PDF can be downloaded any
+time until it is PRINT_JOB_RETENTION_HOURS old, when the file and its
+PrintJob are deleted (see delete_expired_print_jobs and the
+cleanup_print_jobs management command).
+
+A job only lives in the worker threads of the process that took it, so
+one lost to a restart or reload would stay queued or running for ever.
+Jobs not finished within PRINT_JOB_TIMEOUT_MINUTES are marked as failed
+instead (see fail_stale_print_jobs).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from logging import getLogger
+from os.path import dirname, join
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from fpiweb.models import PrintJob
+from fpiweb.qr_code_utilities import QRCodePrinter
+
+__author__ = '(Multiple)'
+__project__ = "Food-Pantry-Inventory"
+__creation_date__ = "10/18/2026"
+
+logger = getLogger('fpiweb')
+
+# seconds between updates of PrintJob.labels_done while a job is running
+PROGRESS_INTERVAL = 1.0
+
+
+def get_print_jobs_dir() -> Path:
+    """
+    Get (creating it if need be) the directory holding finished PDFs.
+
+    :return: path of PRINT_JOBS_DIR
+    """
+    print_jobs_dir = Path(getattr(
+        settings,
+        'PRINT_JOBS_DIR',
+        join(dirname(settings.BASE_DIR), 'print_jobs'),
+    ))
+    print_jobs_dir.mkdir(parents=True, exist_ok=True)
+    return print_jobs_dir
+
+
+def get_print_job_path(print_job: PrintJob) -> Optional[Path]:
+    """
+    :param print_job:
+    :return: path of the finished PDF or None if there isn't one
+    """
+    if not print_job.file_name:
+        return None
+    return get_print_jobs_dir() / print_job.file_name
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def get_print_job_executor() -> ThreadPoolExecutor:
+    """
+    Get the worker thread(s) that run print jobs in this process.
+
+    :return: executor with PRINT_JOB_WORKERS threads
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PRINT_JOB_WORKERS', 1),
+                thread_name_prefix='print-job',
+            )
+        return _executor
+
+
+def submit_print_job(print_job: PrintJob):
+    """
+    Queue a saved PrintJob to be built in the background.
+
+    :param print_job: the job, already saved
+    """
+    delete_expired_print_jobs()
+    fail_stale_print_jobs()
+
+    # start building only once the PrintJob row can be seen by the worker
+    transaction.on_commit(
+        lambda: get_print_job_executor().submit(run_print_job, print_job.pk)
+    )
+    logger.info(f"Print job {print_job.pk} queued: {print_job}")
+
+
+def run_print_job(print_job_pk: int):
+    """
+    Build the PDF for a print job.  Runs in a print job worker thread.
+
+    :param print_job_pk: id of the PrintJob
+    """
+    partial_path = None
+    try:
+        print_job = PrintJob.objects.get(pk=print_job_pk)
+        print_job.status = PrintJob.RUNNING
+        print_job.save(update_fields=['status'])
+
+        file_name = f'labels-{print_job.pk}.pdf'
+        final_path = get_print_jobs_dir() / file_name
+        partial_path = final_path.with_suffix('.part')
+
+        last_update = monotonic()
+
+        def progress(labels_done):
+            nonlocal last_update
+            if monotonic() - last_update < PROGRESS_INTERVAL:
+                return
+            last_update = monotonic()
+            PrintJob.objects.filter(pk=print_job_pk).update(
+                labels_done=labels_done,
+            )
+
+        start = monotonic()
+        with open(partial_path, 'wb') as pdf_out:
+            QRCodePrinter(url_prefix='').print(
+                starting_number=print_job.starting_number,
+                count=print_job.label_count,
+                buffer=pdf_out,
+                progress=progress,
+            )
+        partial_path.replace(final_path)
+
+        PrintJob.objects.filter(pk=print_job_pk).update(
+            status=PrintJob.DONE,
+            labels_done=print_job.label_count,
+            file_name=file_name,
+            date_finished=timezone.now(),
+        )
+        logger.info(
+            f"Print job {print_job_pk} finished in "
+            f"{monotonic() - start:.1f} seconds"
+        )
+    except Exception as error:
+        # anything going wrong must be reported on the job rather than
+        # lost in the worker thread
+        logger.exception(f"Print job {print_job_pk} failed")
+        PrintJob.objects.filter(pk=print_job_pk).update(
+            status=PrintJob.FAILED,
+            error_message=str(error)[:255],
+            date_finished=timezone.now(),
+        )
+        if partial_path is not None and partial_path.exists():
+            partial_path.unlink()
+    finally:
+        # this thread is not part of a request so Django won't close its
+        # database connection
+        connection.close()
+
+
+def delete_expired_print_jobs() -> int:
+    """
+    Delete print jobs, and their PDFs, older than PRINT_JOB_RETENTION_HOURS.
+
+    :return: number of print jobs deleted
+    """
+    retention_hours = getattr(settings, 'PRINT_JOB_RETENTION_HOURS', 24)
+    cutoff = timezone.now() - timedelta(hours=retention_hours)
+
+    expired_jobs = list(PrintJob.objects.filter(date_requested__lt=cutoff))
+    for print_job in expired_jobs:
+        pdf_path = get_print_job_path(print_job)
+        if pdf_path is not None and pdf_path.exists():
+            pdf_path.unlink()
+
+    PrintJob.objects.filter(pk__in=[job.pk for job in expired_jobs]).delete()
+    if expired_jobs:
+        logger.info(f"Deleted {len(expired_jobs)} expired print jobs")
+    return len(expired_jobs)
+
+
+def fail_stale_print_jobs() -> int:
+    """
+    Mark as failed the print jobs queued or running for longer than
+    PRINT_JOB_TIMEOUT_MINUTES, e.g. because the process building them was
+    restarted.
+
+    :return: number of print jobs marked as failed
+    """
+    timeout_minutes = getattr(settings, 'PRINT_JOB_TIMEOUT_MINUTES', 60)
+    cutoff = timezone.now() - timedelta(minutes=timeout_minutes)
+
+    failed = PrintJob.objects.filter(
+        status__in=(PrintJob.QUEUED, PrintJob.RUNNING),
+        date_requested__lt=cutoff,
+    ).update(
+        status=PrintJob.FAILED,
+        error_message=(
+            f'Labels not built within {timeout_minutes} minutes - '
+            f'please print them again'
+        ),
+        date_finished=timezone.now(),
+    )
+    if failed:
+        logger.warning(f"Marked {failed} unfinished print jobs as failed")
+    return failed
+
+# EOF
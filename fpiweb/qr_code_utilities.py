@@ -1,15 +1,32 @@
 
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, InitVar
+from hashlib import sha256
 from io import BytesIO
 from logging import getLogger
+from multiprocessing import get_context
+from os import getpid
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from threading import Lock
+from typing import List, Optional
 
+from django.conf import settings
 from pyqrcode import create as create_qrcode
 
 import qrcode.image.svg
 
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
 
-from fpiweb.models import Box
+from fpiweb.models import BoxNumber
+from fpiweb.qr_drawing import \
+    draw_qr_runs, \
+    get_qr_runs, \
+    pack_qr_runs, \
+    unpack_qr_runs
 
 
 logger = getLogger('fpiweb')
@@ -18,32 +35,402 @@ logger = getLogger('fpiweb')
 factory = qrcode.image.svg.SvgPathImage
 
 
-def get_qr_code_svg(data_string, include_xml_declaration=False):
+class QRArtworkCache:
+    """
+    Content addressed cache of QR code artwork (PNG or SVG bytes) keyed by
+    the encoded text, scale and format, so reprinting labels for the same
+    box numbers doesn't rebuild the QR codes.
+
+    The first tier is a bounded LRU in this process.  The optional second
+    tier is a directory of files, shared by every process, evicting the
+    least recently used files once they total more than disk_max_bytes.
+    """
+
+    def __init__(
+            self,
+            max_entries: int,
+            disk_dir: Optional[str] = None,
+            disk_max_bytes: int = 0):
+        """
+        :param max_entries: number of artworks kept in memory
+        :param disk_dir: directory for the disk tier, None for no disk tier
+        :param disk_max_bytes: total size of the files in the disk tier
+        """
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.disk_dir: Optional[Path] = None
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_bytes: Optional[int] = None
+        if disk_dir:
+            self.disk_dir = Path(disk_dir)
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def get_key(data: str, scale: int, kind: str) -> str:
+        """
+        :param data: text encoded in the QR code
+        :param scale: size of a QR module in the artwork
+        :param kind: format of the artwork, 'png' or 'svg'
+        :return: key of the artwork, also used as its file name
+        """
+        digest = sha256(f'{kind}:{scale}:{data}'.encode('utf-8')).hexdigest()
+        return f'{digest}.{kind}'
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Look up artwork, in memory first and then on disk.
+
+        :param key: from get_key
+        :return: the artwork or None if it isn't cached
+        """
+        with self.lock:
+            artwork = self.entries.get(key)
+            if artwork is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return artwork
+
+        artwork = self._get_from_disk(key)
+        with self.lock:
+            if artwork is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, artwork)
+            return artwork
+
+    def put(self, key: str, artwork: bytes):
+        """
+        Cache artwork in memory and, if there is a disk tier, on disk.
+
+        :param key: from get_key
+        :param artwork: PNG or SVG bytes
+        """
+        with self.lock:
+            self._remember(key, artwork)
+        self._put_on_disk(key, artwork)
+
+    def _remember(self, key: str, artwork: bytes):
+        """ Add to the in memory LRU.  Call with self.lock held. """
+        self.entries[key] = artwork
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _get_from_disk(self, key: str) -> Optional[bytes]:
+        if self.disk_dir is None:
+            return None
+        path = self.disk_dir / key
+        try:
+            artwork = path.read_bytes()
+            # the modification time orders the files for eviction
+            path.touch()
+        except OSError:
+            return None
+        return artwork
+
+    def _put_on_disk(self, key: str, artwork: bytes):
+        if self.disk_dir is None:
+            return
+        path = self.disk_dir / key
+        partial_path = self.disk_dir / f'{key}.{getpid()}.part'
+        try:
+            partial_path.write_bytes(artwork)
+            partial_path.replace(path)
+        except OSError as error:
+            logger.warning(f'Unable to cache QR artwork {key}: {error}')
+            return
+
+        with self.lock:
+            if self.disk_bytes is None:
+                self.disk_bytes = sum(
+                    entry.stat().st_size for entry in self.disk_dir.iterdir())
+            else:
+                self.disk_bytes += len(artwork)
+            if self.disk_bytes > self.disk_max_bytes:
+                self._evict_from_disk()
+
+    def _evict_from_disk(self):
+        """
+        Delete the least recently used files until the disk tier is back
+        to 90% of disk_max_bytes.  Call with self.lock held.
+        """
+        files = []
+        for entry in self.disk_dir.iterdir():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry))
+        files.sort()
+
+        self.disk_bytes = sum(size for mtime, size, entry in files)
+        target_bytes = self.disk_max_bytes * 0.9
+        deleted = 0
+        for mtime, size, entry in files:
+            if self.disk_bytes <= target_bytes:
+                break
+            try:
+                entry.unlink()
+            except OSError:
+                continue
+            self.disk_bytes -= size
+            deleted += 1
+        logger.info(f'Evicted {deleted} QR artwork files from disk cache')
+
+
+_qr_artwork_cache: Optional[QRArtworkCache] = None
+_qr_artwork_cache_lock = Lock()
+
+
+def get_qr_artwork_cache() -> Optional[QRArtworkCache]:
+    """
+    Get the QR artwork cache described in settings.
+
+    :return: the QRArtworkCache, or None if QR_ARTWORK_CACHE_SIZE is zero
+    """
+    global _qr_artwork_cache
+
+    max_entries = getattr(settings, 'QR_ARTWORK_CACHE_SIZE', 0)
+    if not max_entries:
+        return None
+
+    with _qr_artwork_cache_lock:
+        if _qr_artwork_cache is None:
+            _qr_artwork_cache = QRArtworkCache(
+                max_entries=max_entries,
+                disk_dir=getattr(settings, 'QR_ARTWORK_CACHE_DIR', None),
+                disk_max_bytes=getattr(
+                    settings,
+                    'QR_ARTWORK_CACHE_DIR_MAX_BYTES',
+                    50 * 1024 * 1024,
+                ),
+            )
+        return _qr_artwork_cache
+
+
+def make_qr_code_svg(data_string) -> bytes:
+    """
+    Build the SVG of a QR code, including the XML declaration.
+
+    :param data_string: text to encode in the QR code
+    :return: contents of the SVG
+    """
     img = qrcode.make(data_string, image_factory=factory)
 
     with BytesIO() as bytes_out:
         img.save(bytes_out, kind='SVG')
+        return bytes_out.getvalue()
+
+
+def get_qr_code_svg(data_string, include_xml_declaration=False):
+    cache = get_qr_artwork_cache()
+    some_bytes = None
+    if cache is not None:
+        # qrcode's default box_size of 10 is the scale
+        key = cache.get_key(data_string, 10, 'svg')
+        some_bytes = cache.get(key)
+    if some_bytes is None:
+        some_bytes = make_qr_code_svg(data_string)
+        if cache is not None:
+            cache.put(key, some_bytes)
+
+    svg = some_bytes.decode('utf-8')
+
+    if not include_xml_declaration:
+        svg = svg.split('?>\n')[-1]
+    return svg
+
+
+"""
+Label layout, the same as StandaloneTools/QRCodePrinter.py:
+-   letter size paper
+    -   portrait orientation
+-   1/2 inch outer margin on all sides
+-   all measurements in points (1 pt = 1/72 in)
+-   3 labels across
+-   4 labels down
+-   each label has 1/4 in margin on all sides
+-   0, 0 of axis is in lower left corner
+"""
+
+
+@dataclass()
+class Point:
+    """
+    Horizontal (x) and vertical (y) coordinate.
+    """
+    x: int
+    y: int
+
+
+LABEL_SIZE: Point = Point(144, 144)  # 2 in x 2 in
+LABEL_MARGIN: Point = Point(18, 18)  # 1/4 in x 1/4 in
+BACKGROUND_SIZE: Point = Point(
+    LABEL_SIZE.x + (LABEL_MARGIN.x * 2),
+    LABEL_SIZE.y + (LABEL_MARGIN.y * 2))
+PAGE_OFFSET: Point = Point(36, 36)  # 1/2 in x 1/2 in
+TITLE_ADJUSTMENT: Point = Point(+20, -9)
+
+
+@dataclass
+class LabelPosition:
+    """
+    Container for measurements for one label.
+
+    All measurements are in points, origin in the lower left corner.
+    """
+    page_offset: InitVar[Point]
+    lower_left_offset: Point = Point(0, 0)
+    lower_right_offset: Point = Point(0, 0)
+    upper_left_offset: Point = Point(0, 0)
+    upper_right_offset: Point = Point(0, 0)
+    image_start: Point = Point(0, 0)
+    title_start: Point = Point(0, 0)
+
+    def __post_init__(self, page_offset: Point):
+        """
+        Compute the corners, image and title placement of the label.
+
+        :param page_offset: offset (in points) from the lower left corner
+        """
+        self.lower_left_offset = Point(page_offset.x, page_offset.y)
+        self.lower_right_offset = Point(
+            page_offset.x + BACKGROUND_SIZE.x,
+            page_offset.y)
+        self.upper_left_offset = Point(
+            page_offset.x,
+            page_offset.y + BACKGROUND_SIZE.y)
+        self.upper_right_offset = Point(
+            page_offset.x + BACKGROUND_SIZE.x,
+            page_offset.y + BACKGROUND_SIZE.y)
+        self.image_start = Point(
+            self.lower_left_offset.x + LABEL_MARGIN.x,
+            self.lower_left_offset.y + LABEL_MARGIN.y)
+        self.title_start = Point(
+            self.upper_left_offset.x + (LABEL_SIZE.x // 2),
+            self.upper_left_offset.y - LABEL_MARGIN.y)
+
+
+def compute_label_locations() -> List[LabelPosition]:
+    """
+    Compute the position of each label on a page, top left to bottom right.
+
+    :return: list of label positions
+    """
+    label_locations = list()
+    vertical_start = (BACKGROUND_SIZE.y * 3) + PAGE_OFFSET.y
+    horizontal_stop = (BACKGROUND_SIZE.x * 3) + PAGE_OFFSET.x - 1
+    for vertical_position in range(vertical_start, -1, -BACKGROUND_SIZE.y):
+        for horizontal_position in range(
+                PAGE_OFFSET.x,
+                horizontal_stop,
+                BACKGROUND_SIZE.x):
+            label_locations.append(
+                LabelPosition(Point(horizontal_position, vertical_position))
+            )
+    return label_locations
+
 
-        some_bytes = bytes_out.getvalue()
-        svg = some_bytes.decode('utf-8')
+def make_qr_png(url: str, scale: int = 5) -> bytes:
+    """
+    Build the PNG of the QR code for one label.
 
-        if not include_xml_declaration:
-            svg = svg.split('?>\n')[-1]
-        return svg
+    Module level so it can be run in a worker process.
+
+    :param url: text to encode in the QR code
+    :param scale: pixels per QR module
+    :return: contents of the PNG
+    """
+    qr = create_qrcode(url)
+    with BytesIO() as png_out:
+        qr.png(png_out, scale=scale)
+        return png_out.getvalue()
+
+
+def make_qr_artwork(url: str, scale: int, kind: str) -> bytes:
+    """
+    Build the QR artwork for one label.
+
+    Module level so it can be run in a worker process.
+
+    :param url: text to encode in the QR code
+    :param scale: pixels per QR module (for a PNG)
+    :param kind: 'png' for an image, 'runs' for packed QR code runs to
+        draw as vector shapes
+    :return: the artwork
+    """
+    if kind == 'runs':
+        return pack_qr_runs(get_qr_runs(url))
+    return make_qr_png(url, scale)
+
+
+class LabelPdfSpool(SpooledTemporaryFile):
+    """
+    Temporary file to build a label PDF in - kept in memory up to
+    LABEL_PDF_SPOOL_BYTES, then moved to disk.
+    """
+
+    def __init__(self):
+        super().__init__(
+            max_size=getattr(settings, 'LABEL_PDF_SPOOL_BYTES', 1024 * 1024),
+        )
+
+    @property
+    def name(self) -> str:
+        # reportlab names the PDF after the file it is saved into, and
+        # fails on the None a file still held in memory has for a name
+        return super().name or ''
 
 
 class QRCodePrinter(object):
 
-    def __init__(self, url_prefix):
+    def __init__(
+            self,
+            url_prefix,
+            workers: Optional[int] = None,
+            vector: Optional[bool] = None):
+        """
+        :param url_prefix: text in front of the box number in each QR code
+        :param workers: processes generating QR code artwork, defaults to
+            the LABEL_PRINT_WORKERS setting (0 = generate it one at a time)
+        :param vector: draw the QR codes as vector shapes rather than
+            placing an image for each, defaults to the LABEL_PRINT_VECTOR
+            setting
+        """
 
         self.url_prefix = url_prefix
 
-        self.pdf: Canvas
+        if workers is None:
+            workers = getattr(settings, 'LABEL_PRINT_WORKERS', 0)
+        self.workers: int = workers
+        self.parallel_min: int = getattr(
+            settings, 'LABEL_PRINT_PARALLEL_MIN', 100)
+
+        # pixels per QR module in the label images
+        self.scale: int = 5
+
+        if vector is None:
+            vector = getattr(settings, 'LABEL_PRINT_VECTOR', False)
+        self.vector: bool = vector
+
+        self.pdf: Canvas = None
 
         width, height = letter
         self.width: int = width
         self.height: int = height
-        self.next_pos = 0
+
+        self.label_locations: List[LabelPosition] = compute_label_locations()
+
+        # set this to the last position in the list to force a new page
+        self.next_pos = len(self.label_locations)
+
+        # use the page number to control first page handling
+        self.page_number: int = 0
 
     def initialize_pdf_file(self, buffer):
         """
@@ -53,22 +440,18 @@ class QRCodePrinter(object):
             File-like object
 
         """
-        self.pdf: Canvas(buffer, pagesize=letter)
+        self.pdf = Canvas(buffer, pagesize=letter)
 
     @staticmethod
     def get_box_numbers(start, count) -> (str, int):
-        next_box_number = start
-        available_count = 0
-        while available_count < count:
-            box_label = f'BOX{next_box_number:05}'
-            logger.debug(f'Attempting to get {box_label}')
-            if Box.objects.filter(box_number=box_label).exists():
-                next_box_number += 1
-                continue
-            available_count += 1
+        # the caller has already reserved these from the box number
+        # allocator (see PrintLabelsView)
+        for box_label, box_number in BoxNumber.get_free_box_numbers(
+            start,
+            count
+        ):
             logger.debug(f'{box_label} not found - using for label')
-            yield box_label, next_box_number
-            next_box_number += 1
+            yield box_label, box_number
 
     def get_next_box_url(self, starting_number, count) -> (str, str):
         """
@@ -83,43 +466,211 @@ class QRCodePrinter(object):
             url = f"{self.url_prefix}{box_number:05}"
             yield url, label
 
-    def get_next_qr_img(self, starting_number, count) -> (str, str):
+    def get_artwork_kind(self) -> str:
         """
-        Build the QR image for the next box label.
+        :return: kind of QR artwork the labels are built from - 'runs' to
+            draw vector QR codes, 'png' to place an image of each
+        """
+        return 'runs' if self.vector else 'png'
+
+    def load_artwork(self, artwork: bytes):
+        """
+        Turn QR artwork from make_qr_artwork (or the cache) into what
+        place_label needs.
 
-        :return: a QR code image ready to print
+        :param artwork: PNG, or packed runs for vector QR codes
+        :return: an ImageReader, or the QR code runs
         """
+        if self.vector:
+            return unpack_qr_runs(artwork)
+        return ImageReader(BytesIO(artwork))
+
+    def get_next_qr_img(self, starting_number, count):
+        """
+        Build the QR artwork for the next box label.
+
+        Vector labels get the runs of dark modules to draw, others a QR
+        image.  Either is built in memory - nothing is written to disk -
+        and taken from the QR artwork cache when it is there.
+
+        :return: an ImageReader or QR code runs, and the box number
+        """
+        if self.workers and count >= self.parallel_min:
+            yield from self.get_qr_imgs_in_parallel(starting_number, count)
+            return
+
+        cache = get_qr_artwork_cache()
+        kind = self.get_artwork_kind()
         for url, label in self.get_next_box_url(starting_number, count):
-            label_file_name = f'{label}.png'
-            qr = create_qrcode(url)
-            qr.png(label_file_name, scale=5)
-            yield label_file_name, label
+            artwork = None
+            if cache is not None:
+                key = cache.get_key(url, self.scale, kind)
+                artwork = cache.get(key)
+            if artwork is None:
+                artwork = make_qr_artwork(url, self.scale, kind)
+                if cache is not None:
+                    cache.put(key, artwork)
+            yield self.load_artwork(artwork), label
+
+    def get_qr_imgs_in_parallel(self, starting_number, count):
+        """
+        Build the QR artwork for all the labels in worker processes.
 
-    def fill_pdf_pages(self, starting_number, count):
+        The artwork comes back in label order so the pages are laid out
+        exactly as they are when it is built one label at a time.
+
+        :return: ImageReaders or QR code runs, and the box numbers
+        """
+        cache = get_qr_artwork_cache()
+        kind = self.get_artwork_kind()
+        urls, labels, keys, cached_artwork = [], [], [], []
+        for url, label in self.get_next_box_url(starting_number, count):
+            urls.append(url)
+            labels.append(label)
+            if cache is not None:
+                key = cache.get_key(url, self.scale, kind)
+                keys.append(key)
+                cached_artwork.append(cache.get(key))
+            else:
+                keys.append(None)
+                cached_artwork.append(None)
+
+        # only the QR codes not found in the cache go to the workers
+        missing_urls = [
+            url for url, artwork in zip(urls, cached_artwork)
+            if artwork is None
+        ]
+
+        # several labels per task keeps the pickling overhead down
+        chunksize = max(1, len(missing_urls) // (self.workers * 4))
+        logger.info(
+            f'Generating {len(missing_urls)} QR codes '
+            f'({len(urls) - len(missing_urls)} cached) '
+            f'in {self.workers} processes'
+        )
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_context('fork'),
+        ) as executor:
+            new_artwork = executor.map(
+                make_qr_artwork,
+                missing_urls,
+                [self.scale] * len(missing_urls),
+                [kind] * len(missing_urls),
+                chunksize=chunksize,
+            )
+            for label, key, artwork in zip(labels, keys, cached_artwork):
+                if artwork is None:
+                    artwork = next(new_artwork)
+                    if cache is not None:
+                        cache.put(key, artwork)
+                yield self.load_artwork(artwork), label
+
+    def fill_pdf_pages(self, starting_number, count, progress=None):
+        """
+        Fill one or more pages with labels.
+
+        :param progress: optional callable given the number of labels done
+            after each label is placed
+        """
         # # draw lines around the boxes that will be filled with labels
         # self.draw_boxes_on_page()
         # # self.pdf.setFillColorRGB(1, 0, 1)
         # # self.pdf.rect(2*inch, 2*inch, 2*inch, 2*inch, fill=1)
-        for label_file, label_name in self.get_next_qr_img(
-            starting_number,
-            count
-        ):
-            logger.debug(f'Got {label_file}')
+        label_art = self.get_next_qr_img(starting_number, count)
+
+        labels_done = 0
+        for label_image, label_name in label_art:
+            logger.debug(f'Got {label_name}')
             if self.next_pos >= len(self.label_locations) - 1:
                 self.finish_page()
                 self.next_pos = 0
             else:
                 self.next_pos += 1
             self.draw_bounding_box(self.next_pos)
-            self.place_label(label_file, label_name, self.next_pos)
+            self.place_label(label_image, label_name, self.next_pos)
+            labels_done += 1
+            if progress is not None:
+                progress(labels_done)
         self.finish_page()
 
-    @staticmethod
-    def finalize_pdf_file():
-        pass
+    def place_label(self, label_image, label_name: str, pos: int):
+        """
+        Place the label in the appropriate location on the page.
+
+        :param label_image: QR code image (ImageReader), or the QR code
+            runs when drawing vector QR codes
+        :param label_name: box number to print above the QR code
+        :param pos: position in the label locations list
+        """
+        box_info = self.label_locations[pos]
+
+        # place QR code on page
+        if self.vector:
+            draw_qr_runs(
+                self.pdf,
+                label_image,
+                box_info.image_start.x,
+                box_info.image_start.y,
+                LABEL_SIZE.x,
+            )
+        else:
+            self.pdf.drawImage(
+                label_image,
+                box_info.image_start.x,
+                box_info.image_start.y,
+                LABEL_SIZE.x,
+                LABEL_SIZE.y,
+            )
+
+        # place title above image
+        self.pdf.setFont('Helvetica-Bold', 12)
+        self.pdf.drawCentredString(
+            box_info.title_start.x + TITLE_ADJUSTMENT.x,
+            box_info.title_start.y + TITLE_ADJUSTMENT.y,
+            label_name
+        )
+
+    def finish_page(self):
+        """
+        Finish off the previous page before starting a new one
+        """
+        if self.page_number > 0:
+            self.pdf.showPage()
+        self.page_number += 1
+
+    def draw_bounding_box(self, label_pos: int):
+        """
+        Draw a bounding box around the specified label.
+
+        :param label_pos: position in the labels locations list.
+        """
+        box_info = self.label_locations[label_pos]
+        self.pdf.line(box_info.upper_left_offset.x,
+                      box_info.upper_left_offset.y,
+                      box_info.upper_right_offset.x,
+                      box_info.upper_right_offset.y)
+        self.pdf.line(box_info.upper_right_offset.x,
+                      box_info.upper_right_offset.y,
+                      box_info.lower_right_offset.x,
+                      box_info.lower_right_offset.y)
+        self.pdf.line(box_info.lower_right_offset.x,
+                      box_info.lower_right_offset.y,
+                      box_info.lower_left_offset.x,
+                      box_info.lower_left_offset.y)
+        self.pdf.line(box_info.lower_left_offset.x,
+                      box_info.lower_left_offset.y,
+                      box_info.upper_left_offset.x,
+                      box_info.upper_left_offset.y)
+
+    def finalize_pdf_file(self):
+        """
+        All pages have been generated so flush all buffers and close.
+        """
+        self.pdf.save()
 
-    def print(self, starting_number, count, buffer):
+    def print(self, starting_number, count, buffer, progress=None):
         self.initialize_pdf_file(buffer)
-        self.fill_pdf_pages(starting_number, count)
+        self.fill_pdf_pages(starting_number, count, progress)
         self.finalize_pdf_file()
 
@@ -0,0 +1,140 @@
+"""
+qr_drawing.py - Draw QR codes as vector shapes on a reportlab canvas.
+
+Used by both fpiweb.qr_code_utilities.QRCodePrinter and
+StandaloneTools/QRCodePrinter.py, so nothing here may depend on Django.
+
+Each row of the QR matrix is drawn as filled rectangles, one per run of
+adjacent dark modules, all in a single path.  Compared with placing a
+PNG per label this keeps the PDF small, needs no image encoding, and
+prints sharp at any size.
+"""
+from array import array
+from typing import List, Tuple
+
+from pyqrcode import create as create_qrcode
+from reportlab.pdfgen.canvas import Canvas
+
+__author__ = '(Multiple)'
+__project__ = "Food-Pantry-Inventory"
+__creation_date__ = "10/18/2026"
+
+# light modules around the code, the same as pyqrcode puts around a PNG
+QUIET_ZONE = 4
+
+# what draw_qr_runs draws: the number of modules on a side (no quiet zone)
+# and the dark runs from get_dark_runs
+QRRuns = Tuple[int, List[Tuple[int, int, int]]]
+
+
+def get_qr_matrix(data: str) -> List[List[int]]:
+    """
+    Build the QR code matrix for some text.
+
+    :param data: text to encode
+    :return: rows of modules, 1 for dark and 0 for light (no quiet zone)
+    """
+    return create_qrcode(data).code
+
+
+def get_dark_runs(matrix: List[List[int]]) -> List[Tuple[int, int, int]]:
+    """
+    Merge the dark modules of each row into runs.
+
+    :param matrix: rows of modules from get_qr_matrix
+    :return: list of (row, first column, length) of each run
+    """
+    runs = []
+    for row_number, row in enumerate(matrix):
+        run_start = None
+        for column_number, module in enumerate(row):
+            if module and run_start is None:
+                run_start = column_number
+            elif not module and run_start is not None:
+                runs.append((row_number, run_start, column_number - run_start))
+                run_start = None
+        if run_start is not None:
+            runs.append((row_number, run_start, len(row) - run_start))
+    return runs
+
+
+def get_qr_runs(data: str) -> QRRuns:
+    """
+    Build what draw_qr_runs needs to draw the QR code for some text.
+
+    :param data: text to encode
+    :return: modules on a side and dark runs
+    """
+    matrix = get_qr_matrix(data)
+    return len(matrix), get_dark_runs(matrix)
+
+
+def pack_qr_runs(qr_runs: QRRuns) -> bytes:
+    """
+    :param qr_runs: from get_qr_runs
+    :return: the runs as bytes, e.g. to cache or pass between processes
+    """
+    module_count, runs = qr_runs
+    values = array('H', [module_count])
+    for run in runs:
+        values.extend(run)
+    return values.tobytes()
+
+
+def unpack_qr_runs(packed: bytes) -> QRRuns:
+    """
+    :param packed: from pack_qr_runs
+    :return: modules on a side and dark runs
+    """
+    values = array('H')
+    values.frombytes(packed)
+    return values[0], [
+        tuple(values[position:position + 3])
+        for position in range(1, len(values), 3)
+    ]
+
+
+def draw_qr_code(pdf: Canvas, data: str, x: float, y: float, size: float):
+    """
+    Draw a QR code, quiet zone included, as vector shapes on a canvas.
+
+    :param pdf: canvas to draw on
+    :param data: text to encode
+    :param x: left edge (in points) of the QR code
+    :param y: bottom edge (in points) of the QR code
+    :param size: width and height (in points) of the QR code
+    """
+    draw_qr_runs(pdf, get_qr_runs(data), x, y, size)
+
+
+def draw_qr_runs(pdf: Canvas, qr_runs: QRRuns, x: float, y: float,
+                 size: float):
+    """
+    Draw a QR code already reduced to runs (see get_qr_runs).
+
+    :param pdf: canvas to draw on
+    :param qr_runs: modules on a side and dark runs
+    :param x: left edge (in points) of the QR code
+    :param y: bottom edge (in points) of the QR code
+    :param size: width and height (in points) of the QR code
+    """
+    module_count, runs = qr_runs
+    module_size = size / (module_count + (QUIET_ZONE * 2))
+    left = x + (QUIET_ZONE * module_size)
+    top = y + size - (QUIET_ZONE * module_size)
+
+    path = pdf.beginPath()
+    for row_number, column_number, length in runs:
+        path.rect(
+            left + (column_number * module_size),
+            top - ((row_number + 1) * module_size),
+            length * module_size,
+            module_size,
+        )
+
+    pdf.saveState()
+    pdf.setFillColorRGB(0, 0, 0)
+    pdf.drawPath(path, stroke=0, fill=1)
+    pdf.restoreState()
+
+# EOF
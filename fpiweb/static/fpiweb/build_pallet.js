@@ -5,7 +5,7 @@ let buildPallet = {
     scanABoxRow: null,
     totalFormsField: null,
 
-    getNextAvailableBoxFormId: function()
+    getBoxFormIdsInUse: function()
     {
         // text input holds the box number
         let rows = buildPallet.tbody.find("tr");
@@ -40,13 +40,7 @@ let buildPallet = {
 
             idsInUse.add(id);
         }
-
-        let j = 0;
-        while(idsInUse.has(j))
-        {
-            j++;
-        }
-        return j;
+        return idsInUse;
     },
 
     scanErrorHandler: function(jqXHR, textStatus, errorThrown)
@@ -55,26 +49,41 @@ let buildPallet = {
         alert(jqXHR.responseText);
     },
 
-    scanRequest: function(scanData, boxNumber, callback)
+    scanRequest: function(scanImage, boxNumber, callback, scanSource, attempt=1)
     {
-        let nextFormId = buildPallet.getNextAvailableBoxFormId();
-        let prefix = `box_forms-${nextFormId}`;
+        // boxNumber may hold several box numbers separated by commas and the
+        // scan may show several labels, so all the boxes are sent in one
+        // request and a row comes back for each of them
+        let formIdsInUse = Array.from(buildPallet.getBoxFormIdsInUse());
         let palletPk = $('#id_pallet-pallet').val();
 
-        if(boxNumber !== '')
-            scanData = '';
-
-        $.post(
-            '/fpiweb/box/box_form/',
-            {
-                scanData: scanData,
-                boxNumber: boxNumber,
-                prefix: prefix,
-                palletPk: palletPk,
-            },
-            callback,
-            'html'
-        ).fail(buildPallet.scanErrorHandler);
+        // When the browser could not decode the QR codes the scan goes up
+        // as a binary file field rather than a base64 data URI
+        let formData = new FormData();
+        if(boxNumber === '' && scanImage)
+            formData.append('scanFile', scanImage, 'scan.png');
+        formData.append('boxNumbers', boxNumber);
+        formData.append('scanSource', scanSource);
+        formData.append('prefix', 'box_forms');
+        formData.append('formIdsInUse', formIdsInUse.join(','));
+        formData.append('palletPk', palletPk);
+
+        $.ajax({
+            url: '/fpiweb/box/box_forms/',
+            type: 'POST',
+            data: formData,
+            processData: false,
+            contentType: false,
+            dataType: 'html',
+            success: callback,
+        }).fail(function(jqXHR, textStatus, errorThrown) {
+            let retry = function() {
+                buildPallet.scanRequest(
+                    scanImage, boxNumber, callback, scanSource, attempt + 1);
+            };
+            if(!scanner.retryIfBusy(jqXHR, attempt, retry))
+                buildPallet.scanErrorHandler(jqXHR, textStatus, errorThrown);
+        });
     },
 
     scanCallback: function(data, textStatus, jqXHR)
@@ -91,20 +100,23 @@ let buildPallet = {
         // a message prompting the user to scan a Box.
         buildPallet.scanABoxRow.hide();
 
+        let rows = $(data).filter('tr.boxItemFormRow');
         let totalForms = buildPallet.totalFormsField.val();
         totalForms =  Number.parseInt(totalForms);
-        totalForms++;
+        totalForms += rows.length;
 
-        buildPallet.tbody.prepend(data);
+        buildPallet.tbody.prepend(rows);
         buildPallet.totalFormsField.val(totalForms);
 
         let boxFormRows = $('tr.boxItemFormRow');
         let rowCount = boxFormRows.length;
         console.debug(`There are ${rowCount} boxItemFormRows`);
-        if(rowCount >= 2)
+        // Work up from the oldest new row so every new row picks up the
+        // values of the row scanned before it
+        for(let i = Math.min(rows.length, rowCount - 1) - 1; i >= 0; i--)
         {
-            let currentRow = $(boxFormRows[0]);
-            let priorRow = $(boxFormRows[1]);
+            let currentRow = $(boxFormRows[i]);
+            let priorRow = $(boxFormRows[i + 1]);
             buildPallet.defaultToPriorRowValues(priorRow, currentRow);
         }
 
@@ -161,6 +173,9 @@ let buildPallet = {
 
         $('button.remove').click(buildPallet.removeBox);
 
+        // one scan may add every box on the pallet
+        scanner.multipleBoxes = true;
+
         // scanner setup will attach a click event handler to element
         // with an ID of scanButton
         scanner.setup(
@@ -3,6 +3,18 @@ let scanner = {
     video: document.getElementById('video'),
     callback: null,
     requestMethod: null,
+    barcodeDetector: null,
+
+    // Tells the server how the box number of a scan was found
+    SCAN_SOURCE_CLIENT: 'client',
+    SCAN_SOURCE_KEYED: 'keyed',
+    SCAN_SOURCE_SERVER: 'server',
+
+    boxNumberRegex: /box\d{5}/i,
+
+    // Set by pages (e.g. Build Pallet) whose requestMethod accepts several
+    // box numbers, separated by commas, from one scan
+    multipleBoxes: false,
 
     logError: function(err)
     {
@@ -24,6 +36,8 @@ let scanner = {
 
         $.ajaxSetup({beforeSend: beforeSend});
 
+        scanner.setupBarcodeDetector();
+
         scanner.callback = callback;
         if(requestMethod){
             scanner.requestMethod = requestMethod;
@@ -34,6 +48,52 @@ let scanner = {
         $('#scanButton').click(scanner.scan);
     },
 
+    setupBarcodeDetector: function()
+    {
+        // Use the browser's own QR code decoder when it has one, so only the
+        // box number needs to be sent to the server.
+        if(!('BarcodeDetector' in window))
+            return;
+
+        BarcodeDetector.getSupportedFormats()
+            .then(function(formats) {
+                if(formats.includes('qr_code'))
+                    scanner.barcodeDetector = new BarcodeDetector(
+                        {formats: ['qr_code']});
+            })
+            .catch(scanner.logError);
+    },
+
+    decodeInBrowser: function(canvas)
+    {
+        // Resolves to the box number in the QR code (or, with multipleBoxes,
+        // the box numbers of all the QR codes separated by commas), or null
+        // if the browser can't decode it (the image is then sent to the
+        // server instead).
+        if(!scanner.barcodeDetector)
+            return Promise.resolve(null);
+
+        return scanner.barcodeDetector.detect(canvas)
+            .then(function(barcodes) {
+                let boxNumbers = [];
+                for(let barcode of barcodes) {
+                    let match = scanner.boxNumberRegex.exec(barcode.rawValue);
+                    if(!match)
+                        continue;
+                    let boxNumber = match[0].toUpperCase();
+                    if(!scanner.multipleBoxes)
+                        return boxNumber;
+                    if(!boxNumbers.includes(boxNumber))
+                        boxNumbers.push(boxNumber);
+                }
+                return boxNumbers.length ? boxNumbers.join(',') : null;
+            })
+            .catch(function(err) {
+                scanner.logError(err);
+                return null;
+            });
+    },
+
     defaultRequestFailed: function(jqXHR, textStatus, errorThrown)
     {
         let error = jqXHR.responseText;
@@ -41,16 +101,44 @@ let scanner = {
         alert(error)
     },
 
-    defaultRequestMethod: function(scanData, boxNumber, callback)
+    // How many times to resubmit a scan the server was too busy to decode
+    maxBusyRetries: 3,
+
+    retryIfBusy: function(jqXHR, attempt, retry)
     {
-        $.post(
-            '/fpiweb/scanner/',
-            {
-                'scanData': scanData,
-                'boxNumber': boxNumber,
-            },
-            callback,
-        ).fail(scanner.defaultRequestFailed);
+        // The server answers 503 with a Retry-After header when all of its
+        // decoders are busy.  Returns true if the request will be retried.
+        if(jqXHR.status !== 503 || attempt > scanner.maxBusyRetries)
+            return false;
+
+        let seconds = Number.parseInt(jqXHR.getResponseHeader('Retry-After'));
+        if(Number.isNaN(seconds))
+            seconds = 1;
+        console.log(`scanner busy, retry ${attempt} in ${seconds} second(s)`);
+        setTimeout(retry, seconds * 1000);
+        return true;
+    },
+
+    defaultRequestMethod: function(
+        scanImage, boxNumber, callback, scanSource, attempt=1)
+    {
+        // Send the PNG itself as the request body (no base64 data URI)
+        let params = $.param({boxNumber: boxNumber, scanSource: scanSource});
+        $.ajax({
+            url: '/fpiweb/scanner/upload/?' + params,
+            type: 'POST',
+            data: scanImage || '',
+            processData: false,
+            contentType: 'application/octet-stream',
+            success: callback,
+        }).fail(function(jqXHR, textStatus, errorThrown) {
+            let retry = function() {
+                scanner.defaultRequestMethod(
+                    scanImage, boxNumber, callback, scanSource, attempt + 1);
+            };
+            if(!scanner.retryIfBusy(jqXHR, attempt, retry))
+                scanner.defaultRequestFailed(jqXHR, textStatus, errorThrown);
+        });
     },
 
     scan: function(event)
@@ -72,15 +160,41 @@ let scanner = {
             scanner.video.clientHeight
         );
 
-        let scanData = canvas.toDataURL('image/png');
-        let dataLength = Number(scanData.length).toLocaleString();
-        console.log(`scanData is ${dataLength} characters in length`);
-
         let boxNumberField = document.getElementById('boxNumber')
         let boxNumber = boxNumberField.value;
         boxNumberField.value = '';
 
-        scanner.requestMethod(scanData, boxNumber, scanner.callback);
+        if(boxNumber) {
+            scanner.requestMethod(
+                null, boxNumber, scanner.callback, scanner.SCAN_SOURCE_KEYED);
+            return;
+        }
+
+        scanner.decodeInBrowser(canvas).then(function(decodedBoxNumber) {
+            if(decodedBoxNumber) {
+                console.log(`decoded ${decodedBoxNumber} in the browser`);
+                scanner.requestMethod(
+                    null,
+                    decodedBoxNumber,
+                    scanner.callback,
+                    scanner.SCAN_SOURCE_CLIENT
+                );
+                return;
+            }
+
+            // fall back to decoding the image on the server
+            canvas.toBlob(function(scanImage) {
+                let dataLength = Number(scanImage.size).toLocaleString();
+                console.log(`scanImage is ${dataLength} bytes in length`);
+
+                scanner.requestMethod(
+                    scanImage,
+                    '',
+                    scanner.callback,
+                    scanner.SCAN_SOURCE_SERVER
+                );
+            }, 'image/png');
+        });
     },
 
     hideModal: function()
@@ -0,0 +1,297 @@
+"""
+ActivityRollup.py - Keep daily activity totals for statistics.
+
+Each ActivityRollup holds the totals for one day, product and location:
+boxes filled and consumed, their quantities, and how long the consumed
+boxes were in inventory.  BoxActivityClass records every activity record
+it adds, consumes or moves here, in the same transaction, so the rollups
+always agree with the activity records.  Migration 0034 totals the
+activity recorded before the rollups existed, and the
+rebuild_activity_rollups management command rebuilds them from scratch.
+
+Fills are counted on the day a box was filled, and consumptions on the
+day it was consumed, both at the location last recorded in the activity
+record.  Moving a box therefore moves its fill to the new location.
+"""
+from dataclasses import dataclass, fields
+from datetime import date
+from logging import getLogger
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least, TruncMonth
+
+from fpiweb.models import \
+    Activity, \
+    ActivityRollup
+from fpiweb.support.TableLock import lock_table
+
+__author__ = '(Multiple)'
+__project__ = "Food-Pantry-Inventory"
+__creation_date__ = "10/18/2026"
+
+logger = getLogger('fpiweb')
+
+
+class RollupKey(NamedTuple):
+    """
+    Identifies an ActivityRollup.
+    """
+    rollup_date: date
+    prod_name: str
+    prod_cat_name: str
+    loc_row: str
+    loc_bin: str
+    loc_tier: str
+
+
+@dataclass
+class RollupTotals:
+    """
+    Changes to (or the whole of) the totals of an ActivityRollup.
+    """
+    filled_count: int = 0
+    filled_quantity: int = 0
+    consumed_count: int = 0
+    consumed_quantity: int = 0
+    duration_total: int = 0
+    duration_min: Optional[int] = None
+    duration_max: Optional[int] = None
+
+    def add_fills(self, count: int, quantity: int):
+        self.filled_count += count
+        self.filled_quantity += quantity
+
+    def add_consumptions(self, count: int, quantity: int, duration_total: int,
+                         duration_min: int, duration_max: int):
+        self.consumed_count += count
+        self.consumed_quantity += quantity
+        self.duration_total += duration_total
+        if self.duration_min is None or duration_min < self.duration_min:
+            self.duration_min = duration_min
+        if self.duration_max is None or duration_max > self.duration_max:
+            self.duration_max = duration_max
+
+    def as_fields(self) -> dict:
+        """
+        :return: ActivityRollup field values
+        """
+        return {
+            field.name: getattr(self, field.name) for field in fields(self)
+        }
+
+
+# an activity record being moved, with the location it is moving from
+MovedActivity = Tuple[Activity, Tuple[str, str, str]]
+
+
+class ActivityRollupClass:
+    """
+    ActivityRollupClass - Keep the activity rollups up to date.
+    """
+
+    def record(self,
+               added: Iterable[Activity] = (),
+               consumed: Iterable[Activity] = (),
+               moved: Iterable[MovedActivity] = ()):
+        """
+        Add activity records just written to the rollups.
+
+        :param added: activity records just added
+        :param consumed: activity records just consumed (including any
+            also in added)
+        :param moved: activity records just moved, each with the (row,
+            bin, tier) it was moved from
+        :return:
+        """
+        totals: Dict[RollupKey, RollupTotals] = dict()
+
+        def get_totals(key: RollupKey) -> RollupTotals:
+            return totals.setdefault(key, RollupTotals())
+
+        for activity in added:
+            get_totals(self.get_key(activity, activity.date_filled)) \
+                .add_fills(1, activity.quantity)
+        for activity in consumed:
+            get_totals(self.get_key(activity, activity.date_consumed)) \
+                .add_consumptions(
+                    1,
+                    activity.quantity,
+                    activity.duration,
+                    activity.duration,
+                    activity.duration,
+                )
+        for activity, (loc_row, loc_bin, loc_tier) in moved:
+            new_key = self.get_key(activity, activity.date_filled)
+            old_key = new_key._replace(
+                loc_row=loc_row,
+                loc_bin=loc_bin,
+                loc_tier=loc_tier,
+            )
+            if old_key != new_key:
+                get_totals(old_key).add_fills(-1, -activity.quantity)
+                get_totals(new_key).add_fills(1, activity.quantity)
+
+        with transaction.atomic():
+            # always in the same order so that two transactions can't each
+            # be waiting for a rollup the other has locked
+            for key in sorted(totals):
+                self._apply(key, totals[key])
+        return
+
+    @staticmethod
+    def get_key(activity: Activity, rollup_date: date) -> RollupKey:
+        """
+        :param activity:
+        :param rollup_date: the day the activity is counted on
+        :return: key of the rollup the activity is counted in
+        """
+        return RollupKey(
+            rollup_date=rollup_date,
+            prod_name=activity.prod_name,
+            prod_cat_name=activity.prod_cat_name,
+            loc_row=activity.loc_row,
+            loc_bin=activity.loc_bin,
+            loc_tier=activity.loc_tier,
+        )
+
+    @staticmethod
+    def _apply(key: RollupKey, totals: RollupTotals):
+        """
+        Add changes to the totals of a rollup, creating it if need be.
+
+        :param key:
+        :param totals: changes to the totals
+        :return:
+        """
+        changes = {
+            'filled_count': F('filled_count') + totals.filled_count,
+            'filled_quantity': F('filled_quantity') + totals.filled_quantity,
+            'consumed_count': F('consumed_count') + totals.consumed_count,
+            'consumed_quantity':
+                F('consumed_quantity') + totals.consumed_quantity,
+            'duration_total': F('duration_total') + totals.duration_total,
+        }
+        if totals.consumed_count:
+            duration_min = Value(
+                totals.duration_min, output_field=models.IntegerField())
+            duration_max = Value(
+                totals.duration_max, output_field=models.IntegerField())
+            changes['duration_min'] = Least(
+                Coalesce('duration_min', duration_min), duration_min)
+            changes['duration_max'] = Greatest(
+                Coalesce('duration_max', duration_max), duration_max)
+
+        rollups = ActivityRollup.objects.filter(**key._asdict())
+        if rollups.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                ActivityRollup.objects.create(
+                    **key._asdict(),
+                    **totals.as_fields(),
+                )
+        except IntegrityError:
+            # created by someone else in the meantime
+            rollups.update(**changes)
+        return
+
+    @staticmethod
+    def rebuild() -> int:
+        """
+        Rebuild every rollup from the activity records.
+
+        The rollups are locked while the activity records are read and the
+        rollups replaced, all in one transaction, so activity recorded
+        meanwhile waits and is then added to the new rollups rather than
+        lost or counted twice.
+
+        :return: number of rollups
+        """
+        key_fields = ('prod_name', 'prod_cat_name', 'loc_row', 'loc_bin',
+                      'loc_tier')
+        totals: Dict[RollupKey, RollupTotals] = dict()
+
+        with transaction.atomic():
+            lock_table(ActivityRollup)
+
+            fills = Activity.objects.order_by().values(
+                'date_filled', *key_fields
+            ).annotate(
+                count=Count('id'),
+                quantity=Sum('quantity'),
+            )
+            for fill in fills:
+                key = RollupKey(fill['date_filled'],
+                                *[fill[field] for field in key_fields])
+                totals.setdefault(key, RollupTotals()).add_fills(
+                    fill['count'], fill['quantity'])
+
+            consumptions = Activity.objects.exclude(
+                date_consumed=None
+            ).order_by().values(
+                'date_consumed', *key_fields
+            ).annotate(
+                count=Count('id'),
+                quantity=Sum('quantity'),
+                duration_total=Sum('duration'),
+                duration_min=Min('duration'),
+                duration_max=Max('duration'),
+            )
+            for consumption in consumptions:
+                key = RollupKey(consumption['date_consumed'],
+                                *[consumption[field] for field in key_fields])
+                totals.setdefault(key, RollupTotals()).add_consumptions(
+                    consumption['count'],
+                    consumption['quantity'],
+                    consumption['duration_total'],
+                    consumption['duration_min'],
+                    consumption['duration_max'],
+                )
+
+            ActivityRollup.objects.all().delete()
+            ActivityRollup.objects.bulk_create(
+                (
+                    ActivityRollup(**key._asdict(), **totals[key].as_fields())
+                    for key in sorted(totals)
+                ),
+                batch_size=1000,
+            )
+        logger.info(f'Rebuilt {len(totals)} activity rollups')
+        return len(totals)
+
+    @staticmethod
+    def get_category_shelf_days(date_from: date, date_to: date) -> list:
+        """
+        Get the average days on the shelf of each product category for
+        each month.
+
+        :param date_from: first day of consumptions counted
+        :param date_to: last day of consumptions counted
+        :return: dicts of month (first day of), prod_cat_name,
+            consumed_count and average_days
+        """
+        months = ActivityRollup.objects.filter(
+            rollup_date__gte=date_from,
+            rollup_date__lte=date_to,
+            consumed_count__gt=0,
+        ).annotate(
+            month=TruncMonth('rollup_date'),
+        ).values(
+            'month', 'prod_cat_name',
+        ).annotate(
+            consumed=Sum('consumed_count'),
+            duration=Sum('duration_total'),
+        ).order_by('month', 'prod_cat_name')
+        return [
+            {
+                'month': month['month'],
+                'prod_cat_name': month['prod_cat_name'],
+                'consumed_count': month['consumed'],
+                'average_days': month['duration'] / month['consumed'],
+            }
+            for month in months
+        ]
+
+# EOF
@@ -7,7 +7,7 @@ Error messages from this module are prefixed by 2nn, e.g. "201 - blah blah..."
 from datetime import datetime, date
 from enum import Enum, unique
 from logging import getLogger
-from typing import Optional
+from typing import Dict, List, Optional
 
 from django.db import transaction, IntegrityError
 from django.utils.timezone import now
@@ -24,6 +24,9 @@ from fpiweb.models import \
     LocTier, \
     Product, \
     ProductCategory
+from fpiweb.support.ActivityRollup import \
+    ActivityRollupClass, \
+    MovedActivity
 
 __author__ = 'Travis Risner'
 __project__ = "Food-Pantry-Inventory"
@@ -72,6 +75,7 @@ class BoxActivityClass:
         self.product: Optional[Product] = None
         self.prod_cat: Optional[ProductCategory] = None
         self.activity: Optional[Activity] = None
+        self.rollup = ActivityRollupClass()
 
     def box_new(self, box_id: Box.id):
         """
@@ -243,7 +247,9 @@ class BoxActivityClass:
                         f'filled:{act.date_filled}, '
                         f'Forced to be consumed now'
                     )
-                    act.save()
+                    with transaction.atomic():
+                        act.save()
+                        self.rollup.record(consumed=[act])
             if self.activity:
                 logger.debug(
                     f'Act Box Move: Activity found to move: '
@@ -365,6 +371,320 @@ class BoxActivityClass:
         logger.debug(f'Act Box Empty: done')
         return
 
+    def box_fill_batch(self, boxes: List[Box]):
+        """
+        Record activity for many boxes being filled and added to inventory.
+
+        Records for each box what box_fill records for one, but the open
+        activity records for all the boxes are found with one query and
+        the activity records consumed and added are written in bulk.
+
+        :param boxes: box records already filled in, each loaded with its
+            box type, location (row, bin and tier), product and product
+            category
+        :return:
+        """
+        open_activities = self._get_open_activities(boxes)
+        consumed = list()
+        added = list()
+        for box in boxes:
+            box_activities = open_activities.get(box.box_number)
+            if box_activities:
+                # oops - empty box before filling it again
+                activity = box_activities[0]
+                self._mark_consumed(activity, adjustment=Activity.FILL_EMPTIED)
+                consumed.append(activity)
+            added.append(self._build_activity(box))
+        self._save_activities(
+            updated=consumed,
+            added=added,
+            action='add activities for newly filled boxes',
+        )
+        logger.debug(
+            f'Act Box Fill Batch: {len(boxes)} boxes, '
+            f'{len(consumed)} previous activities consumed'
+        )
+        return
+
+    def box_move_batch(self, boxes: List[Box]):
+        """
+        Record activity for many boxes being moved in the inventory.
+
+        Records for each box what box_move records for one, but the open
+        activity records for all the boxes are found with one query and
+        the activity records updated and added are written in bulk.
+
+        :param boxes: box records already moved, each loaded with its box
+            type, location (row, bin and tier), product and product
+            category
+        :return:
+        """
+        open_activities = self._get_open_activities(boxes)
+        updated = list()
+        added = list()
+        moved = list()
+        for box in boxes:
+            # keep the first matching open activity record and consume all
+            # the others with an adjustment code
+            activity = None
+            for act in open_activities.get(box.box_number, list()):
+                if not activity and self._activity_matches_box(act, box):
+                    activity = act
+                else:
+                    # consume this bogus open activity record now
+                    date_consumed, duration = self.compute_duration_days(
+                        act.date_filled)
+                    act.date_consumed = date_consumed
+                    act.duration = duration
+                    act.adjustment_code = Activity.MOVE_CONSUMED
+                    updated.append(act)
+            if activity:
+                moved.append((
+                    activity,
+                    (activity.loc_row, activity.loc_bin, activity.loc_tier),
+                ))
+                activity.loc_row = box.location.loc_row.loc_row
+                activity.loc_bin = box.location.loc_bin.loc_bin
+                activity.loc_tier = box.location.loc_tier.loc_tier
+                updated.append(activity)
+            else:
+                # box has no open activity record so create one (already
+                # showing the new location)
+                added.append(
+                    self._build_activity(box, adjustment=Activity.MOVE_ADDED)
+                )
+        self._save_activities(
+            updated=updated,
+            added=added,
+            action='update activities by moving boxes',
+            moved=moved,
+        )
+        logger.debug(
+            f'Act Box Move Batch: {len(boxes)} boxes, '
+            f'{len(added)} missing activities added'
+        )
+        return
+
+    def box_empty_batch(self, boxes: List[Box]):
+        """
+        Record activity for many boxes being emptied (consumed).
+
+        Records for each box what box_empty records for one, but the open
+        activity records for all the boxes are found with one query, the
+        activity records consumed and added are written in bulk, and the
+        boxes are cleared out with one bulk update.
+
+        :param boxes: box records still filled in, each loaded with its box
+            type, location (row, bin and tier), product and product
+            category
+        :return:
+        """
+        open_activities = self._get_open_activities(boxes)
+        consumed = list()
+        added = list()
+        for box in boxes:
+            box_activities = open_activities.get(box.box_number)
+            if not box_activities:
+                # oops - box has no open activity record so create one
+                activity = self._build_activity(
+                    box, adjustment=Activity.CONSUME_ADDED)
+                added.append(activity)
+            elif not self._activity_matches_box(activity=box_activities[0],
+                                                box=box,
+                                                compare_location=True):
+                # some sort of mismatch due to the box being emptied and
+                # refilled without notifying the inventory system
+                self._mark_consumed(
+                    box_activities[0], adjustment=Activity.CONSUME_ADDED)
+                consumed.append(box_activities[0])
+                activity = self._build_activity(
+                    box, adjustment=Activity.CONSUME_EMPTIED)
+                added.append(activity)
+            else:
+                # expected
+                activity = box_activities[0]
+                consumed.append(activity)
+            self._mark_consumed(activity)
+
+        with transaction.atomic():
+            self._save_activities(
+                updated=consumed,
+                added=added,
+                action='update activities by consuming boxes',
+            )
+            for box in boxes:
+                box.location = None
+                box.product = None
+                box.exp_year = None
+                box.exp_month_start = None
+                box.exp_month_end = None
+                box.date_filled = None
+                box.quantity = None
+                box.set_exp_date()
+            Box.objects.bulk_update(boxes, fields=[
+                'location',
+                'product',
+                'exp_year',
+                'exp_month_start',
+                'exp_month_end',
+                'exp_date',
+                'date_filled',
+                'quantity',
+            ])
+        logger.debug(
+            f'Act Box Empty Batch: {len(boxes)} boxes, '
+            f'{len(added)} activities added'
+        )
+        return
+
+    @staticmethod
+    def _get_open_activities(boxes: List[Box]) -> Dict[str, List[Activity]]:
+        """
+        Get the open (not yet consumed) activity records for some boxes.
+
+        With good data a box has at most one open activity record and it
+        is the latest activity record for the box.
+
+        :param boxes:
+        :return: open activity records by box number, most recently filled
+            first
+        """
+        open_activities = dict()
+        activities = Activity.objects.filter(
+            box_number__in=[box.box_number for box in boxes],
+            date_consumed=None,
+        ).order_by('box_number', '-date_filled', '-id')
+        for activity in activities:
+            open_activities.setdefault(activity.box_number, list()).append(
+                activity)
+        return open_activities
+
+    @staticmethod
+    def _activity_matches_box(activity: Activity, box: Box,
+                              compare_location: bool = False) -> bool:
+        """
+        Does an open activity record describe the current contents of a box?
+
+        As in box_move, the location is not compared by default because a
+        box being moved has already been given its new location.  As in
+        box_empty, the location is compared instead of the box type when
+        asked.
+
+        :param activity:
+        :param box:
+        :param compare_location: compare the location instead of the box
+            type
+        :return: True if the activity record matches the box
+        """
+        if compare_location:
+            if (
+                    activity.loc_row != box.location.loc_row.loc_row or
+                    activity.loc_bin != box.location.loc_bin.loc_bin or
+                    activity.loc_tier != box.location.loc_tier.loc_tier
+            ):
+                return False
+        elif activity.box_type != box.box_type.box_type_code:
+            return False
+        return (
+            activity.prod_name == box.product.prod_name and
+            activity.date_filled == box.date_filled.date() and
+            activity.exp_year == box.exp_year and
+            activity.exp_month_start == box.exp_month_start and
+            activity.exp_month_end == box.exp_month_end
+        )
+
+    @staticmethod
+    def _build_activity(box: Box, adjustment: str = None) -> Activity:
+        """
+        Build (but do not save) a new activity record based on a box.
+
+        :param box: box loaded with its related records
+        :param adjustment:
+        :return: the unsaved activity record
+        """
+        return Activity(
+            box_number=box.box_number,
+            box_type=box.box_type.box_type_code,
+            loc_row=box.location.loc_row.loc_row,
+            loc_bin=box.location.loc_bin.loc_bin,
+            loc_tier=box.location.loc_tier.loc_tier,
+            prod_name=box.product.prod_name,
+            prod_cat_name=box.product.prod_cat.prod_cat_name,
+            date_filled=box.date_filled.date(),
+            date_consumed=None,
+            duration=0,
+            exp_year=box.exp_year,
+            exp_month_start=box.exp_month_start,
+            exp_month_end=box.exp_month_end,
+            quantity=box.quantity,
+            adjustment_code=adjustment,
+        )
+
+    def _mark_consumed(self, activity: Activity, adjustment: str = None):
+        """
+        Mark (but do not save) an activity record as consumed today.
+
+        :param activity:
+        :param adjustment:
+        :return:
+        """
+        date_consumed, duration = self.compute_duration_days(
+            activity.date_filled)
+        activity.date_consumed = date_consumed
+        activity.duration = duration
+        # if this is not an adjustment, preserve previous entry
+        if not activity.adjustment_code:
+            activity.adjustment_code = adjustment
+        return
+
+    def _save_activities(self, updated: List[Activity],
+                         added: List[Activity], action: str,
+                         moved: List[MovedActivity] = ()):
+        """
+        Write activity records changed or built by a batch method, and
+        add them to the rollups.
+
+        :param updated: existing activity records that were changed
+        :param added: new activity records
+        :param action: what was being attempted, for the error report
+        :param moved: activity records in updated that were moved, each
+            with the location it was moved from
+        :return:
+        """
+        self.box = None
+        self.activity = None
+        # bulk_update doesn't call Activity.save, which notes the change
+        date_changed = now()
+        for activity in updated:
+            activity.date_changed = date_changed
+        try:
+            with transaction.atomic():
+                if updated:
+                    Activity.objects.bulk_update(updated, fields=[
+                        'loc_row',
+                        'loc_bin',
+                        'loc_tier',
+                        'date_consumed',
+                        'duration',
+                        'adjustment_code',
+                        'date_changed',
+                    ])
+                if added:
+                    Activity.objects.bulk_create(added)
+                # the activity records consumed were all open before
+                self.rollup.record(
+                    added=added,
+                    consumed=[
+                        activity for activity in updated + added
+                        if activity.date_consumed
+                    ],
+                    moved=moved,
+                )
+        except IntegrityError as exc:
+            # report an internal error
+            self._report_internal_error(exc, action)
+        return
+
     def _add_activity(self, adjustment: str = None):
         """
         Add a new activity record based on this box.
@@ -374,24 +694,12 @@ class BoxActivityClass:
         """
         try:
             with transaction.atomic():
-                self.activity = Activity(
-                    box_number=self.box.box_number,
-                    box_type=self.box_type.box_type_code,
-                    loc_row=self.loc_row.loc_row,
-                    loc_bin=self.loc_bin.loc_bin,
-                    loc_tier=self.loc_tier.loc_tier,
-                    prod_name=self.product.prod_name,
-                    prod_cat_name=self.prod_cat.prod_cat_name,
-                    date_filled=self.box.date_filled.date(),
-                    date_consumed=None,
-                    duration=0,
-                    exp_year=self.box.exp_year,
-                    exp_month_start=self.box.exp_month_start,
-                    exp_month_end=self.box.exp_month_end,
-                    quantity=self.box.quantity,
-                    adjustment_code=adjustment,
+                self.activity = self._build_activity(
+                    self.box,
+                    adjustment=adjustment,
                 )
                 self.activity.save()
+                self.rollup.record(added=[self.activity])
                 logger.debug(
                     f'Act Box_Add: Just added activity ID: '
                     f'{self.activity.id}'
@@ -412,15 +720,20 @@ class BoxActivityClass:
         """
         try:
             with transaction.atomic():
+                moved_from = (
+                    self.activity.loc_row,
+                    self.activity.loc_bin,
+                    self.activity.loc_tier,
+                )
                 self.activity.loc_row = self.loc_row.loc_row
                 self.activity.loc_bin = self.loc_bin.loc_bin
                 self.activity.loc_tier = self.loc_tier.loc_tier
                 self.activity.save()
+                self.rollup.record(moved=[(self.activity, moved_from)])
                 logger.debug(
                     f'Act Box_Upd: Just updated activity ID: '
                     f'{self.activity.id}'
                 )
-                self.activity.save()
         except IntegrityError as exc:
             # report an internal error
             self._report_internal_error(
@@ -440,14 +753,9 @@ class BoxActivityClass:
         try:
             with transaction.atomic():
                 # update activity record
-                date_consumed, duration = self.compute_duration_days(
-                    self.activity.date_filled)
-                self.activity.date_consumed = date_consumed
-                self.activity.duration = duration
-                # if this is not an adjustment, preserve previous entry
-                if not self.activity.adjustment_code:
-                    self.activity.adjustment_code = adjustment
+                self._mark_consumed(self.activity, adjustment=adjustment)
                 self.activity.save()
+                self.rollup.record(consumed=[self.activity])
                 logger.debug(
                     f'Act Box_Empty: Just consumed activity ID: '
                     f'{self.activity.id}'
@@ -9,7 +9,7 @@ __project__ = "Food-Pantry-Inventory"
 __creation_date__ = "01/11/2020"
 
 # "${Copyright.py}"
-from typing import Optional, Union
+from typing import List, Optional, Tuple, Union
 
 from django.db import transaction
 from django.utils.timezone import now
@@ -28,6 +28,7 @@ from fpiweb.models import \
     BoxNumber, \
     Constraints
 from fpiweb.support.BoxActivity import BoxActivityClass
+from fpiweb.support.OnHandSummary import OnHandSummaryClass
 
 
 class BoxManagementClass:
@@ -49,6 +50,7 @@ class BoxManagementClass:
         self.exp_mo_start: Optional[int] = None
         self.exp_mo_end: Optional[int] = None
         self.activity = BoxActivityClass()
+        self.on_hand = OnHandSummaryClass()
 
     def box_new(self, box_number: str,
                 box_type: Union[str, int, BoxType]) -> Box:
@@ -174,42 +176,13 @@ class BoxManagementClass:
                 raise InvalidValueError(
                     f'113 - Product with ID "{product}" not found')
 
-        # presume the date information is true until proven otherwise
-        expiration_info_valid = True
-
-        years_ahead_list = Constraints.get_values(
-            Constraints.FUTURE_EXP_YEAR_LIMIT)
-        years_ahead = years_ahead_list[0]
-        future_exp_year_limit = CURRENT_YEAR + years_ahead
-        if exp_year < CURRENT_YEAR or exp_year > future_exp_year_limit:
-            expiration_info_valid = False
-        else:
-            self.exp_year = exp_year
-
-        # both valid months or zero or null
-        if (exp_mo_start is None) or exp_mo_start == 0:
-            self.exp_mo_start = 0
-        elif 1 <= exp_mo_start <= 12:
-            self.exp_mo_start = exp_mo_start
-        else:
-            expiration_info_valid = False
-
-        if (exp_mo_end is None) or exp_mo_end == 0:
-            self.exp_mo_end = 0
-        elif 1 <= exp_mo_end <= 12:
-            self.exp_mo_end = exp_mo_end
-        else:
-            expiration_info_valid = False
-
-        # end must be greater than or equal to start
-        if self.exp_mo_end < self.exp_mo_start:
-            expiration_info_valid = False
-
-        # did it pass the gauntlet?
-        if not expiration_info_valid:
-            raise InvalidValueError(
-                f'114 - Expiration date information of {exp_mo_start} -'
-                f' {exp_mo_end} - {exp_year} was not valid')
+        self.exp_year, self.exp_mo_start, self.exp_mo_end = \
+            self._validate_expiration(
+                exp_year,
+                exp_mo_start,
+                exp_mo_end,
+                self._get_future_exp_year_limit(),
+            )
         self._fill_box()
         return self.box
 
@@ -295,11 +268,78 @@ class BoxManagementClass:
         self._consume_box()
         return self.box
 
+    def box_move_batch(self, boxes: List[Union[Box, int]],
+                       location: Union[Location, int]) -> List[Box]:
+        """
+        Move many boxes to one location in the inventory.  Does for each
+        box what box_move does for one, with a handful of queries in all.
+
+        Exceptions:
+
+            121 - Box not in system
+
+            122 - Cannot move an empty box
+
+            123 - Location is not valid
+
+        :param boxes: box records or IDs
+        :param location: Target location record or ID
+        :return: the box records after modifications
+        """
+        if type(location) == Location:
+            location = location.pk
+        try:
+            self.location = Location.objects.select_related(
+                'loc_row',
+                'loc_bin',
+                'loc_tier',
+            ).get(pk=location)
+        except Location.DoesNotExist:
+            raise InvalidValueError(
+                f'123 - Location with ID "{location}" not found')
+        box_recs = self._get_boxes(boxes, 121, 'move')
+        for box in box_recs:
+            if not box.product:
+                raise InvalidActionAttemptedError(
+                    f'122 - Attempting to move an empty box')
+        self._move_boxes(box_recs, self.location)
+        return box_recs
+
+    def box_consume_batch(self, boxes: List[Union[Box, int]]) -> List[Box]:
+        """
+        Consume (e.g. empty) many boxes.  Does for each box what
+        box_consume does for one, with a handful of queries in all.
+
+        Exception:
+
+            131 - Box not in system
+
+            132 - A box was already empty
+
+        :param boxes: box records or IDs
+        :return: the box records freshly emptied
+        """
+        box_recs = self._get_boxes(boxes, 131, 'consume')
+        for box in box_recs:
+            if not box.product:
+                raise InvalidActionAttemptedError(
+                    f'132 - Attempting to consume the contents of an empty '
+                    f'box')
+        with transaction.atomic():
+            removed = self.on_hand.lock_entries(box.pk for box in box_recs)
+            self.activity.box_empty_batch(box_recs)
+            self.on_hand.record(removed=removed)
+        return box_recs
+
     def pallet_finish(self, pallet: Union[Pallet, int, str]):
         """
         Finish the processing of a pallet  of boxes into inventory.  Each
         box of the pallet will be processed.  Nothing will be returned.
 
+        The boxes are loaded, updated and have their activity recorded in
+        bulk, so the number of queries does not grow with the number of
+        boxes on the pallet.
+
         Note - a pallet is still considered valid even if there are no
         boxes associated with it.
 
@@ -318,6 +358,9 @@ class BoxManagementClass:
 
             166 - The pallet has an invalid location
 
+            111, 113, 114, 121 and 122 - as for box_fill and box_move,
+                for a box on the pallet
+
         :param pallet:
         :return:
         """
@@ -337,49 +380,249 @@ class BoxManagementClass:
                     f'162 - A pallet with the name "{pallet}" does not '
                     f'currently exist')
         try:
-            location = Location.objects.get(pk=pallet_rec.location.id)
+            location = Location.objects.select_related(
+                'loc_row',
+                'loc_bin',
+                'loc_tier',
+            ).get(pk=pallet_rec.location.id)
         except Location.DoesNotExist:
             raise InvalidValueError(
                 f'166 - The location of "{pallet_rec.location}" does not '
                 f'exist')
-        # TODO Mar 19 2020 travis - temporary fix
-        pallet_status = pallet.pallet_status
+        pallet_status = pallet_rec.pallet_status
         if pallet_status is None or pallet_status.strip() == '':
             pallet_status = Pallet.FILL
-        pallet_boxes = PalletBox.objects.filter(pallet=pallet_rec)
+        pallet_boxes = list(
+            PalletBox.objects.filter(pallet=pallet_rec).select_related(
+                'box',
+                'box__box_type',
+                'box__product',
+                'box__product__prod_cat',
+                'product',
+                'product__prod_cat',
+            )
+        )
         # transfer info and delete the pallet and its boxes in one trans
         with transaction.atomic():
             if pallet_status == Pallet.FILL:
                 # transfer the information to the real boxes
-                for pallet_box in pallet_boxes:
-                    box = pallet_box.box
-                    product = pallet_box.product
-                    exp_year = pallet_box.exp_year
-                    exp_mo_start = pallet_box.exp_month_start
-                    exp_mo_end = pallet_box.exp_month_end
-                    self.box_fill(
-                        box=box,
-                        location=location,
-                        product=product,
-                        exp_year=exp_year,
-                        exp_mo_start=exp_mo_start,
-                        exp_mo_end=exp_mo_end,
-                    )
+                self._fill_pallet_boxes(pallet_boxes, location)
             else:
                 # move or merge the boxes to the new location
-                for pallet_box in pallet_boxes:
-                    box = pallet_box.box
-                    self.box_move(
-                        box=box,
-                        location=location,
-                    )
+                self._move_pallet_boxes(pallet_boxes, location)
 
             # delete the pallet boxes for this pallet en mass
-            pallet_boxes.delete()
+            PalletBox.objects.filter(pallet=pallet_rec).delete()
             # now delete the pallet itself
             pallet_rec.delete()
         return
 
+    @staticmethod
+    def _get_future_exp_year_limit() -> int:
+        """
+        Get the last expiration year a box may be filled with.
+
+        :return: the current year plus the future expiration year limit
+        """
+        years_ahead_list = Constraints.get_values(
+            Constraints.FUTURE_EXP_YEAR_LIMIT)
+        years_ahead = years_ahead_list[0]
+        return CURRENT_YEAR + years_ahead
+
+    @staticmethod
+    def _validate_expiration(exp_year: int,
+                             exp_mo_start: Optional[int],
+                             exp_mo_end: Optional[int],
+                             future_exp_year_limit: int
+                             ) -> Tuple[int, int, int]:
+        """
+        Validate the expiration date information for filling a box.
+
+        Exceptions:
+
+            114 - the expiration  year, start month, and/or end month are
+                not valid or are out of range
+
+        :param exp_year: year (current year through future_exp_year_limit)
+        :param exp_mo_start: 1 - 12, or 0 or None if not specified
+        :param exp_mo_end: 1 - 12, or 0 or None if not specified
+        :param future_exp_year_limit: from _get_future_exp_year_limit
+        :return: expiration year, start month and end month
+        """
+        # presume the date information is true until proven otherwise
+        expiration_info_valid = True
+
+        if exp_year is None or exp_year < CURRENT_YEAR or \
+                exp_year > future_exp_year_limit:
+            expiration_info_valid = False
+
+        # both valid months or zero or null
+        valid_mo_start = 0
+        if (exp_mo_start is None) or exp_mo_start == 0:
+            valid_mo_start = 0
+        elif 1 <= exp_mo_start <= 12:
+            valid_mo_start = exp_mo_start
+        else:
+            expiration_info_valid = False
+
+        valid_mo_end = 0
+        if (exp_mo_end is None) or exp_mo_end == 0:
+            valid_mo_end = 0
+        elif 1 <= exp_mo_end <= 12:
+            valid_mo_end = exp_mo_end
+        else:
+            expiration_info_valid = False
+
+        # end must be greater than or equal to start
+        if valid_mo_end < valid_mo_start:
+            expiration_info_valid = False
+
+        # did it pass the gauntlet?
+        if not expiration_info_valid:
+            raise InvalidValueError(
+                f'114 - Expiration date information of {exp_mo_start} -'
+                f' {exp_mo_end} - {exp_year} was not valid')
+        return exp_year, valid_mo_start, valid_mo_end
+
+    def _fill_pallet_boxes(self, pallet_boxes: List[PalletBox],
+                           location: Location):
+        """
+        Fill the boxes of a pallet and record activity for all of them.
+
+        Does for every box what box_fill does for one, but the boxes are
+        validated and updated together and their activity is recorded by
+        BoxActivityClass.box_fill_batch.
+
+        :param pallet_boxes: pallet boxes loaded with their box, box type,
+            product and product category
+        :param location: location loaded with its row, bin and tier
+        :return:
+        """
+        future_exp_year_limit = self._get_future_exp_year_limit()
+        date_filled = now()
+        boxes = list()
+        for pallet_box in pallet_boxes:
+            box = pallet_box.box
+            if box is None:
+                raise InvalidActionAttemptedError(
+                    f'111 - Attempting to fill a box that does not exist.  '
+                    f'Pallet box given was "{pallet_box.box_number}"')
+            if pallet_box.product is None:
+                raise InvalidValueError(
+                    f'113 - No product given for box {box.box_number}')
+            box.exp_year, box.exp_month_start, box.exp_month_end = \
+                self._validate_expiration(
+                    pallet_box.exp_year,
+                    pallet_box.exp_month_start,
+                    pallet_box.exp_month_end,
+                    future_exp_year_limit,
+                )
+            box.location = location
+            box.product = pallet_box.product
+            box.date_filled = date_filled
+            box.quantity = box.box_type.box_type_qty
+            box.set_exp_date()
+            boxes.append(box)
+
+        with transaction.atomic():
+            removed = self.on_hand.lock_entries(box.pk for box in boxes)
+            Box.objects.bulk_update(boxes, fields=[
+                'location',
+                'product',
+                'exp_year',
+                'exp_month_start',
+                'exp_month_end',
+                'exp_date',
+                'date_filled',
+                'quantity',
+            ])
+            self.activity.box_fill_batch(boxes)
+            self.on_hand.record(
+                removed=removed,
+                added=[self.on_hand.get_entry(box) for box in boxes],
+            )
+        return
+
+    def _move_pallet_boxes(self, pallet_boxes: List[PalletBox],
+                           location: Location):
+        """
+        Move the boxes of a pallet and record activity for all of them.
+
+        Does for every box what box_move does for one, but the boxes are
+        updated together as in box_move_batch.
+
+        :param pallet_boxes: pallet boxes loaded with their box, box type,
+            product and product category
+        :param location: location loaded with its row, bin and tier
+        :return:
+        """
+        boxes = list()
+        for pallet_box in pallet_boxes:
+            box = pallet_box.box
+            if box is None:
+                raise InvalidActionAttemptedError(
+                    f'121 - Attempting to move a box that does not exist.  '
+                    f'Pallet box given was "{pallet_box.box_number}"')
+            if not box.product:
+                raise InvalidActionAttemptedError(
+                    f'122 - Attempting to move an empty box')
+            boxes.append(box)
+        self._move_boxes(boxes, location)
+        return
+
+    @staticmethod
+    def _get_boxes(boxes: List[Union[Box, int]], error_number: int,
+                   action: str) -> List[Box]:
+        """
+        Load many boxes, and the records their activity needs, in one query.
+
+        :param boxes: box records or IDs
+        :param error_number: error to report if a box does not exist
+        :param action: what was being attempted, for the error message
+        :return: box records in the order given
+        """
+        box_ids = list(dict.fromkeys(
+            box.pk if type(box) == Box else box for box in boxes
+        ))
+        boxes_by_id = Box.objects.select_related(
+            'box_type',
+            'location',
+            'location__loc_row',
+            'location__loc_bin',
+            'location__loc_tier',
+            'product',
+            'product__prod_cat',
+        ).in_bulk(box_ids)
+        missing_ids = [
+            box_id for box_id in box_ids if box_id not in boxes_by_id
+        ]
+        if missing_ids:
+            raise InvalidActionAttemptedError(
+                f'{error_number} - Attempting to {action} a box that does '
+                f'not exist.  ID given was "{missing_ids[0]}"')
+        return [boxes_by_id[box_id] for box_id in box_ids]
+
+    def _move_boxes(self, boxes: List[Box], location: Location):
+        """
+        Move filled boxes to a new location and record activity for them.
+
+        :param boxes: boxes loaded with their box type, product and product
+            category
+        :param location: location loaded with its row, bin and tier
+        :return:
+        """
+        with transaction.atomic():
+            removed = self.on_hand.lock_entries(box.pk for box in boxes)
+            for box in boxes:
+                box.location = location
+            Box.objects.bulk_update(boxes, fields=['location'])
+            self.activity.box_move_batch(boxes)
+            self.on_hand.record(
+                removed=removed,
+                added=[self.on_hand.get_entry(box) for box in boxes],
+            )
+        return
+
     def _new_box(self, box_number: str, box_type: BoxType):
         """
         Add a new, uniquely numbered box to the inventory system.
@@ -402,6 +645,7 @@ class BoxManagementClass:
         :return:
         """
         with transaction.atomic():
+            removed = self.on_hand.lock_entries([self.box.id])
             self.box.location = self.location
             self.box.product = self.product
             self.box.exp_year = self.exp_year
@@ -412,6 +656,10 @@ class BoxManagementClass:
             self.box.save()
 
             self.activity.box_fill(self.box.id)
+            self.on_hand.record(
+                removed=removed,
+                added=[self.on_hand.get_entry(self.box)],
+            )
         return
 
     def _move_box(self):
@@ -421,10 +669,15 @@ class BoxManagementClass:
         :return:
         """
         with transaction.atomic():
+            removed = self.on_hand.lock_entries([self.box.id])
             self.box.location = self.location
             self.box.save()
 
             self.activity.box_move(self.box.id)
+            self.on_hand.record(
+                removed=removed,
+                added=[self.on_hand.get_entry(self.box)],
+            )
         return
 
     def _consume_box(self):
@@ -438,7 +691,10 @@ class BoxManagementClass:
         # someone has emptied the box and refilled it with something else,
         # the previous contents need to be consumed as well as the contents
         # just emptied.  That method will clear out the box before returning.
-        self.activity.box_empty(self.box.id)
+        with transaction.atomic():
+            removed = self.on_hand.lock_entries([self.box.id])
+            self.activity.box_empty(self.box.id)
+            self.on_hand.record(removed=removed)
 
         # since we didn't modify the box ourself, we have a stale copy of
         # the box record.  Refresh it.
@@ -0,0 +1,136 @@
+"""
+ExpiringBoxes.py - Page through the boxes expiring soonest.
+
+Every filled box carries exp_date, the last day of its expiration window,
+and the Box indexes on (exp_date, id) - alone or after the product or
+location - let the boxes expiring by a date be read in order straight from
+an index.  Pages are continued from the last box shown (keyset paging)
+rather than by offset, so a later page costs no more than the first.
+"""
+from datetime import date, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from django.utils.timezone import localdate
+
+from fpiweb.constants import InvalidValueError
+from fpiweb.models import Box
+
+__author__ = '(Multiple)'
+__project__ = "Food-Pantry-Inventory"
+__creation_date__ = "10/18/2026"
+
+
+class ExpiringCursor(NamedTuple):
+    """
+    Where the next page of expiring boxes starts: after the box with this
+    exp_date and id.
+    """
+    exp_date: date
+    box_id: int
+
+    def to_token(self) -> str:
+        """
+        :return: the cursor as text for a query string
+        """
+        return f'{self.exp_date.isoformat()}_{self.box_id}'
+
+    @staticmethod
+    def from_token(token: str) -> 'ExpiringCursor':
+        """
+        :param token: text from to_token
+        :return: the cursor
+        """
+        try:
+            date_text, id_text = token.split('_')
+            exp_date = parse_date(date_text)
+            box_id = int(id_text)
+        except ValueError:
+            exp_date = None
+        if exp_date is None:
+            raise InvalidValueError(f'"{token}" is not a page cursor')
+        return ExpiringCursor(exp_date, box_id)
+
+
+class ExpiringBoxesClass:
+    """
+    ExpiringBoxesClass - Find the boxes expiring soonest.
+    """
+
+    def __init__(self, days: int = 90, include_expired: bool = False,
+                 product_id: int = None, location_id: int = None):
+        """
+        :param days: how far ahead to look for boxes expiring
+        :param include_expired: also list boxes already expired
+        :param product_id: just the boxes of this product
+        :param location_id: just the boxes at this location
+        """
+        if days < 0:
+            raise InvalidValueError(f'Days ahead of {days} is negative')
+        self.today = localdate()
+        self.horizon = self.today + timedelta(days=days)
+        self.include_expired = include_expired
+        self.product_id = product_id
+        self.location_id = location_id
+
+    def get_queryset(self):
+        """
+        :return: the boxes expiring, soonest first
+        """
+        boxes = Box.objects.filter(exp_date__lte=self.horizon)
+        if not self.include_expired:
+            boxes = boxes.filter(exp_date__gte=self.today)
+        if self.product_id:
+            boxes = boxes.filter(product_id=self.product_id)
+        if self.location_id:
+            boxes = boxes.filter(location_id=self.location_id)
+        return boxes.order_by('exp_date', 'id')
+
+    def get_page(self, after: Optional[ExpiringCursor] = None,
+                 page_size: int = 50) -> Tuple[List[dict],
+                                               Optional[ExpiringCursor]]:
+        """
+        Get a page of the boxes expiring.
+
+        :param after: cursor returned with the previous page, or None for
+            the first page
+        :param page_size: most boxes to return
+        :return: dicts describing the boxes, and the cursor for the next
+            page (None if this is the last)
+        """
+        boxes = self.get_queryset()
+        if after is not None:
+            boxes = boxes.filter(
+                Q(exp_date__gt=after.exp_date) |
+                Q(exp_date=after.exp_date, id__gt=after.box_id)
+            )
+        # one more than asked for, to know whether there is another page
+        rows = list(
+            boxes.values(
+                'id',
+                'box_number',
+                'exp_date',
+                'exp_year',
+                'exp_month_start',
+                'exp_month_end',
+                'quantity',
+                'product__prod_name',
+                'product__prod_cat__prod_cat_name',
+                'location__loc_code',
+            )[:page_size + 1]
+        )
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = ExpiringCursor(rows[-1]['exp_date'], rows[-1]['id'])
+        # the names can't be annotated as product and location - those are
+        # the box's own fields
+        for row in rows:
+            row['product'] = row.pop('product__prod_name')
+            row['category'] = row.pop('product__prod_cat__prod_cat_name')
+            row['location'] = row.pop('location__loc_code')
+            row['days_left'] = (row['exp_date'] - self.today).days
+        return rows, next_cursor
+
+# EOF
@@ -0,0 +1,263 @@
+"""
+OnHandSummary.py - Keep a running count of the boxes on hand.
+
+Each OnHandSummary holds the number of filled boxes, and the items in
+them, for one product, location and expiration year.  BoxManagementClass
+records every box it fills, moves or consumes here, in the same
+transaction, so the summary always agrees with the boxes it changed.
+Boxes edited or deleted by hand (BoxEditView and the admin) go through
+save_box and delete_boxes to do the same.  Boxes changed any other way
+(e.g. in the database directly) are picked up by the
+rebuild_on_hand_summary management command.
+"""
+from logging import getLogger
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+
+from fpiweb.models import \
+    Box, \
+    OnHandSummary
+from fpiweb.support.TableLock import lock_table
+
+__author__ = '(Multiple)'
+__project__ = "Food-Pantry-Inventory"
+__creation_date__ = "10/18/2026"
+
+logger = getLogger('fpiweb')
+
+
+class OnHandKey(NamedTuple):
+    """
+    Identifies an OnHandSummary.
+    """
+    product_id: int
+    location_id: int
+    exp_year: int
+
+
+# what a filled box adds to the summary: its key and quantity
+OnHandEntry = Tuple[OnHandKey, int]
+
+
+class OnHandSummaryClass:
+    """
+    OnHandSummaryClass - Keep the on hand summary up to date.
+    """
+
+    @staticmethod
+    def get_entry(box: Box) -> Optional[OnHandEntry]:
+        """
+        Get what a box (as it is now) adds to the on hand summary.
+
+        :param box:
+        :return: key and quantity, or None if the box isn't on hand
+        """
+        if not box.product_id or not box.location_id:
+            return None
+        key = OnHandKey(
+            product_id=box.product_id,
+            location_id=box.location_id,
+            exp_year=box.exp_year or 0,
+        )
+        return key, box.quantity or 0
+
+    def lock_entries(self, box_ids: Iterable[int]) \
+            -> List[Optional[OnHandEntry]]:
+        """
+        Lock boxes about to be changed and get what they add to the on hand
+        summary as stored, which the caller's copies may not reflect.
+
+        Must be called inside a transaction.
+
+        :param box_ids:
+        :return: entries of the boxes (None for those not on hand)
+        """
+        boxes = Box.objects.select_for_update().filter(
+            pk__in=list(box_ids),
+        ).order_by('id').only(
+            'product',
+            'location',
+            'exp_year',
+            'quantity',
+        )
+        return [self.get_entry(box) for box in boxes]
+
+    def record(self,
+               removed: Iterable[Optional[OnHandEntry]] = (),
+               added: Iterable[Optional[OnHandEntry]] = ()):
+        """
+        Change the summary for boxes just filled, moved or consumed.
+
+        :param removed: entries (from get_entry) of the boxes before the
+            change
+        :param added: entries of the boxes after the change
+        :return:
+        """
+        changes: Dict[OnHandKey, List[int]] = dict()
+        for entries, sign in ((removed, -1), (added, 1)):
+            for entry in entries:
+                if entry is None:
+                    continue
+                key, quantity = entry
+                change = changes.setdefault(key, [0, 0])
+                change[0] += sign
+                change[1] += sign * quantity
+
+        with transaction.atomic():
+            # always in the same order so that two transactions can't each
+            # be waiting for a summary row the other has locked
+            for key in sorted(changes):
+                box_count, quantity = changes[key]
+                if box_count or quantity:
+                    self._apply(key, box_count, quantity)
+        return
+
+    def save_box(self, box: Box):
+        """
+        Save a box changed by hand and change the summary to match.
+
+        :param box: box record with its changes (new or not)
+        :return:
+        """
+        with transaction.atomic():
+            removed = self.lock_entries([box.pk]) if box.pk else []
+            box.save()
+            self.record(removed=removed, added=[self.get_entry(box)])
+        return
+
+    def delete_boxes(self, box_ids: Iterable[int]):
+        """
+        Delete boxes by hand and take them out of the summary.
+
+        :param box_ids:
+        :return:
+        """
+        box_ids = list(box_ids)
+        with transaction.atomic():
+            removed = self.lock_entries(box_ids)
+            Box.objects.filter(pk__in=box_ids).delete()
+            self.record(removed=removed)
+        return
+
+    @staticmethod
+    def _apply(key: OnHandKey, box_count: int, quantity: int):
+        """
+        Add to the counts of a summary row, creating it if need be.
+
+        :param key:
+        :param box_count: change to the number of boxes
+        :param quantity: change to the quantity
+        :return:
+        """
+        summaries = OnHandSummary.objects.filter(**key._asdict())
+        changes = {
+            'box_count': F('box_count') + box_count,
+            'quantity': F('quantity') + quantity,
+        }
+        if summaries.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                OnHandSummary.objects.create(
+                    **key._asdict(),
+                    box_count=box_count,
+                    quantity=quantity,
+                )
+        except IntegrityError:
+            # created by someone else in the meantime
+            summaries.update(**changes)
+        return
+
+    @staticmethod
+    def rebuild() -> int:
+        """
+        Rebuild the whole summary from the boxes.
+
+        The summary is locked while the boxes are counted and the summary
+        replaced, all in one transaction, so a box changed meanwhile waits
+        and is then recorded in the new summary rather than lost or
+        counted twice.
+
+        :return: number of summary rows
+        """
+        with transaction.atomic():
+            lock_table(OnHandSummary)
+            totals = Box.objects.exclude(
+                product=None,
+            ).exclude(
+                location=None,
+            ).order_by().values(
+                'product_id',
+                'location_id',
+                exp=Coalesce('exp_year', 0),
+            ).annotate(
+                box_count=Count('id'),
+                quantity=Coalesce(Sum('quantity'), 0),
+            )
+            OnHandSummary.objects.all().delete()
+            summaries = OnHandSummary.objects.bulk_create(
+                (
+                    OnHandSummary(
+                        product_id=total['product_id'],
+                        location_id=total['location_id'],
+                        exp_year=total['exp'],
+                        box_count=total['box_count'],
+                        quantity=total['quantity'],
+                    )
+                    for total in totals
+                ),
+                batch_size=1000,
+            )
+        logger.info(f'Rebuilt {len(summaries)} on hand summaries')
+        return len(summaries)
+
+    @staticmethod
+    def get_summary(product_id: int = None, location_id: int = None,
+                    prod_cat_id: int = None) -> List[dict]:
+        """
+        Get the boxes on hand, optionally for just one product, location
+        or product category.
+
+        :param product_id:
+        :param location_id:
+        :param prod_cat_id:
+        :return: dicts of product, category, location, exp_year, box_count
+            and quantity
+        """
+        summaries = OnHandSummary.objects.filter(box_count__gt=0)
+        if product_id:
+            summaries = summaries.filter(product_id=product_id)
+        if location_id:
+            summaries = summaries.filter(location_id=location_id)
+        if prod_cat_id:
+            summaries = summaries.filter(product__prod_cat_id=prod_cat_id)
+        # the names can't be annotated as product and location - those are
+        # the summary's own fields
+        rows = summaries.order_by(
+            'product__prod_name',
+            'location__loc_code',
+            'exp_year',
+        ).values(
+            'product__prod_name',
+            'product__prod_cat__prod_cat_name',
+            'location__loc_code',
+            'exp_year',
+            'box_count',
+            'quantity',
+        )
+        return [
+            {
+                'product': row['product__prod_name'],
+                'category': row['product__prod_cat__prod_cat_name'],
+                'location': row['location__loc_code'],
+                'exp_year': row['exp_year'],
+                'box_count': row['box_count'],
+                'quantity': row['quantity'],
+            }
+            for row in rows
+        ]
+
+# EOF
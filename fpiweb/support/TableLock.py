@@ -0,0 +1,34 @@
+"""
+TableLock.py - Keep a table from being changed until a transaction ends.
+
+The summary tables (ActivityRollup and OnHandSummary) are rebuilt from
+scratch by reading the records they summarize and replacing every row.
+Locking the summary table first makes anyone recording a change wait
+until the rebuild is committed, and then apply the change to the new
+rows, so no change is lost or counted twice.
+"""
+from django.db import connection, models
+
+__author__ = '(Multiple)'
+__project__ = "Food-Pantry-Inventory"
+__creation_date__ = "10/18/2026"
+
+
+def lock_table(model: models.Model):
+    """
+    Keep the table of a model from being changed by anyone else until the
+    end of the current transaction.  It may still be read.
+
+    Must be called inside a transaction.  Does nothing on databases other
+    than PostgreSQL, which is what the project runs on.
+
+    :param model: model of the table to lock
+    :return:
+    """
+    if connection.vendor == 'postgresql':
+        table = connection.ops.quote_name(model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE')
+    return
+
+# EOF
@@ -0,0 +1,25 @@
+"""
+conftest.py - Fixtures shared by all the fpiweb tests.
+"""
+from pytest import fixture
+
+__author__ = '(Multiple)'
+__project__ = "Food-Pantry-Inventory"
+__creation_date__ = "10/18/2026"
+
+
+@fixture(autouse=True)
+def clear_constraints_cache():
+    """
+    Start and end every test with no constraint values cached.
+
+    Rolling back a test's changes to the constraints sends no signal to
+    clear the cache, so values cached by one test would leak into the next.
+    """
+    from fpiweb.models import Constraints
+
+    Constraints.clear_cache()
+    yield
+    Constraints.clear_cache()
+
+# EOF
@@ -0,0 +1,277 @@
+"""
+test_code_reader.py - Test decoding scanned QR codes.
+"""
+from base64 import b64encode
+from io import BytesIO
+from time import sleep
+
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from fpiweb import code_reader
+from fpiweb.code_reader import \
+    CodeReaderBusyError, \
+    CodeReaderError, \
+    DecodeCache, \
+    DecodePool, \
+    DecoderBackend, \
+    ScanPreprocessor, \
+    ZbarimgBackend, \
+    decode_image_bytes, \
+    decode_scan_data, \
+    get_box_number, \
+    get_box_numbers, \
+    get_decode_pool, \
+    get_decoder, \
+    read_box_number, \
+    read_box_numbers_from_image, \
+    read_image
+
+
+class FakeBackend(DecoderBackend):
+    """
+    Backend that "decodes" an image by returning its bytes as text.
+    """
+
+    name = 'fake'
+    decode_count = 0
+
+    def decode(self, image_bytes: bytes) -> str:
+        FakeBackend.decode_count += 1
+        return image_bytes.decode()
+
+    def decode_image(self, image: Image.Image) -> str:
+        return ''
+
+
+class PartialBackend(FakeBackend):
+    """
+    Backend that finds only one of the two labels in a reduced image.
+    """
+
+    name = 'partial'
+
+    def decode(self, image_bytes: bytes) -> str:
+        FakeBackend.decode_count += 1
+        return (
+            'QR-Code:http://localhost/fpiweb/box/box00001/\n'
+            'QR-Code:http://localhost/fpiweb/box/box00002/\n'
+        )
+
+    def decode_image(self, image: Image.Image) -> str:
+        return 'QR-Code:http://localhost/fpiweb/box/box00001/\n'
+
+
+class SlowBackend(FakeBackend):
+    """
+    Backend that takes far longer than the pool waits for a scan.
+    """
+
+    name = 'slow'
+
+    def decode(self, image_bytes: bytes) -> str:
+        sleep(60)
+        return super().decode(image_bytes)
+
+
+class CodeReaderTest(SimpleTestCase):
+
+    def setUp(self):
+        code_reader.DECODER_BACKENDS[FakeBackend.name] = FakeBackend
+        code_reader.DECODER_BACKENDS[PartialBackend.name] = PartialBackend
+        code_reader.DECODER_BACKENDS[SlowBackend.name] = SlowBackend
+        code_reader._decoder = None
+        code_reader._decode_pool = None
+        code_reader._decode_cache = None
+
+    def tearDown(self):
+        del code_reader.DECODER_BACKENDS[FakeBackend.name]
+        del code_reader.DECODER_BACKENDS[PartialBackend.name]
+        del code_reader.DECODER_BACKENDS[SlowBackend.name]
+        code_reader._decoder = None
+        code_reader._decode_pool = None
+        code_reader._decode_cache = None
+
+    def test_decode_scan_data(self):
+        scan_data = code_reader.scan_data_prefix + b64encode(b'abc').decode()
+        self.assertEqual(b'abc', decode_scan_data(scan_data))
+
+        with self.assertRaises(CodeReaderError):
+            decode_scan_data('data:image/jpeg;base64,YWJj')
+
+        with self.assertRaises(CodeReaderError):
+            decode_scan_data(code_reader.scan_data_prefix + 'a')
+
+    def test_get_box_number(self):
+        self.assertEqual(
+            'BOX12345',
+            get_box_number('QR-Code:http://localhost/fpiweb/box/box12345/\n'),
+        )
+        with self.assertRaises(CodeReaderError):
+            get_box_number('QR-Code:http://localhost/fpiweb/box/\n')
+
+    def test_get_box_numbers(self):
+        self.assertEqual(
+            ['BOX00002', 'BOX00001'],
+            get_box_numbers(
+                'QR-Code:http://localhost/fpiweb/box/box00002/\n'
+                'QR-Code:http://localhost/fpiweb/box/box00001/\n'
+                'QR-Code:http://localhost/fpiweb/box/box00002/\n'
+            ),
+        )
+        with self.assertRaises(CodeReaderError):
+            get_box_numbers('QR-Code:http://localhost/fpiweb/box/\n')
+
+    @override_settings(
+        CODE_READER_BACKEND='fake',
+        CODE_READER_POOL_WORKERS=0,
+        CODE_READER_PREPROCESS=False,
+        CODE_READER_CACHE_SIZE=0,
+    )
+    def test_read_box_number_uses_configured_backend(self):
+        scan_data = code_reader.scan_data_prefix + b64encode(
+            b'QR-Code:http://localhost/fpiweb/box/box00042/'
+        ).decode()
+        self.assertEqual('BOX00042', read_box_number(scan_data))
+        self.assertIsInstance(get_decoder(), FakeBackend)
+
+    def test_get_decoder(self):
+        self.assertIsInstance(get_decoder('zbarimg'), ZbarimgBackend)
+        with self.assertRaises(CodeReaderError):
+            get_decoder('no-such-backend')
+
+    @override_settings(CODE_READER_POOL_WORKERS=0)
+    def test_pool_disabled(self):
+        self.assertIsNone(get_decode_pool())
+
+    @override_settings(
+        CODE_READER_POOL_WORKERS=1,
+        CODE_READER_POOL_QUEUE_DEPTH=2,
+    )
+    def test_pool_from_settings(self):
+        pool = get_decode_pool()
+        self.assertEqual(1, pool.workers)
+        self.assertEqual(2, pool.queue_depth)
+        self.assertIs(pool, get_decode_pool())
+
+    def test_pool_saturated(self):
+        pool = DecodePool(workers=1, queue_depth=1, timeout=1)
+
+        # occupy every slot as if two scans were already in the pool
+        self.assertTrue(pool.slots.acquire(blocking=False))
+        self.assertTrue(pool.slots.acquire(blocking=False))
+
+        with self.assertRaises(CodeReaderBusyError):
+            pool.decode(b'')
+
+        # turned away without starting any worker processes
+        self.assertIsNone(pool.executor)
+
+    @override_settings(
+        CODE_READER_BACKEND='slow',
+        CODE_READER_PREPROCESS=False,
+    )
+    def test_pool_timeout(self):
+        pool = DecodePool(workers=1, queue_depth=0, timeout=0.5)
+        executor = pool._get_executor()
+        executor.submit(int).result()
+        processes = list(executor._processes.values())
+
+        with self.assertRaises(CodeReaderError):
+            pool.decode(b'QR-Code:http://localhost/fpiweb/box/box00042/')
+
+        # the worker stuck on the scan is killed and its slot given back
+        self.assertIsNone(pool.executor)
+        for process in processes:
+            process.join(timeout=5)
+            self.assertIsNotNone(process.exitcode)
+
+        # the next scan starts new workers
+        with override_settings(CODE_READER_BACKEND='fake'):
+            self.assertEqual(
+                'QR-Code:http://localhost/fpiweb/box/box00042/',
+                pool.decode(b'QR-Code:http://localhost/fpiweb/box/box00042/'),
+            )
+        pool.executor.shutdown()
+
+    def test_preprocessor_prepare(self):
+        image = Image.new('RGB', (2000, 1000))
+
+        prepared = ScanPreprocessor(max_dimension=400).prepare(image)
+        self.assertEqual('L', prepared.mode)
+        self.assertEqual((400, 200), prepared.size)
+
+        prepared = ScanPreprocessor(
+            max_dimension=400,
+            crop_fraction=0.5,
+        ).prepare(image)
+        self.assertEqual((400, 200), prepared.size)
+
+        prepared = ScanPreprocessor(
+            max_dimension=None,
+            crop_fraction=0.5,
+        ).prepare(image)
+        self.assertEqual((1000, 500), prepared.size)
+
+        # the original scan is kept for the full size attempt
+        self.assertEqual(('RGB', (2000, 1000)), (image.mode, image.size))
+
+    def test_decode_cache(self):
+        now = [0.0]
+        cache = DecodeCache(max_entries=2, ttl=10, clock=lambda: now[0])
+
+        cache.put('a', 'QR-Code:a')
+        cache.put('b', 'QR-Code:b')
+        self.assertEqual('QR-Code:a', cache.get('a'))
+
+        # 'b' is now the least recently used entry
+        cache.put('c', 'QR-Code:c')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('QR-Code:c', cache.get('c'))
+
+        now[0] = 11.0
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual((2, 2), (cache.hits, cache.misses))
+
+    @override_settings(
+        CODE_READER_BACKEND='fake',
+        CODE_READER_POOL_WORKERS=0,
+        CODE_READER_PREPROCESS=False,
+        CODE_READER_CACHE_SIZE=8,
+    )
+    def test_read_image_uses_cache(self):
+        FakeBackend.decode_count = 0
+        image_bytes = b'QR-Code:http://localhost/fpiweb/box/box00042/'
+
+        self.assertEqual(image_bytes.decode(), read_image(image_bytes))
+        self.assertEqual(image_bytes.decode(), read_image(image_bytes))
+        self.assertEqual(1, FakeBackend.decode_count)
+        self.assertEqual(1, code_reader._decode_cache.hits)
+
+    @override_settings(
+        CODE_READER_BACKEND='partial',
+        CODE_READER_POOL_WORKERS=0,
+        CODE_READER_PREPROCESS=True,
+        CODE_READER_CACHE_SIZE=8,
+    )
+    def test_read_box_numbers_at_full_size(self):
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000)).save(buffer, format='PNG')
+        image_bytes = buffer.getvalue()
+
+        # a single box scan settles for the reduced image ...
+        self.assertEqual(
+            'QR-Code:http://localhost/fpiweb/box/box00001/\n',
+            decode_image_bytes(PartialBackend(), image_bytes),
+        )
+        self.assertEqual(
+            'QR-Code:http://localhost/fpiweb/box/box00001/\n',
+            read_image(image_bytes),
+        )
+
+        # ... but a pallet photo is decoded at full size and not answered
+        # from the reduced image decode cached above
+        self.assertEqual(
+            ['BOX00001', 'BOX00002'],
+            read_box_numbers_from_image(image_bytes),
+        )
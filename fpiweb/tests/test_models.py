@@ -1,10 +1,17 @@
 
-from django.test import TestCase
+from datetime import date
+
+from django.test import TestCase, override_settings
+
+from fpiweb import models
 
 from fpiweb.models import \
     Activity, \
     Box, \
+    BoxNumber, \
+    BoxNumberCounter, \
     BoxType, \
+    Constraints, \
     Product
 
 
@@ -44,4 +51,193 @@ class BoxTest(TestCase):
         # assert activity.loc_bin == ''
         # assert activity.loc_tier == ''
 
+    def test_exp_date(self):
+        self.assertIsNone(Box.get_exp_date(None, None))
+        self.assertEqual(date(2022, 12, 31), Box.get_exp_date(2022, 0))
+        self.assertEqual(date(2024, 2, 29), Box.get_exp_date(2024, 2))
+
+        box = Box.objects.create(
+            box_number='BOX50002',
+            box_type=Box.box_type_default(),
+            product=Product.objects.first(),
+            exp_year=2023,
+            exp_month_start=4,
+            exp_month_end=6,
+        )
+        self.assertEqual(date(2023, 6, 30), box.exp_date)
+
+        box.exp_year = None
+        box.exp_month_start = None
+        box.exp_month_end = None
+        box.save(update_fields=['exp_year', 'exp_month_start',
+                                'exp_month_end'])
+        box.refresh_from_db()
+        self.assertIsNone(box.exp_date)
+
+
+class BoxNumberTest(TestCase):
+
+    fixtures = (
+        'BoxType',
+    )
+
+    def test_allocate_box_numbers(self):
+        Box.objects.create(
+            box_number='BOX00007',
+            box_type=Box.box_type_default(),
+        )
+
+        # the counter starts after the highest box number in use
+        self.assertEqual(
+            ['BOX00008', 'BOX00009', 'BOX00010'],
+            BoxNumber.allocate_box_numbers(3),
+        )
+        self.assertEqual(
+            11,
+            BoxNumberCounter.objects.get(pk=1).next_box_number,
+        )
+
+    def test_get_next_box_number(self):
+        Box.objects.create(
+            box_number='BOX00007',
+            box_type=Box.box_type_default(),
+        )
+
+        # before the counter exists, and without creating it
+        self.assertEqual('BOX00008', BoxNumber.get_next_box_number())
+        self.assertFalse(BoxNumberCounter.objects.exists())
+
+        BoxNumberCounter.objects.create(pk=1, next_box_number=6)
+        self.assertEqual('BOX00006', BoxNumber.get_next_box_number())
+        Box.objects.create(
+            box_number='BOX00006',
+            box_type=Box.box_type_default(),
+        )
+
+        # boxes in use are skipped, and peeking allocates nothing
+        self.assertEqual('BOX00008', BoxNumber.get_next_box_number())
+        self.assertEqual('BOX00008', BoxNumber.get_next_box_number())
+        self.assertEqual(
+            6,
+            BoxNumberCounter.objects.get(pk=1).next_box_number,
+        )
+
+    def test_allocate_skips_boxes_in_use(self):
+        BoxNumberCounter.objects.create(pk=1, next_box_number=1)
+        Box.objects.create(
+            box_number='BOX00002',
+            box_type=Box.box_type_default(),
+        )
+
+        self.assertEqual(
+            ['BOX00003', 'BOX00004'],
+            BoxNumber.allocate_box_numbers(2),
+        )
+
+    def test_reserve_free_box_numbers(self):
+        BoxNumberCounter.objects.create(pk=1, next_box_number=1)
+        for box_number in ('BOX00101', 'BOX00103'):
+            Box.objects.create(
+                box_number=box_number,
+                box_type=Box.box_type_default(),
+            )
+
+        # the labels skip the boxes in use, so run past 100 + 3 - 1 ...
+        self.assertEqual(
+            [('BOX00100', 100), ('BOX00102', 102), ('BOX00104', 104)],
+            BoxNumber.reserve_free_box_numbers(100, 3),
+        )
+        # ... and everything up to the last of them is reserved
+        self.assertEqual(['BOX00105'], BoxNumber.allocate_box_numbers(1))
+
+        # numbers below the counter don't move it back
+        BoxNumber.reserve_free_box_numbers(1, 5)
+        self.assertEqual(['BOX00106'], BoxNumber.allocate_box_numbers(1))
+
+    def test_get_free_box_numbers(self):
+        for box_number in ('BOX00002', 'BOX00003', 'BOX00005'):
+            Box.objects.create(
+                box_number=box_number,
+                box_type=Box.box_type_default(),
+            )
+
+        self.assertEqual(
+            [
+                ('BOX00001', 1),
+                ('BOX00004', 4),
+                ('BOX00006', 6),
+                ('BOX00007', 7),
+            ],
+            BoxNumber.get_free_box_numbers(1, 4),
+        )
+        self.assertEqual(
+            [('BOX00004', 4)],
+            BoxNumber.get_free_box_numbers(2, 1),
+        )
+
+
+class ConstraintsTest(TestCase):
+
+    fixtures = (
+        'Constraints',
+    )
+
+    def test_get_values_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual([1, 4], Constraints.get_values(Constraints.ROW))
+            self.assertEqual(
+                [4],
+                Constraints.get_values(Constraints.FUTURE_EXP_YEAR_LIMIT),
+            )
+            self.assertIsNone(Constraints.get_values('No Such Constraint'))
+
+        # callers get their own copy
+        Constraints.get_values(Constraints.ROW).append(5)
+        with self.assertNumQueries(0):
+            self.assertEqual([1, 4], Constraints.get_values(Constraints.ROW))
+
+    def test_cache_cleared_on_save_and_delete(self):
+        self.assertEqual([1, 4], Constraints.get_values(Constraints.ROW))
+
+        row = Constraints.objects.get(constraint_name=Constraints.ROW)
+        row.constraint_max = '06'
+        row.save()
+        self.assertEqual([1, 6], Constraints.get_values(Constraints.ROW))
+
+        row.delete()
+        self.assertIsNone(Constraints.get_values(Constraints.ROW))
+
+    def test_cache_not_kept_when_cleared_during_read(self):
+        def load():
+            # a constraint is saved while the values are being read
+            Constraints.clear_cache()
+            return {Constraints.ROW: [1, 2]}
+
+        self.assertEqual(
+            {Constraints.ROW: [1, 2]},
+            models._constraint_values.get(load),
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual([1, 4], Constraints.get_values(Constraints.ROW))
+
+    @override_settings(
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+        },
+        CONSTRAINTS_CACHE_ALIAS='default',
+    )
+    def test_shared_cache_not_kept_when_cleared_during_read(self):
+        def load():
+            Constraints.clear_cache()
+            return {Constraints.ROW: [1, 2]}
+
+        models._constraint_values.get(load)
+        with self.assertNumQueries(1):
+            self.assertEqual([1, 4], Constraints.get_values(Constraints.ROW))
 
+        # now kept in the shared cache for other processes
+        models._constraint_values.values = None
+        with self.assertNumQueries(0):
+            self.assertEqual([1, 4], Constraints.get_values(Constraints.ROW))
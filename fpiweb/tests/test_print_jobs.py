@@ -0,0 +1,120 @@
+"""
+test_print_jobs.py - Test background label print jobs.
+"""
+from datetime import timedelta
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from fpiweb.models import PrintJob
+from fpiweb.print_jobs import \
+    delete_expired_print_jobs, \
+    fail_stale_print_jobs, \
+    get_print_job_path
+from fpiweb.tests.utility import logged_in_user
+from fpiweb.views import PrintJobDownloadView, PrintJobStatusView
+
+
+class PrintJobTest(TestCase):
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.settings_override = override_settings(
+            PRINT_JOBS_DIR=self.temp_dir.name,
+            PRINT_JOB_RETENTION_HOURS=24,
+            PRINT_JOB_TIMEOUT_MINUTES=60,
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    @staticmethod
+    def make_done_print_job(**kwargs):
+        print_job = PrintJob.objects.create(
+            starting_number=1,
+            label_count=12,
+            labels_done=12,
+            status=PrintJob.DONE,
+            **kwargs
+        )
+        print_job.file_name = f'labels-{print_job.pk}.pdf'
+        print_job.save()
+        get_print_job_path(print_job).write_bytes(b'%PDF-1.4')
+        return print_job
+
+    def test_delete_expired_print_jobs(self):
+        old_job = self.make_done_print_job(
+            date_requested=timezone.now() - timedelta(hours=25),
+        )
+        old_path = get_print_job_path(old_job)
+        new_job = self.make_done_print_job()
+
+        self.assertEqual(1, delete_expired_print_jobs())
+        self.assertFalse(old_path.exists())
+        self.assertFalse(PrintJob.objects.filter(pk=old_job.pk).exists())
+        self.assertTrue(get_print_job_path(new_job).exists())
+
+    def test_status(self):
+        client = logged_in_user('jane', 'printjob1', PrintJobStatusView)
+        print_job = PrintJob.objects.create(
+            starting_number=1,
+            label_count=1000,
+            labels_done=120,
+            status=PrintJob.RUNNING,
+        )
+
+        response = client.get(
+            reverse('fpiweb:print_job_status', args=(print_job.pk,)))
+        self.assertEqual(200, response.status_code)
+        data = response.json()
+        self.assertEqual(PrintJob.RUNNING, data['status'])
+        self.assertEqual((120, 1000), (data['labels_done'], data['label_count']))
+        self.assertEqual('', data['download_url'])
+
+    def test_fail_stale_print_jobs(self):
+        lost_job = PrintJob.objects.create(
+            starting_number=1,
+            label_count=1000,
+            status=PrintJob.RUNNING,
+            date_requested=timezone.now() - timedelta(minutes=61),
+        )
+        running_job = PrintJob.objects.create(
+            starting_number=1001,
+            label_count=1000,
+            status=PrintJob.RUNNING,
+        )
+
+        self.assertEqual(1, fail_stale_print_jobs())
+        running_job.refresh_from_db()
+        self.assertEqual(PrintJob.RUNNING, running_job.status)
+
+        # the page polling the lost job is told it failed
+        client = logged_in_user('jane', 'printjob3', PrintJobStatusView)
+        response = client.get(
+            reverse('fpiweb:print_job_status', args=(lost_job.pk,)))
+        data = response.json()
+        self.assertEqual(PrintJob.FAILED, data['status'])
+        self.assertTrue(data['error_message'])
+
+    def test_download(self):
+        client = logged_in_user('jane', 'printjob2', PrintJobDownloadView)
+        running_job = PrintJob.objects.create(
+            starting_number=1,
+            label_count=1000,
+            status=PrintJob.RUNNING,
+        )
+        done_job = self.make_done_print_job()
+
+        response = client.get(
+            reverse('fpiweb:print_job_download', args=(running_job.pk,)))
+        self.assertEqual(404, response.status_code)
+
+        response = client.get(
+            reverse('fpiweb:print_job_download', args=(done_job.pk,)))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'%PDF-1.4', b''.join(response.streaming_content))
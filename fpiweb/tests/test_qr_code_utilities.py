@@ -0,0 +1,152 @@
+"""
+test_qr_code_utilities.py - Test building QR code artwork for labels.
+"""
+from io import BytesIO
+from os import chdir, getcwd, listdir, utime
+from re import findall
+from tempfile import TemporaryDirectory
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from fpiweb import qr_code_utilities
+from fpiweb.qr_code_utilities import \
+    QRArtworkCache, \
+    QRCodePrinter, \
+    get_qr_artwork_cache, \
+    get_qr_code_svg
+
+
+class QRArtworkCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        qr_code_utilities._qr_artwork_cache = None
+        self.temp_dir = TemporaryDirectory()
+
+    def tearDown(self):
+        qr_code_utilities._qr_artwork_cache = None
+        self.temp_dir.cleanup()
+
+    def test_get_key(self):
+        key = QRArtworkCache.get_key('BOX00001', 5, 'png')
+        self.assertTrue(key.endswith('.png'))
+        self.assertEqual(key, QRArtworkCache.get_key('BOX00001', 5, 'png'))
+        self.assertNotEqual(key, QRArtworkCache.get_key('BOX00001', 4, 'png'))
+        self.assertNotEqual(key, QRArtworkCache.get_key('BOX00002', 5, 'png'))
+
+    def test_memory_tier(self):
+        cache = QRArtworkCache(max_entries=2)
+        cache.put('a', b'a')
+        cache.put('b', b'b')
+        self.assertEqual(b'a', cache.get('a'))
+
+        # 'b' is now the least recently used entry
+        cache.put('c', b'c')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_disk_tier(self):
+        cache = QRArtworkCache(
+            max_entries=1,
+            disk_dir=self.temp_dir.name,
+            disk_max_bytes=25,
+        )
+        cache.put('a', b'a' * 10)
+        cache.put('b', b'b' * 10)
+
+        # 'a' is no longer in memory but is still on disk
+        self.assertEqual(b'a' * 10, cache.get('a'))
+
+        # make 'b' the oldest file so it is evicted first
+        utime(cache.disk_dir / 'b', (0, 0))
+        cache.put('c', b'c' * 10)
+        self.assertIsNone(cache.get('b'))
+        self.assertTrue((cache.disk_dir / 'a').exists())
+        self.assertTrue((cache.disk_dir / 'c').exists())
+
+    @override_settings(QR_ARTWORK_CACHE_SIZE=0)
+    def test_cache_disabled(self):
+        self.assertIsNone(get_qr_artwork_cache())
+
+    @override_settings(QR_ARTWORK_CACHE_SIZE=8, QR_ARTWORK_CACHE_DIR=None)
+    def test_get_qr_code_svg_uses_cache(self):
+        svg = get_qr_code_svg('http://localhost/fpiweb/box/box00001/')
+        self.assertFalse(svg.startswith('<?xml'))
+        self.assertEqual(
+            svg,
+            get_qr_code_svg('http://localhost/fpiweb/box/box00001/'),
+        )
+        self.assertEqual(1, get_qr_artwork_cache().hits)
+
+
+class RecordingPrinter(QRCodePrinter):
+    """
+    QRCodePrinter that notes where each label was placed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.placed = []
+
+    def place_label(self, label_image, label_name: str, pos: int):
+        super().place_label(label_image, label_name, pos)
+        self.placed.append((self.page_number, pos, label_name))
+
+
+class QRCodePrinterTest(TestCase):
+
+    def setUp(self):
+        qr_code_utilities._qr_artwork_cache = None
+
+    def tearDown(self):
+        qr_code_utilities._qr_artwork_cache = None
+
+    @staticmethod
+    def print_labels(starting_number, count, **kwargs):
+        printer = RecordingPrinter(url_prefix='BOX', **kwargs)
+        buffer = BytesIO()
+        printer.print(starting_number=starting_number, count=count,
+                      buffer=buffer)
+        return printer, buffer.getvalue()
+
+    @override_settings(QR_ARTWORK_CACHE_SIZE=8, QR_ARTWORK_CACHE_DIR=None)
+    def test_vector_labels_use_cache(self):
+        self.print_labels(1, 3, workers=0, vector=True)
+        cache = get_qr_artwork_cache()
+        self.assertEqual((0, 3), (cache.hits, cache.misses))
+
+        # a reprint draws the same QR codes from the cached runs
+        printer, pdf = self.print_labels(1, 3, workers=0, vector=True)
+        self.assertEqual((3, 3), (cache.hits, cache.misses))
+        self.assertEqual(3, len(printer.placed))
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+    @override_settings(QR_ARTWORK_CACHE_SIZE=0)
+    def test_labels_rendered_in_memory(self):
+        start_dir = getcwd()
+        with TemporaryDirectory() as work_dir:
+            chdir(work_dir)
+            try:
+                printer, pdf = self.print_labels(1, 3, workers=0,
+                                                 vector=False)
+            finally:
+                chdir(start_dir)
+            # no BOXnnnnn.png files are left behind
+            self.assertEqual([], listdir(work_dir))
+        self.assertEqual(3, len(printer.placed))
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+    @override_settings(QR_ARTWORK_CACHE_SIZE=0, LABEL_PRINT_PARALLEL_MIN=1)
+    def test_parallel_labels_match_serial(self):
+        # 14 labels fill one page and spill onto a second
+        for vector in (False, True):
+            with self.subTest(vector=vector):
+                serial, serial_pdf = self.print_labels(
+                    1, 14, workers=0, vector=vector)
+                parallel, parallel_pdf = self.print_labels(
+                    1, 14, workers=2, vector=vector)
+                self.assertEqual((2, 1, 'BOX00014'), serial.placed[-1])
+                self.assertEqual(serial.placed, parallel.placed)
+                self.assertEqual(
+                    len(findall(rb'/Type /Page\b', serial_pdf)),
+                    len(findall(rb'/Type /Page\b', parallel_pdf)),
+                )
@@ -0,0 +1,37 @@
+"""
+test_qr_drawing.py - Test drawing QR codes as vector shapes.
+"""
+from django.test import SimpleTestCase
+
+from fpiweb.qr_drawing import \
+    get_dark_runs, \
+    get_qr_matrix, \
+    get_qr_runs, \
+    pack_qr_runs, \
+    unpack_qr_runs
+
+
+class QRDrawingTest(SimpleTestCase):
+
+    def test_get_dark_runs(self):
+        matrix = [
+            [1, 1, 0, 1],
+            [0, 0, 0, 0],
+            [0, 1, 1, 1],
+        ]
+        self.assertEqual(
+            [(0, 0, 2), (0, 3, 1), (2, 1, 3)],
+            get_dark_runs(matrix),
+        )
+
+    def test_runs_cover_every_dark_module(self):
+        matrix = get_qr_matrix('http://localhost/fpiweb/box/box00001/')
+        dark_modules = sum(sum(row) for row in matrix)
+        self.assertEqual(
+            dark_modules,
+            sum(length for row, column, length in get_dark_runs(matrix)),
+        )
+
+    def test_pack_qr_runs(self):
+        qr_runs = get_qr_runs('http://localhost/fpiweb/box/box00001/')
+        self.assertEqual(qr_runs, unpack_qr_runs(pack_qr_runs(qr_runs)))
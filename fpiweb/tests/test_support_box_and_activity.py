@@ -4,7 +4,9 @@ test_support_box_and_activity.py - Test handling activity records.
 from datetime import timedelta, date
 from typing import NamedTuple
 
+from django.db import connection
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 from pytest import raises
 
@@ -14,13 +16,17 @@ from fpiweb.constants import \
 from fpiweb.models import \
     Box, \
     Activity, \
+    ActivityRollup, \
     Location, \
     BoxType, \
     Product, \
     Pallet, \
     BoxNumber, \
+    OnHandSummary, \
     PalletBox
+from fpiweb.support.ActivityRollup import ActivityRollupClass
 from fpiweb.support.BoxManagement import BoxManagementClass
+from fpiweb.support.OnHandSummary import OnHandSummaryClass
 
 __author__ = 'Travis Risner'
 __project__ = "Food-Pantry-Inventory"
@@ -756,6 +762,462 @@ class BoxSupportTestCase(TransactionTestCase):
             _ = Pallet.objects.get(pk=pallet_rec_id)
         return
 
+    def test_pallet_finish_activity(self) -> None:
+        """
+        Test the activity records written when finishing pallets.
+
+        Fill two boxes the slow way, then refill one of them and add a
+        brand new box on a fill pallet.  The refilled box's old contents
+        must be consumed with an adjustment code.  Then move both boxes
+        and a box missing its activity record on a move pallet.  The open
+        activity records must show the new location and the missing one
+        must be added with an adjustment code.
+
+        :return:
+        """
+        box_type_rec = BoxType.objects.get(box_type_code='Evans')
+        product_rec = Product.objects.get(prod_name='Corn')
+        other_product_rec = Product.objects.get(prod_name='Green Beans')
+        fill_location = Location.objects.get(loc_code='0101A1')
+        move_location = Location.objects.select_related(
+            'loc_row',
+            'loc_bin',
+            'loc_tier',
+        ).get(loc_code='0409C2')
+        exp_year = now().year + 1
+        refilled, new, lost = 'BOX98001', 'BOX98002', 'BOX98003'
+
+        bm = BoxManagementClass()
+        for box_number in (refilled, lost):
+            bm.box_new(box_number=box_number, box_type=box_type_rec)
+            bm.box_fill(
+                box=Box.objects.get(box_number=box_number),
+                location=fill_location,
+                product=product_rec,
+                exp_year=exp_year,
+            )
+        bm.box_new(box_number=new, box_type=box_type_rec)
+        Activity.objects.filter(box_number=lost).delete()
+
+        fill_pallet = Pallet.objects.create(
+            name='fill pallet',
+            location=fill_location,
+            pallet_status=Pallet.FILL,
+        )
+        for box_number in (refilled, new):
+            PalletBox.objects.create(
+                pallet=fill_pallet,
+                box_number=box_number,
+                box=Box.objects.get(box_number=box_number),
+                product=other_product_rec,
+                exp_year=exp_year,
+                box_status=PalletBox.NEW,
+            )
+        bm.pallet_finish(fill_pallet)
+
+        act_emptied = Activity.objects.get(
+            box_number=refilled,
+            prod_name=product_rec.prod_name,
+        )
+        assert act_emptied.date_consumed == now().date()
+        assert act_emptied.adjustment_code == Activity.FILL_EMPTIED
+        for box_number in (refilled, new):
+            act_filled = Activity.objects.get(
+                box_number=box_number,
+                date_consumed=None,
+            )
+            assert act_filled.prod_name == other_product_rec.prod_name
+            assert act_filled.adjustment_code is None
+
+        move_pallet = Pallet.objects.create(
+            name='move pallet',
+            location=move_location,
+            pallet_status=Pallet.MOVE,
+        )
+        for box_number in (refilled, new, lost):
+            PalletBox.objects.create(
+                pallet=move_pallet,
+                box_number=box_number,
+                box=Box.objects.get(box_number=box_number),
+                box_status=PalletBox.NEW,
+            )
+        bm.pallet_finish(move_pallet)
+
+        for box_number in (refilled, new, lost):
+            act_moved = Activity.objects.get(
+                box_number=box_number,
+                date_consumed=None,
+            )
+            assert act_moved.loc_row == move_location.loc_row.loc_row
+            assert act_moved.loc_bin == move_location.loc_bin.loc_bin
+            assert act_moved.loc_tier == move_location.loc_tier.loc_tier
+            if box_number == lost:
+                assert act_moved.adjustment_code == Activity.MOVE_ADDED
+            else:
+                assert act_moved.adjustment_code is None
+        assert Box.objects.filter(
+            box_number__in=(refilled, new, lost),
+            location=move_location,
+        ).count() == 3
+        return
+
+    def test_pallet_finish_queries(self) -> None:
+        """
+        Test that finishing a pallet takes as many queries for many boxes
+        as it does for a few.
+
+        A small pallet is finished first so the constraints are cached and
+        the summary rows exist, then pallets of 2 and 30 boxes are filled
+        and moved with the same product, expiration year and location.
+
+        :return:
+        """
+        box_type_rec = BoxType.objects.get(box_type_code='Evans')
+        product_rec = Product.objects.get(prod_name='Corn')
+        fill_location = Location.objects.get(loc_code='0101A1')
+        move_location = Location.objects.get(loc_code='0409C2')
+        exp_year = now().year + 1
+
+        bm = BoxManagementClass()
+        next_box_number = iter(range(97000, 97100))
+
+        def build_pallet(name, location, pallet_status, box_recs):
+            pallet_rec = Pallet.objects.create(
+                name=name,
+                location=location,
+                pallet_status=pallet_status,
+            )
+            for box_rec in box_recs:
+                PalletBox.objects.create(
+                    pallet=pallet_rec,
+                    box_number=box_rec.box_number,
+                    box=box_rec,
+                    product=product_rec,
+                    exp_year=exp_year,
+                    box_status=PalletBox.NEW,
+                )
+            return pallet_rec
+
+        def count_queries(box_count):
+            box_recs = [
+                bm.box_new(
+                    box_number=BoxNumber.format_box_number(
+                        next(next_box_number)),
+                    box_type=box_type_rec,
+                )
+                for _ in range(box_count)
+            ]
+            counts = list()
+            for pallet_status, location in (
+                    (Pallet.FILL, fill_location),
+                    (Pallet.MOVE, move_location)):
+                pallet_rec = build_pallet(
+                    f'{pallet_status} {box_count}',
+                    location,
+                    pallet_status,
+                    box_recs,
+                )
+                with CaptureQueriesContext(connection) as queries:
+                    bm.pallet_finish(pallet_rec)
+                counts.append(len(queries))
+            # consume them so the next run fills and moves the same rows
+            bm.box_consume_batch(box_recs)
+            return counts
+
+        count_queries(1)
+        assert count_queries(2) == count_queries(30)
+        return
+
+    def test_box_consume_batch(self) -> None:
+        """
+        Test consuming many boxes at once.
+
+        One box has a matching activity record, one has an activity record
+        for other contents and one has no activity record at all.  All
+        three boxes must be emptied, with the last two getting adjustment
+        codes on their activity records.
+
+        :return:
+        """
+        box_type_rec = BoxType.objects.get(box_type_code='Evans')
+        product_rec = Product.objects.get(prod_name='Corn')
+        location_rec = Location.objects.get(loc_code='0101A1')
+        exp_year = now().year + 1
+        matched, mismatched, lost = 'BOX98011', 'BOX98012', 'BOX98013'
+
+        bm = BoxManagementClass()
+        box_ids = list()
+        for box_number in (matched, mismatched, lost):
+            box_rec = bm.box_new(box_number=box_number, box_type=box_type_rec)
+            bm.box_fill(
+                box=box_rec,
+                location=location_rec,
+                product=product_rec,
+                exp_year=exp_year,
+            )
+            box_ids.append(box_rec.id)
+        Activity.objects.filter(box_number=mismatched).update(
+            prod_name='Green Beans')
+        Activity.objects.filter(box_number=lost).delete()
+
+        boxes = bm.box_consume_batch(box_ids)
+
+        assert [box.id for box in boxes] == box_ids
+        for box_rec in Box.objects.filter(pk__in=box_ids):
+            assert not box_rec.is_filled()
+            assert box_rec.product is None
+            assert box_rec.location is None
+        assert not Activity.objects.filter(
+            box_number__in=(matched, mismatched, lost),
+            date_consumed=None,
+        ).exists()
+        act_matched = Activity.objects.get(box_number=matched)
+        assert act_matched.date_consumed == now().date()
+        assert act_matched.adjustment_code is None
+        act_old = Activity.objects.get(
+            box_number=mismatched,
+            prod_name='Green Beans',
+        )
+        assert act_old.adjustment_code == Activity.CONSUME_ADDED
+        act_new = Activity.objects.get(
+            box_number=mismatched,
+            prod_name=product_rec.prod_name,
+        )
+        assert act_new.adjustment_code == Activity.CONSUME_EMPTIED
+        act_lost = Activity.objects.get(box_number=lost)
+        assert act_lost.adjustment_code == Activity.CONSUME_ADDED
+
+        with raises(InvalidActionAttemptedError):
+            bm.box_consume_batch(box_ids)
+        return
+
+    def test_activity_rollups(self) -> None:
+        """
+        Test that the rollups kept up to date as boxes are filled, moved
+        and consumed match rollups rebuilt from the activity records.
+
+        :return:
+        """
+        box_type_rec = BoxType.objects.get(box_type_code='Evans')
+        product_rec = Product.objects.get(prod_name='Corn')
+        fill_location = Location.objects.get(loc_code='0101A1')
+        move_location = Location.objects.get(loc_code='0409C2')
+        exp_year = now().year + 1
+
+        def get_rollups():
+            return set(
+                ActivityRollup.objects.exclude(
+                    filled_count=0,
+                    consumed_count=0,
+                ).values_list(
+                    'rollup_date', 'prod_name', 'prod_cat_name',
+                    'loc_row', 'loc_bin', 'loc_tier',
+                    'filled_count', 'filled_quantity',
+                    'consumed_count', 'consumed_quantity',
+                    'duration_total', 'duration_min', 'duration_max',
+                )
+            )
+
+        ActivityRollupClass.rebuild()
+
+        bm = BoxManagementClass()
+        box_ids = list()
+        for box_number in ('BOX98021', 'BOX98022', 'BOX98023'):
+            box_rec = bm.box_new(box_number=box_number, box_type=box_type_rec)
+            bm.box_fill(
+                box=box_rec,
+                location=fill_location,
+                product=product_rec,
+                exp_year=exp_year,
+            )
+            box_ids.append(box_rec.id)
+        bm.box_move(Box.objects.get(pk=box_ids[0]), move_location)
+        bm.box_move_batch(box_ids[1:], move_location)
+        bm.box_consume(box_ids[0])
+        bm.box_consume_batch(box_ids[1:])
+
+        rollups = get_rollups()
+        assert (
+            now().date(), product_rec.prod_name,
+            product_rec.prod_cat.prod_cat_name,
+            move_location.loc_row.loc_row, move_location.loc_bin.loc_bin,
+            move_location.loc_tier.loc_tier,
+            3, 3 * box_type_rec.box_type_qty,
+            3, 3 * box_type_rec.box_type_qty,
+            0, 0, 0,
+        ) in rollups
+
+        ActivityRollupClass.rebuild()
+        assert get_rollups() == rollups
+        return
+
+    def test_category_shelf_days(self) -> None:
+        """
+        Test the average days on the shelf of a product category for each
+        month, from the rollups.
+
+        :return:
+        """
+        category = 'Shelf Days Test'
+
+        def consumed(box_number, date_consumed, duration):
+            return Activity(
+                box_number=box_number,
+                box_type='Evans',
+                loc_row='01',
+                loc_bin='01',
+                loc_tier='A1',
+                prod_name='Shelf Days Product',
+                prod_cat_name=category,
+                date_filled=date_consumed - timedelta(days=duration),
+                date_consumed=date_consumed,
+                exp_year=2022,
+                exp_month_start=0,
+                exp_month_end=0,
+                quantity=12,
+                duration=duration,
+            )
+
+        Activity.objects.bulk_create([
+            consumed('BOX98031', date(2020, 1, 10), 10),
+            consumed('BOX98032', date(2020, 1, 10), 20),
+            consumed('BOX98033', date(2020, 1, 25), 30),
+            consumed('BOX98034', date(2020, 2, 3), 5),
+            consumed('BOX98035', date(2020, 3, 1), 100),
+        ])
+        ActivityRollupClass.rebuild()
+
+        months = [
+            month for month in ActivityRollupClass.get_category_shelf_days(
+                date(2020, 1, 1), date(2020, 2, 29))
+            if month['prod_cat_name'] == category
+        ]
+        assert months == [
+            {
+                'month': date(2020, 1, 1),
+                'prod_cat_name': category,
+                'consumed_count': 3,
+                'average_days': 20,
+            },
+            {
+                'month': date(2020, 2, 1),
+                'prod_cat_name': category,
+                'consumed_count': 1,
+                'average_days': 5,
+            },
+        ]
+        return
+
+    def test_on_hand_summary(self) -> None:
+        """
+        Test that the on hand summary kept up to date as boxes are filled,
+        moved and consumed matches one rebuilt from the boxes.
+
+        :return:
+        """
+        box_type_rec = BoxType.objects.get(box_type_code='Evans')
+        product_rec = Product.objects.get(prod_name='Corn')
+        fill_location = Location.objects.get(loc_code='0101A1')
+        move_location = Location.objects.get(loc_code='0409C2')
+        exp_year = now().year + 1
+        quantity = box_type_rec.box_type_qty
+
+        def get_summary():
+            return set(
+                OnHandSummary.objects.exclude(
+                    box_count=0,
+                ).values_list(
+                    'product_id', 'location_id', 'exp_year',
+                    'box_count', 'quantity',
+                )
+            )
+
+        OnHandSummaryClass.rebuild()
+        before = get_summary()
+
+        bm = BoxManagementClass()
+        box_ids = list()
+        for box_number in ('BOX98031', 'BOX98032', 'BOX98033'):
+            box_rec = bm.box_new(box_number=box_number, box_type=box_type_rec)
+            bm.box_fill(
+                box=box_rec,
+                location=fill_location,
+                product=product_rec,
+                exp_year=exp_year,
+            )
+            box_ids.append(box_rec.id)
+        bm.box_move(Box.objects.get(pk=box_ids[0]), move_location)
+        bm.box_move_batch(box_ids[1:2], move_location)
+
+        summary = get_summary()
+        assert (product_rec.id, move_location.id, exp_year,
+                2, 2 * quantity) in summary
+        assert (product_rec.id, fill_location.id, exp_year,
+                1, quantity) in summary
+        OnHandSummaryClass.rebuild()
+        assert get_summary() == summary
+
+        bm.box_consume(box_ids[0])
+        bm.box_consume_batch(box_ids[1:])
+        assert get_summary() == before
+        OnHandSummaryClass.rebuild()
+        assert get_summary() == before
+        return
+
+    def test_on_hand_summary_by_hand(self) -> None:
+        """
+        Test that boxes saved and deleted by hand (as BoxEditView and the
+        admin do) keep the on hand summary matching one rebuilt from the
+        boxes.
+
+        :return:
+        """
+        box_type_rec = BoxType.objects.get(box_type_code='Evans')
+        product_rec = Product.objects.get(prod_name='Corn')
+        location_rec = Location.objects.get(loc_code='0101A1')
+        exp_year = now().year + 1
+
+        def get_summary():
+            return set(
+                OnHandSummary.objects.exclude(
+                    box_count=0,
+                ).values_list(
+                    'product_id', 'location_id', 'exp_year',
+                    'box_count', 'quantity',
+                )
+            )
+
+        OnHandSummaryClass.rebuild()
+        before = get_summary()
+
+        on_hand = OnHandSummaryClass()
+        box_rec = Box(
+            box_number='BOX98041',
+            box_type=box_type_rec,
+            location=location_rec,
+            product=product_rec,
+            exp_year=exp_year,
+            quantity=10,
+        )
+        on_hand.save_box(box_rec)
+        assert (product_rec.id, location_rec.id, exp_year, 1, 10) in \
+            get_summary()
+
+        box_rec = Box.objects.get(pk=box_rec.pk)
+        box_rec.quantity = 7
+        box_rec.exp_year = exp_year + 1
+        on_hand.save_box(box_rec)
+        summary = get_summary()
+        assert (product_rec.id, location_rec.id, exp_year + 1, 1, 7) in \
+            summary
+        OnHandSummaryClass.rebuild()
+        assert get_summary() == summary
+
+        on_hand.delete_boxes([box_rec.pk])
+        assert not Box.objects.filter(pk=box_rec.pk).exists()
+        assert get_summary() == before
+        return
+
     @classmethod
     def tearDownClass(cls) -> None:
         """
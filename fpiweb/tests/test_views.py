@@ -5,15 +5,18 @@ __creation_date__ = "04/01/2019"
 
 from bs4 import BeautifulSoup
 from datetime import date, timedelta
+from gzip import decompress
+from unittest import skipUnless
 
 from django.contrib.auth.models import User
 from django.forms.formsets import BaseFormSet
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 from django.utils.html import escape
 
 
+from fpiweb.activity_export import parquet_available
 from fpiweb.forms import \
     BuildPalletForm, \
     ConfirmMergeForm, \
@@ -28,21 +31,33 @@ from fpiweb.models import \
     BoxNumber, \
     BoxType, \
     Location, \
+    OnHandSummary, \
     Pallet, \
     PalletBox, \
     Product, \
     Activity, \
+    ActivityRollup, \
     Profile
 from fpiweb.tests.utility import \
     grant_required_permissions, \
     logged_in_user
 from fpiweb.views import \
+    ActivityDownloadView, \
     BoxItemFormView, \
+    BoxItemFormsView, \
     BoxNewView, \
     BuildPalletError, \
     BuildPalletView, \
+    ExpiringBoxesDataView, \
+    ExpiringBoxesView, \
     ManualMoveBoxView, \
-    ManualPalletMoveView
+    ManualPalletMoveView, \
+    OnHandDataView, \
+    OnHandView, \
+    PrintLabelsView, \
+    ScannerUploadView, \
+    ScannerView, \
+    ShelfDaysView
 
 
 def add_prefix(post_data, prefix):
@@ -891,6 +906,117 @@ class TestBoxItemFormView(TestCase):
         )
 
 
+class BoxItemFormsViewTest(TestCase):
+
+    fixtures = (
+        'BoxType',
+        'Constraints',
+        'Product',
+        'ProductCategory',
+    )
+
+    url = reverse_lazy('fpiweb:box_forms')
+
+    def test_post_box_numbers(self):
+        client = logged_in_user('jane', 'forms1', BoxItemFormsView)
+        pallet = Pallet.objects.create(name="batch pallet")
+        Box.objects.create(
+            box_number='BOX00002',
+            box_type=Box.box_type_default(),
+        )
+
+        response = client.post(
+            self.url,
+            {
+                'boxNumbers': ['1, 2 BOX00003', '3'],
+                'formIdsInUse': '0,2',
+                'palletPk': pallet.pk,
+            },
+        )
+        self.assertEqual(200, response.status_code)
+
+        soup = BeautifulSoup(response.content, 'html.parser')
+        rows = soup.find_all('tr', class_='boxItemFormRow')
+        self.assertEqual(3, len(rows))
+        self.assertEqual(
+            [
+                'box_forms-1-box_number',
+                'box_forms-3-box_number',
+                'box_forms-4-box_number',
+            ],
+            [row.find('input', type='hidden')['name'] for row in rows],
+        )
+
+        box_numbers = ['BOX00001', 'BOX00002', 'BOX00003']
+        self.assertEqual(
+            3,
+            Box.objects.filter(box_number__in=box_numbers).count(),
+        )
+        self.assertEqual(
+            box_numbers,
+            list(
+                PalletBox.objects.filter(pallet=pallet)
+                .order_by('box_number')
+                .values_list('box_number', flat=True)
+            ),
+        )
+
+        # scanning the same boxes again adds no more pallet boxes
+        response = client.post(
+            self.url,
+            {'boxNumbers': 'BOX00001', 'palletPk': pallet.pk},
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, PalletBox.objects.filter(pallet=pallet).count())
+
+    def test_post_scan_source(self):
+        client = logged_in_user('jane', 'forms3', BoxItemFormsView)
+        pallet = Pallet.objects.create(name="scanned batch pallet")
+
+        with self.assertLogs('fpiweb', 'INFO') as logs:
+            response = client.post(
+                self.url,
+                {
+                    'boxNumbers': 'BOX00005,BOX00006',
+                    'scanSource': ScannerView.SCAN_SOURCE_CLIENT,
+                    'palletPk': pallet.pk,
+                },
+            )
+        self.assertEqual(200, response.status_code)
+        for box_number in ('BOX00005', 'BOX00006'):
+            self.assertIn(
+                f'INFO:fpiweb:Box number {box_number} scan source: client',
+                logs.output,
+            )
+
+        with self.assertLogs('fpiweb', 'INFO') as logs:
+            client.post(
+                self.url,
+                {'boxNumbers': 'BOX00007', 'palletPk': pallet.pk},
+            )
+        self.assertIn(
+            'INFO:fpiweb:Box number BOX00007 scan source: keyed',
+            logs.output,
+        )
+
+    def test_post_missing_scan(self):
+        client = logged_in_user('jane', 'forms2', BoxItemFormsView)
+        pallet = Pallet.objects.create(name="empty batch pallet")
+
+        response = client.post(self.url, {'palletPk': pallet.pk})
+        self.assertEqual(404, response.status_code)
+
+    def test_get_free_form_ids(self):
+        self.assertEqual(
+            [0, 1, 2],
+            BoxItemFormsView.get_free_form_ids('', 3),
+        )
+        self.assertEqual(
+            [1, 3, 5],
+            BoxItemFormsView.get_free_form_ids('0,2,4', 3),
+        )
+
+
 class ManualPalletMoveViewTest(TestCase):
 
     fixtures = (
@@ -1234,4 +1360,522 @@ class ManualPalletMoveViewTest(TestCase):
         )
 
 
+class ScannerUploadViewTest(TestCase):
+
+    fixtures = ('BoxType',)
+
+    url = reverse_lazy('fpiweb:scanner_upload')
+
+    def test_post_keyed_in_box_number(self):
+        client = logged_in_user('jane', 'upload1', ScannerUploadView)
+
+        response = client.post(
+            f'{self.url}?boxNumber=123',
+            data=b'',
+            content_type='application/octet-stream',
+        )
+        self.assertEqual(200, response.status_code)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertTrue(data['data']['box_meta']['is_new'])
+        self.assertEqual(
+            ScannerView.SCAN_SOURCE_KEYED,
+            data['data']['box_meta']['scan_source'],
+        )
+        self.assertTrue(Box.objects.filter(box_number='BOX00123').exists())
+
+    def test_post_box_number_decoded_by_browser(self):
+        client = logged_in_user('jane', 'upload4', ScannerUploadView)
+
+        response = client.post(
+            f'{self.url}?boxNumber=BOX00124&scanSource=client',
+            data=b'',
+            content_type='application/octet-stream',
+        )
+        self.assertEqual(200, response.status_code)
+        box_meta = response.json()['data']['box_meta']
+        self.assertEqual(ScannerView.SCAN_SOURCE_CLIENT, box_meta['scan_source'])
+        self.assertTrue(Box.objects.filter(box_number='BOX00124').exists())
+
+    def test_get_scan_source(self):
+        self.assertEqual(
+            ScannerView.SCAN_SOURCE_SERVER,
+            ScannerView.get_scan_source('client', None),
+        )
+        self.assertEqual(
+            ScannerView.SCAN_SOURCE_CLIENT,
+            ScannerView.get_scan_source('client', 'BOX00001'),
+        )
+        self.assertEqual(
+            ScannerView.SCAN_SOURCE_KEYED,
+            ScannerView.get_scan_source(None, 'BOX00001'),
+        )
+
+    def test_post_missing_image(self):
+        client = logged_in_user('jane', 'upload2', ScannerUploadView)
+
+        response = client.post(
+            self.url,
+            data=b'',
+            content_type='application/octet-stream',
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(response.json()['success'])
+
+    @override_settings(SCAN_UPLOAD_MAX_BYTES=10)
+    def test_post_image_too_large(self):
+        client = logged_in_user('jane', 'upload3', ScannerUploadView)
+
+        response = client.post(
+            self.url,
+            data=b'x' * 11,
+            content_type='application/octet-stream',
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertIn('too large', response.json()['errors'][0])
+
+
+class PrintLabelsViewTest(TestCase):
+
+    url = reverse_lazy('fpiweb:print_labels')
+
+    def test_post(self):
+        client = logged_in_user('jane', 'labels1', PrintLabelsView)
+
+        # built in memory, and rolled over to a file on disk
+        for spool_bytes in (1024 * 1024, 1):
+            with self.settings(LABEL_PDF_SPOOL_BYTES=spool_bytes):
+                response = client.post(self.url, {
+                    'starting_number': 1,
+                    'number_to_print': 3,
+                })
+            self.assertEqual(200, response.status_code)
+            self.assertIn('labels.pdf', response['Content-Disposition'])
+            pdf = b''.join(response.streaming_content)
+            self.assertTrue(pdf.startswith(b'%PDF'))
+
+        # the printed numbers are kept from the box number allocator
+        self.assertEqual(['BOX00004'], BoxNumber.allocate_box_numbers(1))
+
+
+class ActivityDownloadViewTest(TestCase):
+
+    url = reverse_lazy('fpiweb:download_activities')
+
+    @staticmethod
+    def create_activities(count):
+        Activity.objects.bulk_create([
+            Activity(
+                box_number=BoxNumber.format_box_number(number),
+                box_type='Evans',
+                loc_row='01',
+                loc_bin='02',
+                loc_tier='A1',
+                prod_name='Corn',
+                prod_cat_name='Canned Vegetables',
+                date_filled=date(2020, 1, 2),
+                date_consumed=date(2020, 3, 4) if number % 2 else None,
+                exp_year=2022,
+                exp_month_start=0,
+                exp_month_end=0,
+                quantity=12,
+                duration=62 if number % 2 else 0,
+            )
+            for number in range(1, count + 1)
+        ])
+
+    def test_get(self):
+        self.create_activities(3)
+        client = logged_in_user('jane', 'download1', ActivityDownloadView)
+
+        response = client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(4, len(lines))
+        self.assertTrue(lines[0].startswith('Box Number,Box Type,Row,'))
+        # boxes still in inventory come first
+        self.assertEqual(
+            'BOX00002,Evans,01,02,A1,Corn,Canned Vegetables,'
+            '01/02/2020,,2022,0,0,12,0,',
+            lines[1],
+        )
+        self.assertEqual(
+            'BOX00001,Evans,01,02,A1,Corn,Canned Vegetables,'
+            '01/02/2020,03/04/2020,2022,0,0,12,62,',
+            lines[2],
+        )
+
+    def test_get_order(self):
+        self.create_activities(4)
+        Activity.objects.filter(box_number='BOX00001').update(
+            date_consumed=date(2020, 5, 6))
+        client = logged_in_user('jane', 'download7', ActivityDownloadView)
+
+        response = client.get(self.url, {'columns': 'box_number'})
+        self.assertEqual(200, response.status_code)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        # the model's order: in inventory, then the latest consumed first,
+        # then by box number
+        self.assertEqual(
+            ['Box Number', 'BOX00002', 'BOX00004', 'BOX00001', 'BOX00003'],
+            lines,
+        )
+
+    def test_write_csv_in_chunks(self):
+        view = ActivityDownloadView()
+        view.chunk_size = 100
+        rows = [['x' * 30, 'y' * 30]] * 10
+
+        chunks = list(view.write_csv(iter(rows)))
+        self.assertEqual(''.join(chunks).count('\r\n'), 10)
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(all(len(chunk) < 200 for chunk in chunks))
+
+    @override_settings(ACTIVITY_EXPORT_SETTLE_SECONDS=0)
+    def test_get_incremental(self):
+        self.create_activities(3)
+        client = logged_in_user('jane', 'download2', ActivityDownloadView)
+
+        def get_changes(since, **params):
+            response = client.get(self.url, {'since': since, **params})
+            self.assertEqual(200, response.status_code)
+            lines = b''.join(
+                response.streaming_content).decode().splitlines()
+            self.assertTrue(lines[0].startswith('Activity ID,Box Number,'))
+            self.assertTrue(lines[0].endswith(',Date Changed'))
+            return (
+                [line.split(',')[1] for line in lines[1:]],
+                response['X-Continuation-Token'],
+                response['X-More-Activities'],
+            )
+
+        box_numbers, token, more = get_changes('', limit=2)
+        self.assertEqual(['BOX00001', 'BOX00002'], box_numbers)
+        self.assertEqual('true', more)
+
+        box_numbers, token, more = get_changes(token, limit=2)
+        self.assertEqual(['BOX00003'], box_numbers)
+        self.assertEqual('false', more)
+
+        box_numbers, token, more = get_changes(token)
+        self.assertEqual([], box_numbers)
+
+        activity = Activity.objects.get(box_number='BOX00002')
+        activity.loc_row = '03'
+        activity.save()
+        box_numbers, token, more = get_changes(token)
+        self.assertEqual(['BOX00002'], box_numbers)
+
+    def test_get_incremental_bad_token(self):
+        client = logged_in_user('jane', 'download3', ActivityDownloadView)
+
+        response = client.get(self.url, {'since': 'not a token'})
+        self.assertEqual(400, response.status_code)
+
+    def test_get_gzip_columns_and_dates(self):
+        self.create_activities(4)
+        Activity.objects.filter(box_number='BOX00004').update(
+            date_filled=date(2021, 5, 6))
+        client = logged_in_user('jane', 'download4', ActivityDownloadView)
+
+        response = client.get(self.url, {
+            'format': 'csv.gz',
+            'columns': 'box_number,date_filled',
+            'filled_from': '2021-01-01',
+        })
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('application/gzip', response['Content-Type'])
+        self.assertIn('activities.csv.gz', response['Content-Disposition'])
+        lines = decompress(
+            b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(
+            ['Box Number,Date Filled', 'BOX00004,05/06/2021'],
+            lines,
+        )
+
+    def test_get_bad_options(self):
+        client = logged_in_user('jane', 'download5', ActivityDownloadView)
+
+        for params in (
+                {'format': 'xlsx'},
+                {'columns': 'box_number,no_such_field'},
+                {'filled_from': 'yesterday'},
+        ):
+            response = client.get(self.url, params)
+            self.assertEqual(400, response.status_code)
+
+    @skipUnless(parquet_available(), 'pyarrow is not installed')
+    def test_get_parquet(self):
+        from pyarrow import BufferReader
+        from pyarrow.parquet import read_table
+
+        self.create_activities(3)
+        client = logged_in_user('jane', 'download6', ActivityDownloadView)
+
+        response = client.get(self.url, {
+            'format': 'parquet',
+            'columns': 'box_number,date_consumed,quantity',
+        })
+        self.assertEqual(200, response.status_code)
+        table = read_table(BufferReader(b''.join(response.streaming_content)))
+        self.assertEqual(
+            ['box_number', 'date_consumed', 'quantity'],
+            table.column_names,
+        )
+        self.assertEqual(
+            {
+                'box_number': ['BOX00002', 'BOX00001', 'BOX00003'],
+                'date_consumed': [None, date(2020, 3, 4), date(2020, 3, 4)],
+                'quantity': [12, 12, 12],
+            },
+            table.to_pydict(),
+        )
+
+
+class ShelfDaysViewTest(TestCase):
+
+    url = reverse_lazy('fpiweb:shelf_days')
+
+    @staticmethod
+    def create_rollup(rollup_date, consumed_count, duration_total):
+        ActivityRollup.objects.create(
+            rollup_date=rollup_date,
+            prod_name='Corn',
+            prod_cat_name='Canned Vegetables',
+            loc_row='01',
+            loc_bin='02',
+            loc_tier='A1',
+            consumed_count=consumed_count,
+            consumed_quantity=12 * consumed_count,
+            duration_total=duration_total,
+        )
+
+    def test_get(self):
+        self.create_rollup(date(2020, 1, 10), 2, 30)
+        self.create_rollup(date(2020, 1, 20), 1, 60)
+        self.create_rollup(date(2020, 3, 1), 1, 5)
+        client = logged_in_user('jane', 'shelf1', ShelfDaysView)
+
+        response = client.get(self.url, {
+            'date_from': '2020-01-01',
+            'date_to': '2020-02-29',
+        })
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            [(date(2020, 1, 1), 'Canned Vegetables', 3, 30)],
+            [
+                (
+                    month['month'],
+                    month['prod_cat_name'],
+                    month['consumed_count'],
+                    month['average_days'],
+                )
+                for month in response.context['months']
+            ],
+        )
+
+    def test_get_default_dates(self):
+        client = logged_in_user('jane', 'shelf2', ShelfDaysView)
+
+        response = client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(timezone.localdate(), response.context['date_to'])
+        self.assertEqual(1, response.context['date_from'].day)
+
+    def test_get_bad_dates(self):
+        client = logged_in_user('jane', 'shelf3', ShelfDaysView)
+
+        for params in (
+                {'date_from': 'yesterday'},
+                {'date_from': '2021-02-30'},
+                {'date_from': '2020-02-01', 'date_to': '2020-01-01'},
+        ):
+            response = client.get(self.url, params)
+            self.assertEqual(400, response.status_code)
+
+
+class OnHandViewTest(TestCase):
+
+    fixtures = (
+        'ProductCategory',
+        'Product',
+        'LocRow',
+        'LocBin',
+        'LocTier',
+        'Location',
+    )
+
+    url = reverse_lazy('fpiweb:on_hand')
+    data_url = reverse_lazy('fpiweb:on_hand_data')
+
+    def create_summaries(self):
+        self.corn = Product.objects.get(prod_name='Corn')
+        self.peas = Product.objects.exclude(pk=self.corn.pk).first()
+        self.location = Location.objects.get(loc_code='0101A1')
+        OnHandSummary.objects.bulk_create([
+            OnHandSummary(
+                product=self.corn,
+                location=self.location,
+                exp_year=2022,
+                box_count=3,
+                quantity=36,
+            ),
+            OnHandSummary(
+                product=self.peas,
+                location=self.location,
+                exp_year=0,
+                box_count=1,
+                quantity=12,
+            ),
+            OnHandSummary(
+                product=self.corn,
+                location=self.location,
+                exp_year=2021,
+                box_count=0,
+                quantity=0,
+            ),
+        ])
+
+    def test_get(self):
+        self.create_summaries()
+        client = logged_in_user('jane', 'onhand1', OnHandView)
+
+        response = client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        on_hand = response.context['on_hand']
+        self.assertEqual(2, len(on_hand['rows']))
+        self.assertEqual(4, on_hand['box_count'])
+        self.assertEqual(48, on_hand['quantity'])
+
+    def test_get_data(self):
+        self.create_summaries()
+        client = logged_in_user('jane', 'onhand2', OnHandDataView)
+
+        response = client.get(self.data_url, {'product': self.corn.pk})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            {
+                'rows': [
+                    {
+                        'product': 'Corn',
+                        'category': self.corn.prod_cat.prod_cat_name,
+                        'location': '0101A1',
+                        'exp_year': 2022,
+                        'box_count': 3,
+                        'quantity': 36,
+                    },
+                ],
+                'box_count': 3,
+                'quantity': 36,
+            },
+            response.json(),
+        )
+
+        response = client.get(self.data_url, {'location': 'A1'})
+        self.assertEqual(400, response.status_code)
+
+
+class ExpiringBoxesViewTest(TestCase):
+
+    fixtures = (
+        'BoxType',
+        'ProductCategory',
+        'Product',
+        'LocRow',
+        'LocBin',
+        'LocTier',
+        'Location',
+    )
+
+    url = reverse_lazy('fpiweb:expiring_boxes')
+    data_url = reverse_lazy('fpiweb:expiring_boxes_data')
+
+    def create_boxes(self):
+        today = timezone.localdate()
+        self.corn = Product.objects.get(prod_name='Corn')
+        self.other = Product.objects.exclude(pk=self.corn.pk).first()
+        location = Location.objects.get(loc_code='0101A1')
+        box_type = Box.box_type_default()
+        # expiring at the end of last year, this year, next year and in
+        # five years
+        for number, years, product in (
+                (1, -1, self.corn),
+                (2, 0, self.corn),
+                (3, 0, self.other),
+                (4, 1, self.corn),
+                (5, 5, self.corn),
+        ):
+            Box.objects.create(
+                box_number=BoxNumber.format_box_number(number),
+                box_type=box_type,
+                location=location,
+                product=product,
+                exp_year=today.year + years,
+                exp_month_start=0,
+                exp_month_end=0,
+                quantity=12,
+            )
+        # days until the end of next year
+        return (date(today.year + 1, 12, 31) - today).days
+
+    def test_get(self):
+        days = self.create_boxes()
+        client = logged_in_user('jane', 'expiring1', ExpiringBoxesView)
+
+        response = client.get(self.url, {'days': days, 'page_size': 2})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            ['BOX00002', 'BOX00003'],
+            [box['box_number'] for box in response.context['boxes']],
+        )
+        self.assertIn('after=', response.context['next_url'])
+
+        response = client.get(response.context['next_url'])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            ['BOX00004'],
+            [box['box_number'] for box in response.context['boxes']],
+        )
+        self.assertEqual('', response.context['next_url'])
+
+    def test_get_data(self):
+        days = self.create_boxes()
+        client = logged_in_user('jane', 'expiring2', ExpiringBoxesDataView)
 
+        response = client.get(self.data_url, {
+            'days': days,
+            'product': self.corn.pk,
+            'expired': '1',
+            'page_size': 2,
+        })
+        self.assertEqual(200, response.status_code)
+        data = response.json()
+        self.assertEqual(
+            ['BOX00001', 'BOX00002'],
+            [box['box_number'] for box in data['boxes']],
+        )
+        self.assertLess(data['boxes'][0]['days_left'], 0)
+
+        response = client.get(self.data_url, {
+            'days': days,
+            'product': self.corn.pk,
+            'expired': '1',
+            'page_size': 2,
+            'after': data['next'],
+        })
+        data = response.json()
+        self.assertEqual(
+            ['BOX00004'],
+            [box['box_number'] for box in data['boxes']],
+        )
+        self.assertIsNone(data['next'])
+
+        for params in (
+                {'days': 'soon'},
+                {'days': '-1'},
+                {'days': '99999999999'},
+                {'page_size': '0'},
+                {'after': 'nowhere'},
+        ):
+            response = client.get(self.data_url, params)
+            self.assertEqual(400, response.status_code)
@@ -14,6 +14,7 @@ from fpiweb.views import \
     BoxEmptyMoveView, \
     BoxEmptyView, \
     BoxItemFormView, \
+    BoxItemFormsView, \
     BoxMoveView, \
     BoxNewView, \
     BoxScannedView, \
@@ -22,6 +23,8 @@ from fpiweb.views import \
     ConstraintDeleteView, \
     ConstraintsListView, \
     ConstraintUpdateView, \
+    ExpiringBoxesDataView, \
+    ExpiringBoxesView, \
     IndexView, \
     LocBinCreateView, \
     LocBinDeleteView, \
@@ -49,10 +52,17 @@ from fpiweb.views import \
     ManualPalletMoveView, \
     ManualPalletNew, \
     ManualPalletStatus, \
+    OnHandDataView, \
+    OnHandView, \
     PalletManagementView, \
     PalletSelectView, \
+    PrintJobDownloadView, \
+    PrintJobStatusView, \
+    PrintJobView, \
     PrintLabelsView, \
+    ScannerUploadView, \
     ScannerView, \
+    ShelfDaysView, \
     TestScanView
 # from fpiweb.views import ConstraintDetailView
 
@@ -203,6 +213,10 @@ urlpatterns = [
     # send scan image or box number to server receive JSON info on box
     path('box/box_form/', BoxItemFormView.as_view(), name='box_form'),
 
+    # send one image of many labels, or a list of box numbers, to server
+    # receive a box form row for each box
+    path('box/box_forms/', BoxItemFormsView.as_view(), name='box_forms'),
+
     # e.g. /fpiweb/test_scan/ = ???
     path('test_scan/', TestScanView.as_view(), name='test_scan'),
 
@@ -290,13 +304,53 @@ urlpatterns = [
 
     path('scanner/', ScannerView.as_view(), name='scanner'),
 
+    # send a raw scan image (not a base64 data URI) to the server
+    # e.g. /fpiweb/scanner/upload/?boxNumber= with an image/png body
+    path('scanner/upload/', ScannerUploadView.as_view(),
+         name='scanner_upload'),
+
     path('print_labels/', PrintLabelsView.as_view(), name='print_labels'),
 
+    # Progress of a background label print job
+    # e.g. /fpiweb/print_jobs/<pk>/
+    path('print_jobs/<int:pk>/', PrintJobView.as_view(), name='print_job'),
+
+    # JSON progress of a background label print job
+    # e.g. /fpiweb/print_jobs/<pk>/status/
+    path('print_jobs/<int:pk>/status/', PrintJobStatusView.as_view(),
+         name='print_job_status'),
+
+    # Download the labels built by a background print job
+    # e.g. /fpiweb/print_jobs/<pk>/download/
+    path('print_jobs/<int:pk>/download/', PrintJobDownloadView.as_view(),
+         name='print_job_download'),
+
     path(
         'activity/download/',
         ActivityDownloadView.as_view(),
         name='download_activities'),
 
+    # Warehouse board of the boxes on hand
+    # e.g. /fpiweb/on_hand/?product=<id>&location=<id>&category=<id>
+    path('on_hand/', OnHandView.as_view(), name='on_hand'),
+
+    # JSON of the boxes on hand, polled by the warehouse board
+    # e.g. /fpiweb/on_hand/data/?product=<id>&location=<id>&category=<id>
+    path('on_hand/data/', OnHandDataView.as_view(), name='on_hand_data'),
+
+    # Boxes expiring soonest, a page at a time
+    # e.g. /fpiweb/expiring/?days=90&product=<id>&location=<id>&after=<next>
+    path('expiring/', ExpiringBoxesView.as_view(), name='expiring_boxes'),
+
+    # JSON page of the boxes expiring soonest
+    # e.g. /fpiweb/expiring/data/?days=90&page_size=100&after=<next>
+    path('expiring/data/', ExpiringBoxesDataView.as_view(),
+         name='expiring_boxes_data'),
+
+    # Average days on the shelf of each product category by month
+    # e.g. /fpiweb/activity/shelf_days/?date_from=<date>&date_to=<date>
+    path('activity/shelf_days/', ShelfDaysView.as_view(), name='shelf_days'),
+
     # Manually add an empty box to the inventory system
     # e.g. /fpiweb/manual_box_status/ = determine the status of a box manually
     path('manual_add_box/', ManualNewBoxView.as_view(),
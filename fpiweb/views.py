@@ -4,9 +4,10 @@ views.py - establish the views (pages) for the F. P. I. web application.
 
 from collections import OrderedDict
 from csv import writer as csv_writer
+from datetime import date
 from enum import Enum
 from http import HTTPStatus
-from io import BytesIO
+from io import StringIO
 from json import loads
 from logging import getLogger, debug, info
 from string import digits
@@ -19,17 +20,18 @@ from django.contrib.auth.mixins import \
     PermissionRequiredMixin
 from django.core.serializers import serialize
 from django.db import transaction
-from django.db.models import Max
 from django.db.models.functions import Substr
 from django.forms import formset_factory
 from django.http import \
     FileResponse, \
+    Http404, \
     HttpResponse, \
     JsonResponse, \
     StreamingHttpResponse
-from django.shortcuts import redirect, render
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.views import View
 from django.views.generic import \
     CreateView, \
@@ -54,13 +56,26 @@ from fpiweb.models import \
     LocBin, \
     LocTier, \
     Pallet, \
+    PrintJob, \
     Product, \
+    ProductCategory, \
     Profile, \
     Location, \
     PalletBox
+from fpiweb.activity_export import \
+    ActivityExportError, \
+    Watermark, \
+    get_changed_activities, \
+    get_settle_cutoff, \
+    gzip_chunks, \
+    parquet_available, \
+    write_parquet
 from fpiweb.code_reader import \
+    CodeReaderBusyError, \
     CodeReaderError, \
-    read_box_number
+    read_box_number, \
+    read_box_number_from_image, \
+    read_box_numbers_from_image
 from fpiweb.forms import \
     BoxItemForm, \
     BoxTypeForm, \
@@ -90,8 +105,17 @@ from fpiweb.forms import \
     ExpMoStartForm, \
     ExpMoEndForm, \
     validation_exp_months_bool
-from fpiweb.qr_code_utilities import QRCodePrinter
+from fpiweb.print_jobs import \
+    fail_stale_print_jobs, \
+    get_print_job_path, \
+    submit_print_job
+from fpiweb.qr_code_utilities import LabelPdfSpool, QRCodePrinter
+from fpiweb.support.ActivityRollup import ActivityRollupClass
 from fpiweb.support.BoxManagement import BoxManagementClass
+from fpiweb.support.ExpiringBoxes import \
+    ExpiringBoxesClass, \
+    ExpiringCursor
+from fpiweb.support.OnHandSummary import OnHandSummaryClass
 
 __author__ = '(Multiple)'
 __project__ = "Food-Pantry-Inventory"
@@ -697,6 +721,12 @@ class BoxEditView(PermissionRequiredMixin, UpdateView):
     form_class = NewBoxForm
     success_url = reverse_lazy('fpiweb:index')
 
+    def form_valid(self, form):
+        # saved through the on hand summary so it stays in step with the box
+        self.object = form.save(commit=False)
+        OnHandSummaryClass().save_box(self.object)
+        return redirect(self.get_success_url())
+
 
 class BoxDetailsView(PermissionRequiredMixin, DetailView):
 
@@ -794,9 +824,8 @@ class TestScanView(PermissionRequiredMixin, TemplateView):
         full_box_url = self.get_box_url_by_filters(product__isnull=False)
         empty_box_url = self.get_box_url_by_filters(product__isnull=True)
 
-        new_box_url = self.get_box_scanned_url(
-            BoxNumber.get_next_box_number()
-        )
+        next_box_number = BoxNumber.get_next_box_number()
+        new_box_url = self.get_box_scanned_url(next_box_number)
 
         # schema http or https
         schema = 'http'
@@ -821,7 +850,7 @@ class TestScanView(PermissionRequiredMixin, TemplateView):
             'new_box_url': new_box_url,
             'empty_box': empty_box,
             'full_box': full_box,
-            'next_box_number': BoxNumber.get_next_box_number(),
+            'next_box_number': next_box_number,
         }
 
 
@@ -1015,6 +1044,7 @@ class BuildPalletView(PermissionRequiredMixin, View):
         # Update box records and
         boxes_by_box_number = OrderedDict()
         duplicate_box_numbers = set()
+        filled_boxes = []
         for i, box_form in enumerate(box_forms):
             cleaned_data = box_form.cleaned_data
             if not cleaned_data:
@@ -1061,8 +1091,11 @@ class BuildPalletView(PermissionRequiredMixin, View):
             # When the box was scanned it would have been emptied if it was
             # filled.  This catches whether anything has changed.
             if pallet_box.box.is_filled():
-                box_management = BoxManagementClass()
-                box_management.box_consume(pallet_box.box)
+                filled_boxes.append(pallet_box.box)
+
+        if filled_boxes:
+            box_management = BoxManagementClass()
+            box_management.box_consume_batch(filled_boxes)
 
         if duplicate_box_numbers:
             duplicate_box_numbers = [str(k) for k in duplicate_box_numbers]
@@ -1144,6 +1177,10 @@ class ScannerViewError(RuntimeError):
     pass
 
 
+class ScannerBusyError(ScannerViewError):
+    pass
+
+
 class ScannerView(PermissionRequiredMixin, View):
 
     permission_required = (
@@ -1169,10 +1206,31 @@ class ScannerView(PermissionRequiredMixin, View):
     def error_response(errors, status=HTTPStatus.BAD_REQUEST):
         return ScannerView.response(
             False,
-            errors,
+            errors=errors,
             status=status
         )
 
+    # seconds the scanner should wait before resubmitting a scan
+    busy_retry_after = 1
+
+    @staticmethod
+    def busy_response(error_message):
+        """
+        Tell the scanner that the decoders are saturated and it should
+        resubmit the scan shortly.
+
+        :param error_message: reason the scan was turned away
+        :return: 503 JSON response with a Retry-After header
+        """
+        response = ScannerView.response(
+            False,
+            data={'retry': True},
+            errors=[error_message],
+            status=HTTPStatus.SERVICE_UNAVAILABLE,
+        )
+        response['Retry-After'] = str(ScannerView.busy_retry_after)
+        return response
+
     @staticmethod
     def get_keyed_in_box_number(box_number):
         """
@@ -1196,13 +1254,84 @@ class ScannerView(PermissionRequiredMixin, View):
         return BoxNumber.format_box_number(box_number)
 
     @staticmethod
-    def get_box(scan_data=None, box_number=None):
-        if not scan_data and not box_number:
+    def get_uploaded_image(request) -> Optional[bytes]:
+        """
+        Get the raw bytes of a scan image uploaded either as the whole
+        request body (application/octet-stream) or as the scanFile field of
+        a multipart form.
+
+        :param request:
+        :return: image bytes or None if no image was sent
+        """
+        max_bytes = getattr(
+            settings,
+            'SCAN_UPLOAD_MAX_BYTES',
+            5 * 1024 * 1024,
+        )
+
+        if request.content_type == 'application/octet-stream':
+            try:
+                content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                content_length = 0
+            if content_length > max_bytes:
+                raise ScannerViewError(
+                    f'scan image of {content_length:,} bytes is too large')
+            image_bytes = request.read(max_bytes + 1)
+        else:
+            upload = request.FILES.get('scanFile')
+            if upload is None:
+                return None
+            if upload.size > max_bytes:
+                raise ScannerViewError(
+                    f'scan image of {upload.size:,} bytes is too large')
+            image_bytes = upload.read()
+
+        if len(image_bytes) > max_bytes:
+            raise ScannerViewError('scan image is too large')
+        return image_bytes or None
+
+    # How the box number of a scan was found.  scanner.js posts a
+    # scanSource of 'client' with the box number when the browser decoded
+    # the QR code itself.
+    SCAN_SOURCE_CLIENT = 'client'  # QR code decoded by the browser
+    SCAN_SOURCE_KEYED = 'keyed'  # box number typed in by the user
+    SCAN_SOURCE_SERVER = 'server'  # QR code decoded here from the image
+
+    @staticmethod
+    def get_scan_source(claimed_scan_source=None, box_number=None):
+        """
+        Determine how the box number for this scan was (or will be) found.
+
+        :param claimed_scan_source: scanSource posted by the browser
+        :param box_number: box number posted by the browser, may be None
+        :return: one of the SCAN_SOURCE_* values
+        """
+        if not box_number:
+            return ScannerView.SCAN_SOURCE_SERVER
+        if claimed_scan_source == ScannerView.SCAN_SOURCE_CLIENT:
+            return ScannerView.SCAN_SOURCE_CLIENT
+        return ScannerView.SCAN_SOURCE_KEYED
+
+    @staticmethod
+    def get_box(
+            scan_data=None,
+            box_number=None,
+            image_bytes=None,
+            scan_source=None):
+        if not scan_data and not box_number and not image_bytes:
             raise ScannerViewError('missing scan_data and box_number')
 
+        scan_source = ScannerView.get_scan_source(scan_source, box_number)
+
         if not box_number:
             try:
-                box_number = read_box_number(scan_data)
+                if image_bytes:
+                    box_number = read_box_number_from_image(image_bytes)
+                else:
+                    box_number = read_box_number(scan_data)
+            except CodeReaderBusyError as cre:
+                raise ScannerBusyError(str(cre))
             except CodeReaderError as cre:
                 raise ScannerViewError(str(cre))
 
@@ -1219,14 +1348,71 @@ class ScannerView(PermissionRequiredMixin, View):
             logger.info(f"Box with box number {box_number} created.")
         else:
             logger.info(f"Found box with box number {box_number}.")
+        logger.info(f"Box number {box_number} scan source: {scan_source}")
         return box, created
 
     @staticmethod
-    def get_box_data(scan_data=None, box_number=None):
+    def get_boxes(box_numbers):
+        """
+        Find or create the boxes for many box numbers at once - one query
+        to find the existing boxes and one bulk insert for the rest.
+
+        :param box_numbers: box numbers of the form BOXnnnnn
+        :return: list of (box, created) in the order of box_numbers
+        """
+        boxes = {
+            box.box_number: box
+            for box in Box.objects.filter(box_number__in=box_numbers)
+        }
+        new_box_numbers = [
+            box_number
+            for box_number in box_numbers
+            if box_number not in boxes
+        ]
+
+        if new_box_numbers:
+            default_box_type = Box.box_type_default()
+            Box.objects.bulk_create(
+                [
+                    Box(
+                        box_number=box_number,
+                        box_type=default_box_type,
+                        quantity=default_box_type.box_type_qty,
+                    )
+                    for box_number in new_box_numbers
+                ],
+                ignore_conflicts=True,
+            )
+            # fetch them again to pick up their ids (and any created by
+            # another request in the meantime)
+            boxes.update({
+                box.box_number: box
+                for box in Box.objects.filter(
+                    box_number__in=new_box_numbers)
+            })
+
+        logger.info(
+            f"Found {len(box_numbers) - len(new_box_numbers)} boxes, "
+            f"created {len(new_box_numbers)} boxes."
+        )
+        return [
+            (boxes[box_number], box_number in new_box_numbers)
+            for box_number in box_numbers
+        ]
+
+    @staticmethod
+    def get_box_data(
+            scan_data=None,
+            box_number=None,
+            image_bytes=None,
+            scan_source=None):
 
+        scan_source = ScannerView.get_scan_source(scan_source, box_number)
         box, created = ScannerView.get_box(
             scan_data=scan_data,
-            box_number=box_number
+            box_number=box_number,
+            image_bytes=image_bytes,
+            scan_source=scan_source,
         )
 
         # serialize works on an iterable of objects and returns a string
@@ -1237,6 +1423,7 @@ class ScannerView(PermissionRequiredMixin, View):
             'box': box_dicts[0],
             'box_meta': {
                 'is_new': created,
+                'scan_source': scan_source,
             }
         }
         return data
@@ -1247,9 +1434,61 @@ class ScannerView(PermissionRequiredMixin, View):
         box_number = self.get_keyed_in_box_number(
             request.POST.get('boxNumber'),
         )
+        scan_source = request.POST.get('scanSource')
+
+        try:
+            box_data = self.get_box_data(
+                scan_data,
+                box_number,
+                scan_source=scan_source,
+            )
+        except ScannerBusyError as sbe:
+            return self.busy_response(str(sbe))
+        except ScannerViewError as sve:
+            error_message = str(sve)
+            logger.error(error_message)
+            return self.error_response([error_message])
+
+        return self.response(
+            True,
+            data=box_data,
+            status=HTTPStatus.OK,
+        )
+
+
+class ScannerUploadView(ScannerView):
+    """
+    Accept a scan as a raw image rather than as a base64 data URI.
+
+    The image is either the whole request body (Content-Type
+    application/octet-stream, keyed in box number in the boxNumber query
+    parameter) or the scanFile field of a multipart form (box number in the
+    boxNumber field).  The response is the same JSON as ScannerView.
+    """
+
+    def post(self, request, *args, **kwargs):
+
+        # fields come as form fields with a multipart upload, otherwise in
+        # the query string (with a raw image or no body at all - an empty
+        # body may come without a Content-Type)
+        if request.content_type == 'multipart/form-data':
+            fields = request.POST
+        else:
+            fields = request.GET
+        box_number = self.get_keyed_in_box_number(fields.get('boxNumber'))
+        scan_source = fields.get('scanSource')
 
         try:
-            box_data = self.get_box_data(scan_data, box_number)
+            image_bytes = None
+            if not box_number:
+                image_bytes = self.get_uploaded_image(request)
+            box_data = self.get_box_data(
+                box_number=box_number,
+                image_bytes=image_bytes,
+                scan_source=scan_source,
+            )
+        except ScannerBusyError as sbe:
+            return self.busy_response(str(sbe))
         except ScannerViewError as sve:
             error_message = str(sve)
             logger.error(error_message)
@@ -1279,9 +1518,6 @@ class PrintLabelsView(PermissionRequiredMixin, View):
         return f"{protocol}://{host}/"
 
     def get(self, request, *args, **kwargs):
-        max_box_number = Box.objects.aggregate(Max('box_number'))
-        print("max_box_number", max_box_number)
-
         return render(
             request,
             self.template_name,
@@ -1301,11 +1537,33 @@ class PrintLabelsView(PermissionRequiredMixin, View):
             )
         print("form valid")
 
-        buffer = BytesIO()
+        starting_number = form.cleaned_data.get('starting_number')
+        count = form.cleaned_data.get('number_to_print')
+        if starting_number:
+            # keep the box number allocator clear of the numbers printed,
+            # which skip any in use and so can run past starting_number +
+            # count - 1
+            BoxNumber.reserve_free_box_numbers(starting_number, count)
+        else:
+            box_numbers = BoxNumber.allocate_box_numbers(count)
+            starting_number = int(box_numbers[0][3:])
+
+        if count >= getattr(settings, 'PRINT_JOB_BACKGROUND_MIN', 500):
+            print_job = PrintJob.objects.create(
+                starting_number=starting_number,
+                label_count=count,
+                requested_by=request.user,
+            )
+            submit_print_job(print_job)
+            return redirect(reverse('fpiweb:print_job', args=(print_job.pk,)))
+
+        # The PDF is kept in memory only while it is small, then spills to
+        # a temporary file that FileResponse streams out in blocks.
+        buffer = LabelPdfSpool()
 
         QRCodePrinter(url_prefix='').print(
-            starting_number=form.cleaned_data.get('starting_number'),
-            count=form.cleaned_data.get('number_to_print'),
+            starting_number=starting_number,
+            count=count,
             buffer=buffer,
         )
 
@@ -1315,6 +1573,88 @@ class PrintLabelsView(PermissionRequiredMixin, View):
         return FileResponse(buffer, as_attachment=True, filename='labels.pdf')
 
 
+class PrintJobView(PermissionRequiredMixin, View):
+    """
+    Show the progress of a background print job and, once the labels are
+    built, a link to download them.
+    """
+
+    permission_required = (
+        'fpiweb.print_labels_box',
+    )
+
+    template_name = 'fpiweb/print_job.html'
+
+    @staticmethod
+    def get_status_data(print_job):
+        data = {
+            'status': print_job.status,
+            'labels_done': print_job.labels_done,
+            'label_count': print_job.label_count,
+            'error_message': print_job.error_message,
+            'download_url': '',
+        }
+        if print_job.status == PrintJob.DONE:
+            data['download_url'] = reverse(
+                'fpiweb:print_job_download',
+                args=(print_job.pk,),
+            )
+        return data
+
+    def get(self, request, *args, **kwargs):
+        fail_stale_print_jobs()
+        print_job = get_object_or_404(PrintJob, pk=kwargs.get('pk'))
+        return render(
+            request,
+            self.template_name,
+            {
+                'print_job': print_job,
+                'status': self.get_status_data(print_job),
+            },
+        )
+
+
+class PrintJobStatusView(PermissionRequiredMixin, View):
+    """
+    JSON progress of a background print job, polled by print_job.html.
+    """
+
+    permission_required = (
+        'fpiweb.print_labels_box',
+    )
+
+    def get(self, request, *args, **kwargs):
+        # a job lost to a restart shows as failed rather than polled for ever
+        fail_stale_print_jobs()
+        print_job = get_object_or_404(PrintJob, pk=kwargs.get('pk'))
+        return JsonResponse(PrintJobView.get_status_data(print_job))
+
+
+class PrintJobDownloadView(PermissionRequiredMixin, View):
+    """
+    Download the PDF built by a background print job.
+    """
+
+    permission_required = (
+        'fpiweb.print_labels_box',
+    )
+
+    def get(self, request, *args, **kwargs):
+        print_job = get_object_or_404(
+            PrintJob,
+            pk=kwargs.get('pk'),
+            status=PrintJob.DONE,
+        )
+        pdf_path = get_print_job_path(print_job)
+        if pdf_path is None or not pdf_path.exists():
+            raise Http404(f"Labels for print job {print_job.pk} not found")
+        return FileResponse(
+            open(pdf_path, 'rb'),
+            as_attachment=True,
+            filename='labels.pdf',
+        )
+
+
 class BoxItemFormView(PermissionRequiredMixin, View):
 
     permission_required = (
@@ -1339,11 +1679,22 @@ class BoxItemFormView(PermissionRequiredMixin, View):
         box_number = ScannerView.get_keyed_in_box_number(
             request.POST.get('boxNumber'),
         )
+        scan_source = request.POST.get('scanSource')
         prefix = request.POST.get('prefix')
         pallet_pk = request.POST.get('palletPk')
 
         try:
-            box, created = ScannerView.get_box(scan_data, box_number)
+            image_bytes = None
+            if not box_number and not scan_data:
+                image_bytes = ScannerView.get_uploaded_image(request)
+            box, created = ScannerView.get_box(
+                scan_data,
+                box_number,
+                image_bytes,
+                scan_source,
+            )
+        except ScannerBusyError as sbe:
+            return ScannerView.busy_response(str(sbe))
         except ScannerViewError as sve:
             error = str(sve)
             logger.error(error)
@@ -1380,6 +1731,171 @@ class BoxItemFormView(PermissionRequiredMixin, View):
         )
 
 
+class BoxItemFormsView(PermissionRequiredMixin, View):
+    """
+    Batch version of BoxItemFormView for BuildPalletView.
+
+    Accepts either one image holding the QR codes of many boxes (scanFile),
+    or a list of box numbers (boxNumbers, repeated or separated by commas
+    or spaces).  The boxes and their pallet boxes are found or created in
+    bulk and the box_form rows for all of them come back in one response.
+    """
+
+    permission_required = (
+        'fpiweb.add_box',
+    )
+
+    template_name = 'fpiweb/box_forms.html'
+
+    @staticmethod
+    def get_keyed_in_box_numbers(values):
+        """
+        :param values: strings of box numbers separated by commas or spaces
+        :return: box numbers of the form BOXnnnnn without duplicates
+        """
+        box_numbers = []
+        for value in values:
+            for piece in value.replace(',', ' ').split():
+                box_number = ScannerView.get_keyed_in_box_number(piece)
+                if box_number and box_number not in box_numbers:
+                    box_numbers.append(box_number)
+        return box_numbers
+
+    @staticmethod
+    def get_free_form_ids(form_ids_in_use, count):
+        """
+        Pick form ids the same way buildPallet.getNextAvailableBoxFormId
+        does - lowest first, filling any gaps.
+
+        :param form_ids_in_use: string of form ids separated by commas
+        :param count: number of form ids needed
+        :return: list of form ids
+        """
+        ids_in_use = set()
+        for form_id in (form_ids_in_use or '').split(','):
+            try:
+                ids_in_use.add(int(form_id))
+            except ValueError:
+                continue
+
+        free_form_ids = []
+        form_id = 0
+        while len(free_form_ids) < count:
+            if form_id not in ids_in_use:
+                free_form_ids.append(form_id)
+            form_id += 1
+        return free_form_ids
+
+    @staticmethod
+    def get_pallet_boxes(pallet, boxes):
+        """
+        Find or create the pallet boxes for many boxes on a pallet.
+
+        :param pallet: pallet being built
+        :param boxes: boxes scanned for the pallet
+        :return: list of pallet boxes in the order of boxes
+        """
+        pallet_boxes = {
+            pallet_box.box_id: pallet_box
+            for pallet_box in PalletBox.objects.filter(
+                pallet=pallet,
+                box__in=boxes,
+            )
+        }
+        new_pallet_boxes = [
+            PalletBox(box_number=box.box_number, box=box, pallet=pallet)
+            for box in boxes
+            if box.pk not in pallet_boxes
+        ]
+        if new_pallet_boxes:
+            PalletBox.objects.bulk_create(new_pallet_boxes)
+            pallet_boxes.update({
+                pallet_box.box_id: pallet_box
+                for pallet_box in PalletBox.objects.filter(
+                    pallet=pallet,
+                    box__in=[pb.box for pb in new_pallet_boxes],
+                )
+            })
+        return [pallet_boxes[box.pk] for box in boxes]
+
+    def post(self, request):
+
+        box_numbers = self.get_keyed_in_box_numbers(
+            request.POST.getlist('boxNumbers'),
+        )
+        prefix = request.POST.get('prefix', 'box_forms')
+        pallet_pk = request.POST.get('palletPk')
+        scan_source = ScannerView.get_scan_source(
+            request.POST.get('scanSource'),
+            ','.join(box_numbers),
+        )
+
+        try:
+            if not box_numbers:
+                image_bytes = ScannerView.get_uploaded_image(request)
+                if not image_bytes:
+                    raise ScannerViewError('missing scanFile and boxNumbers')
+                try:
+                    box_numbers = read_box_numbers_from_image(image_bytes)
+                except CodeReaderBusyError as cre:
+                    raise ScannerBusyError(str(cre))
+                except CodeReaderError as cre:
+                    raise ScannerViewError(str(cre))
+        except ScannerBusyError as sbe:
+            return ScannerView.busy_response(str(sbe))
+        except ScannerViewError as sve:
+            error = str(sve)
+            logger.error(error)
+            return HttpResponse("Scan failed.", status=HTTPStatus.NOT_FOUND)
+
+        try:
+            pallet = Pallet.objects.get(pk=pallet_pk)
+        except Pallet.DoesNotExist:
+            error = f"Pallet pk={pallet_pk} not found"
+            logger.error(error)
+            return HttpResponse(error, status=HTTPStatus.NOT_FOUND)
+
+        with transaction.atomic():
+            boxes = [
+                box for box, created in ScannerView.get_boxes(box_numbers)
+            ]
+
+            # If a box is filled, empty it before continuing
+            filled_boxes = [box for box in boxes if box.is_filled()]
+            if filled_boxes:
+                box_management = BoxManagementClass()
+                filled_boxes = box_management.box_consume_batch(filled_boxes)
+                emptied_boxes = {box.pk: box for box in filled_boxes}
+                boxes = [emptied_boxes.get(box.pk, box) for box in boxes]
+
+            pallet_boxes = self.get_pallet_boxes(pallet, boxes)
+
+        for box in boxes:
+            logger.info(
+                f"Box number {box.box_number} scan source: {scan_source}")
+
+        form_ids = self.get_free_form_ids(
+            request.POST.get('formIdsInUse'),
+            len(pallet_boxes),
+        )
+        box_forms = [
+            {
+                'box_number': pallet_box.box_number,
+                'form': BoxItemFormView.get_form(
+                    pallet_box,
+                    f'{prefix}-{form_id}',
+                ),
+            }
+            for pallet_box, form_id in zip(pallet_boxes, form_ids)
+        ]
+
+        return render(
+            request,
+            self.template_name,
+            {'box_forms': box_forms},
+        )
+
+
 class ManualMenuView(PermissionRequiredMixin, TemplateView):
     """
     Menu to choose between manual pallet or manual box management
@@ -1959,70 +2475,566 @@ class ActivityDownloadView(PermissionRequiredMixin, View):
 
     date_format = '%m/%d/%Y'
 
-    class Echo:
-        """An object that implements just the write method of the file-like
-        interface.
+    # (heading, Activity field) of each column
+    columns = (
+        ('Box Number', 'box_number'),
+        ('Box Type', 'box_type'),
+        ('Row', 'loc_row'),
+        ('Bin', 'loc_bin'),
+        ('Tier', 'loc_tier'),
+        ('Product', 'prod_name'),
+        ('Product Category', 'prod_cat_name'),
+        ('Date Filled', 'date_filled'),
+        ('Date Consumed', 'date_consumed'),
+        ('Exp Year', 'exp_year'),
+        ('Exp Month Start', 'exp_month_start'),
+        ('Exp Month End', 'exp_month_end'),
+        ('Quantity', 'quantity'),
+        ('Duration', 'duration'),
+        ('Adjustment Code', 'adjustment_code'),
+    )
+    date_fields = ('date_filled', 'date_consumed')
+
+    timestamp_fields = ('date_changed',)
+
+    # activities read from the database cursor at a time
+    fetch_size = 2000
+
+    # the CSV is sent in pieces of about this many characters
+    chunk_size = 64 * 1024
+
+    def get_queryset(self):
+        """
+        :return: every activity, in the model's order (still in inventory,
+            then the latest consumed first, by box number) - the id only
+            breaks ties so the order is the same from one download to the
+            next
         """
+        return Activity.objects.order_by('-date_consumed', 'box_number', 'id')
 
-        @staticmethod
-        def write(value):
-            """Write the value by returning it, instead of storing in a buffer."""
-            return value
+    def write_rows(self, columns, activities):
 
-    def write_rows(self):
+        yield [heading for heading, field in columns]
 
-        yield [
-            'Box Number', 'Box Type',
-            'Row', 'Bin', 'Tier',
-            'Product', 'Product Category',
-            'Date Filled', 'Date Consumed',
-            'Exp Year', 'Exp Month Start', 'Exp Month End',
-            'Quantity', 'Duration', 'Adjustment Code',
+        date_positions = [
+            position for position, (heading, field) in enumerate(columns)
+            if field in self.date_fields
+        ]
+        timestamp_positions = [
+            position for position, (heading, field) in enumerate(columns)
+            if field in self.timestamp_fields
         ]
 
-        for activity in Activity.objects.all():
-
-            date_filled = activity.date_filled
-            if date_filled:
-                date_filled = date_filled.strftime(self.date_format)
-            else:
-                date_filled = ''
-
-            date_consumed = activity.date_consumed
-            if date_consumed:
-                date_consumed = date_consumed.strftime(self.date_format)
-            else:
-                date_consumed = ''
-
-            row = [
-                activity.box_number,
-                activity.box_type,
-                activity.loc_row,
-                activity.loc_bin,
-                activity.loc_tier,
-                activity.prod_name,
-                activity.prod_cat_name,
-                date_filled,
-                date_consumed,
-                activity.exp_year,
-                activity.exp_month_start,
-                activity.exp_month_end,
-                activity.quantity,
-                activity.duration,
-                activity.adjustment_code,
-            ]
+        # stream from a server side cursor rather than loading every
+        # activity into memory first
+        values_list = activities.values_list(
+            *[field for heading, field in columns]
+        )
+        for values in values_list.iterator(chunk_size=self.fetch_size):
+            row = list(values)
+            for position in date_positions:
+                if row[position]:
+                    row[position] = row[position].strftime(self.date_format)
+                else:
+                    row[position] = ''
+            for position in timestamp_positions:
+                row[position] = row[position].isoformat()
             yield row
 
+    def write_csv(self, rows):
+        """
+        Write rows as CSV, a chunk of chunk_size characters at a time.
+
+        :param rows: lists of values
+        :return: iterator of CSV text
+        """
+        buffer = StringIO()
+        writer = csv_writer(buffer)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= self.chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    # format: (content type, file name extension)
+    formats = {
+        'csv': ('text/csv', 'csv'),
+        'csv.gz': ('application/gzip', 'csv.gz'),
+        'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    }
+
+    # query parameter: Activity filter (inclusive date ranges)
+    date_filters = {
+        'filled_from': 'date_filled__gte',
+        'filled_to': 'date_filled__lte',
+        'consumed_from': 'date_consumed__gte',
+        'consumed_to': 'date_consumed__lte',
+    }
+
     def get(self, request, *args, **kwargs):
-        pseudo_buffer = self.Echo()
-        writer = csv_writer(pseudo_buffer)
+        """
+        Export activities.
+
+        Query parameters (all optional):
+
+            format - csv (the default), csv.gz or parquet
+
+            columns - comma separated Activity fields to export (default
+                all of them)
+
+            filled_from, filled_to, consumed_from, consumed_to - dates
+                (YYYY-MM-DD) limiting the activities exported
+
+            since and limit - see get_incremental
+
+        :param request:
+        :return: the export, streamed
+        """
+        since, limit = None, None
+        try:
+            export_format = self.get_format(request)
+            columns = self.get_columns(request)
+            filters = self.get_filters(request)
+            if 'since' in request.GET:
+                since, limit = self.get_since_and_limit(request)
+        except (ActivityExportError, ValueError) as error:
+            return HttpResponse(str(error), status=HTTPStatus.BAD_REQUEST)
+        if export_format == 'parquet' and not parquet_available():
+            return HttpResponse(
+                "Parquet export needs the pyarrow package",
+                status=HTTPStatus.NOT_IMPLEMENTED,
+            )
+
+        if 'since' in request.GET:
+            return self.get_incremental(
+                export_format, columns, filters, since, limit)
+
+        return self.build_response(
+            export_format,
+            columns,
+            self.get_queryset().filter(**filters),
+            'activities',
+        )
+
+    def get_format(self, request):
+        export_format = request.GET.get('format', '').strip() or 'csv'
+        if export_format not in self.formats:
+            raise ActivityExportError(
+                f'Format "{export_format}" is not one of '
+                f'{", ".join(self.formats)}')
+        return export_format
+
+    def get_columns(self, request):
+        """
+        :param request:
+        :return: the (heading, field) of each column asked for
+        """
+        fields = [
+            field.strip()
+            for field in request.GET.get('columns', '').split(',')
+            if field.strip()
+        ]
+        if not fields:
+            return self.columns
+        columns_by_field = {field: heading for heading, field in self.columns}
+        unknown_fields = [
+            field for field in fields if field not in columns_by_field
+        ]
+        if unknown_fields:
+            raise ActivityExportError(
+                f'Unknown column(s) {", ".join(unknown_fields)}')
+        return tuple((columns_by_field[field], field) for field in fields)
+
+    def get_filters(self, request):
+        """
+        :param request:
+        :return: Activity filters for the date ranges asked for
+        """
+        filters = dict()
+        for parameter, activity_filter in self.date_filters.items():
+            value = request.GET.get(parameter, '').strip()
+            if not value:
+                continue
+            filter_date = parse_date(value)
+            if filter_date is None:
+                raise ActivityExportError(
+                    f'{parameter} of "{value}" is not a YYYY-MM-DD date')
+            filters[activity_filter] = filter_date
+        return filters
+
+    @staticmethod
+    def get_since_and_limit(request):
+        since_param = request.GET.get('since', '').strip()
+        limit_param = request.GET.get('limit', '').strip()
+        since = Watermark.from_token(since_param) if since_param else None
+        limit = int(limit_param) if limit_param else None
+        if limit is not None and limit < 1:
+            raise ValueError(f'limit of {limit} must be at least 1')
+        return since, limit
+
+    def get_content(self, export_format, columns, activities):
+        """
+        Write activities in an export format.
+
+        :param export_format: one of formats
+        :param columns: (heading, field) of each column
+        :param activities: Activity queryset
+        :return: iterator of pieces of the export
+        """
+        if export_format == 'parquet':
+            fields = [field for heading, field in columns]
+            return write_parquet(
+                fields,
+                activities.values_list(*fields).iterator(
+                    chunk_size=self.fetch_size),
+            )
+        content = self.write_csv(self.write_rows(columns, activities))
+        if export_format == 'csv.gz':
+            content = gzip_chunks(content)
+        return content
+
+    def build_response(self, export_format, columns, activities, file_stem):
+        content_type, extension = self.formats[export_format]
         response = StreamingHttpResponse(
-            (writer.writerow(row) for row in self.write_rows()),
-            content_type="text/csv"
+            self.get_content(export_format, columns, activities),
+            content_type=content_type,
         )
-        response['Content-Disposition'] = 'attachment; filename="activities.csv"'
+        response['Content-Disposition'] = \
+            f'attachment; filename="{file_stem}.{extension}"'
         return response
 
+    def get_incremental(self, export_format, columns, filters, since, limit):
+        """
+        Export only the activities changed since the last export.
+
+        Query parameters:
+
+            since - continuation token from the last export, a timestamp,
+                or blank for every activity
+
+            limit - optional most activities to return
+
+        The token to pass as "since" next time is returned in the
+        X-Continuation-Token header.  X-More-Activities is "true" if the
+        limit cut the export short.
+
+        :param export_format: one of formats
+        :param columns: (heading, field) of each column asked for
+        :param filters: Activity filters asked for
+        :param since: watermark from the since parameter (or None)
+        :param limit: from the limit parameter (or None)
+        :return: streamed export of the changed activities
+        """
+        until = get_settle_cutoff()
+        activities = get_changed_activities(since, until).filter(**filters)
+
+        # everything before the cutoff is being exported ...
+        next_watermark = Watermark(until, 0)
+        if since is not None and since > next_watermark:
+            next_watermark = since
+        more_activities = False
+        if limit is not None:
+            last_activity = activities.values_list(
+                'date_changed', 'id')[limit - 1:limit].first()
+            if last_activity is not None:
+                # ... unless the limit stops short of it
+                next_watermark = Watermark(*last_activity)
+                more_activities = True
+            activities = activities[:limit]
+
+        # an incremental export also identifies each activity and when it
+        # changed, so it can replace an earlier copy downstream
+        columns = (
+            (('Activity ID', 'id'),) +
+            tuple(
+                column for column in columns
+                if column[1] not in ('id', 'date_changed')
+            ) +
+            (('Date Changed', 'date_changed'),)
+        )
+        response = self.build_response(
+            export_format,
+            columns,
+            activities,
+            'activities-changed',
+        )
+        response['X-Continuation-Token'] = next_watermark.to_token()
+        response['X-More-Activities'] = str(more_activities).lower()
+        return response
+
+
+class OnHandView(PermissionRequiredMixin, View):
+    """
+    Warehouse board of the boxes on hand by product, location and
+    expiration year, refreshed from OnHandDataView every few seconds.
+    """
+
+    permission_required = (
+        'fpiweb.view_box',
+    )
+
+    template_name = 'fpiweb/on_hand.html'
+
+    # how often (in milliseconds) the board asks for fresh counts
+    refresh_interval = 5000
+
+    filter_names = ('product', 'location', 'category')
+
+    @classmethod
+    def get_filters(cls, request) -> dict:
+        """
+        Read the product, location and category ids to show just one of.
+
+        :param request:
+        :return: ids by filter name (None if not given)
+        """
+        filters = dict()
+        for name in cls.filter_names:
+            value = request.GET.get(name)
+            if not value:
+                filters[name] = None
+                continue
+            try:
+                filters[name] = int(value)
+            except ValueError:
+                raise InvalidValueError(f'{name} "{value}" is not an id')
+        return filters
+
+    @staticmethod
+    def get_data(filters: dict) -> dict:
+        """
+        :param filters: from get_filters
+        :return: the rows on hand and their totals
+        """
+        rows = OnHandSummaryClass.get_summary(
+            product_id=filters['product'],
+            location_id=filters['location'],
+            prod_cat_id=filters['category'],
+        )
+        return {
+            'rows': rows,
+            'box_count': sum(row['box_count'] for row in rows),
+            'quantity': sum(row['quantity'] for row in rows),
+        }
+
+    def get(self, request, *args, **kwargs):
+        try:
+            filters = self.get_filters(request)
+        except InvalidValueError as error:
+            return error_page(request, str(error))
+        return render(
+            request,
+            self.template_name,
+            {
+                'filters': filters,
+                'products': Product.objects.order_by('prod_name'),
+                'locations': Location.objects.order_by('loc_code'),
+                'categories': ProductCategory.objects.order_by(
+                    'prod_cat_name'),
+                'on_hand': self.get_data(filters),
+                'data_url': reverse('fpiweb:on_hand_data'),
+                'refresh_interval': self.refresh_interval,
+            },
+        )
+
+
+class OnHandDataView(PermissionRequiredMixin, View):
+    """
+    JSON of the boxes on hand, polled by on_hand.html.
+    """
+
+    permission_required = (
+        'fpiweb.view_box',
+    )
+
+    def get(self, request, *args, **kwargs):
+        try:
+            filters = OnHandView.get_filters(request)
+        except InvalidValueError as error:
+            return JsonResponse(
+                {'error': str(error)},
+                status=HTTPStatus.BAD_REQUEST,
+            )
+        response = JsonResponse(OnHandView.get_data(filters))
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class ExpiringBoxesView(PermissionRequiredMixin, View):
+    """
+    Page through the boxes expiring soonest, optionally for just one
+    product or location.
+    """
+
+    permission_required = (
+        'fpiweb.view_box',
+    )
+
+    template_name = 'fpiweb/expiring_boxes.html'
+
+    default_days = 90
+    max_days = 3660
+    page_size = 50
+    max_page_size = 500
+
+    @classmethod
+    def get_expiring(cls, request) -> tuple:
+        """
+        Read what boxes to list from the query string.
+
+        :param request:
+        :return: the ExpiringBoxesClass, the cursor of the page asked for
+            (or None) and the page size
+        """
+        params = dict()
+        for name in ('days', 'product', 'location', 'page_size'):
+            value = request.GET.get(name)
+            if not value:
+                continue
+            try:
+                params[name] = int(value)
+            except ValueError:
+                raise InvalidValueError(f'{name} "{value}" is not a number')
+
+        page_size = params.get('page_size', cls.page_size)
+        if not 0 < page_size <= cls.max_page_size:
+            raise InvalidValueError(
+                f'page_size must be from 1 to {cls.max_page_size}')
+        days = params.get('days', cls.default_days)
+        if not 0 <= days <= cls.max_days:
+            raise InvalidValueError(f'days must be from 0 to {cls.max_days}')
+        after = request.GET.get('after')
+        expiring = ExpiringBoxesClass(
+            days=days,
+            include_expired=request.GET.get('expired') == '1',
+            product_id=params.get('product'),
+            location_id=params.get('location'),
+        )
+        return (
+            expiring,
+            ExpiringCursor.from_token(after) if after else None,
+            page_size,
+        )
+
+    def get(self, request, *args, **kwargs):
+        try:
+            expiring, after, page_size = self.get_expiring(request)
+        except InvalidValueError as error:
+            return error_page(request, str(error))
+        boxes, next_cursor = expiring.get_page(after, page_size)
+
+        next_url = ''
+        if next_cursor is not None:
+            query = request.GET.copy()
+            query['after'] = next_cursor.to_token()
+            next_url = f'{request.path}?{query.urlencode()}'
+        return render(
+            request,
+            self.template_name,
+            {
+                'expiring': expiring,
+                'boxes': boxes,
+                'next_url': next_url,
+                'products': Product.objects.order_by('prod_name'),
+                'locations': Location.objects.order_by('loc_code'),
+            },
+        )
+
+
+class ExpiringBoxesDataView(PermissionRequiredMixin, View):
+    """
+    JSON page of the boxes expiring soonest.  Pass the next token returned
+    as "after" to get the following page.
+    """
+
+    permission_required = (
+        'fpiweb.view_box',
+    )
+
+    def get(self, request, *args, **kwargs):
+        try:
+            expiring, after, page_size = \
+                ExpiringBoxesView.get_expiring(request)
+        except InvalidValueError as error:
+            return JsonResponse(
+                {'error': str(error)},
+                status=HTTPStatus.BAD_REQUEST,
+            )
+        boxes, next_cursor = expiring.get_page(after, page_size)
+        return JsonResponse({
+            'boxes': boxes,
+            'next': next_cursor.to_token() if next_cursor else None,
+        })
+
+
+class ShelfDaysView(PermissionRequiredMixin, View):
+    """
+    Average days on the shelf of each product category for each month,
+    read from the activity rollups.
+    """
+
+    permission_required = (
+        'fpiweb.view_activity',
+    )
+
+    template_name = 'fpiweb/shelf_days.html'
+
+    # months shown when no dates are given (including this one)
+    default_months = 12
+
+    @classmethod
+    def get_dates(cls, request) -> tuple:
+        """
+        Read the range of days to report on from the query string.
+
+        :param request:
+        :return: first and last day of consumptions counted
+        """
+        today = timezone.localdate()
+        year = today.year
+        month = today.month - (cls.default_months - 1)
+        while month < 1:
+            month += 12
+            year -= 1
+        dates = {
+            'date_from': date(year, month, 1),
+            'date_to': today,
+        }
+        for name in dates:
+            value = request.GET.get(name, '').strip()
+            if not value:
+                continue
+            try:
+                # None if not laid out as a date, ValueError if no such day
+                dates[name] = parse_date(value)
+            except ValueError:
+                dates[name] = None
+            if dates[name] is None:
+                raise InvalidValueError(
+                    f'{name} of "{value}" is not a YYYY-MM-DD date')
+        if dates['date_from'] > dates['date_to']:
+            raise InvalidValueError('date_from is after date_to')
+        return dates['date_from'], dates['date_to']
+
+    def get(self, request, *args, **kwargs):
+        try:
+            date_from, date_to = self.get_dates(request)
+        except InvalidValueError as error:
+            return error_page(request, str(error))
+        return render(
+            request,
+            self.template_name,
+            {
+                'date_from': date_from,
+                'date_to': date_to,
+                'months': ActivityRollupClass.get_category_shelf_days(
+                    date_from, date_to),
+            },
+        )
+
 
 class ManualBoxStatusView(PermissionRequiredMixin, View):
 